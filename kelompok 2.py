@@ -1,91 +1,2789 @@
 import tkinter as tk
-from tkinter import ttk, messagebox, simpledialog
+from tkinter import ttk, messagebox, simpledialog, filedialog
 import sqlite3
+import csv
+import hashlib
+import os
+import sys
+import time
+import argparse
+import threading
+import queue
+import functools
+from concurrent.futures import Future
+from collections import OrderedDict, deque
 from datetime import datetime
 import re
+import random
+import statistics
+
+# NumPy is only needed by the purchase forecast and takes ~100 ms to import,
+# so it is loaded on first use (see load_numpy) instead of at startup
+np = None
+
+# Lokasi file database
+DB_PATH = 'apotek.db'
+# Interval polling hasil dari worker database (ms)
+DB_POLL_INTERVAL = 30
+# Batas waktu (detik) menunggu lock dari terminal lain sebelum SQLite menyerah
+BUSY_TIMEOUT = 10
+# Berapa kali job (atau satu chunk import) diulang jika database masih terkunci setelah BUSY_TIMEOUT
+LOCK_RETRIES = 5
+
+# Jumlah baris per halaman pada tabel virtual
+PAGE_SIZE = 100
+# Halaman berikutnya dimuat saat scrollbar melewati posisi ini (0.0 - 1.0)
+PREFETCH_THRESHOLD = 0.8
+# Kolom tabel yang bisa diurutkan lewat header: judul kolom -> kolom SQL (ber-index, lihat migrasi 13)
+URUTAN_OBAT = {'Nama Obat': 'o.nama_obat', 'Harga Jual': 'o.harga_jual', 'Stok': 'o.stok', 'Expired': 'o.expired_date'}
+URUTAN_PEMBELIAN = {'Total': 'p.total_harga', 'Tanggal': 'p.hari_pembelian'}
+URUTAN_PENJUALAN = {'Total': 'p.total_harga', 'Tanggal': 'p.hari_penjualan'}
+# Jumlah transaksi terakhir yang ditampilkan di dashboard (default)
+RECENT_TRANSACTIONS_LIMIT = 10
+# Jumlah baris CSV per transaksi saat import katalog obat
+IMPORT_CHUNK_SIZE = 500
+# Jeda ketikan (ms) sebelum pencarian dijalankan
+SEARCH_DEBOUNCE = 250
+# Jumlah pilihan obat yang ditampilkan picker typeahead di form
+TYPEAHEAD_LIMIT = 20
+# Jumlah maksimal obat di cache katalog (LRU)
+CATALOG_CACHE_SIZE = 5000
+# Snapshot stok dibuat jika snapshot terakhir sudah selama ini (hari)
+SNAPSHOT_INTERVAL = 7
+# Jumlah baris per query saat export transaksi (kunci baca dilepas di antara batch)
+EXPORT_BATCH_SIZE = 1000
+# Jumlah obat terlaris yang ditampilkan di laporan penjualan
+LAPORAN_TOP_OBAT = 10
+# Histori penjualan yang dipakai forecast permintaan (hari)
+FORECAST_HISTORY_DAYS = 730
+# Jendela moving average forecast (hari)
+FORECAST_WINDOW = 28
+# Faktor smoothing untuk exponential smoothing
+FORECAST_ALPHA = 0.1
+# Lead time default dari pesan sampai barang datang (hari)
+REORDER_LEAD_TIME = 7
+# Saran pembelian mengisi stok sampai reorder point + permintaan selama ini (hari)
+REORDER_COVER_DAYS = 14
+# Faktor z safety stock (1.65 = service level 95%)
+REORDER_SERVICE_Z = 1.65
+# Query atau build layar selama ini (ms) atau lebih dicatat ke log query lambat
+SLOW_QUERY_MS = 200
+# File log query lambat
+SLOW_QUERY_LOG = 'apotek_slow_query.log'
+# Durasi terakhir per bentuk query yang disimpan untuk persentil (jumlah, total dan maks tetap dihitung semua)
+QUERY_SAMPLE_SIZE = 1000
+# Jumlah tahun kalender (termasuk tahun ini) yang tetap di database utama, batas default form arsip
+ARSIP_SIMPAN_TAHUN = 2
+# Nama file arsip per tahun, di folder yang sama dengan database utama
+ARSIP_FILE = '{nama_db}_arsip_{tahun}.db'
+# Folder backup online, relatif terhadap folder database utama
+BACKUP_DIR = 'backup'
+# Interval backup online terjadwal (menit), 0 = hanya lewat tombol backup
+BACKUP_INTERVAL = 60
+# Jumlah file backup terbaru yang disimpan, yang lebih lama dihapus
+BACKUP_SIMPAN = 7
+# Halaman database yang disalin per langkah backup
+BACKUP_PAGES = 256
+# Jeda (detik) antar langkah backup agar tulisan kasir tidak tertahan
+BACKUP_JEDA = 0.01
+# Jumlah penjualan sintetis per putaran benchmark (--benchmark)
+BENCHMARK_SIZES = (10_000, 100_000, 1_000_000)
+# Berapa kali setiap operasi diulang saat benchmark
+BENCHMARK_REPEAT = 20
+
+# Kolom obat pada form dan file import, sesuai urutan di tabel
+OBAT_FIELDS = ('nama_obat', 'kategori', 'harga_beli', 'harga_jual', 'stok', 'expired_date')
+
+# Statistik dashboard dihitung ulang dari awal (dipakai migrasi 4 dan tombol cek statistik).
+# {pembelian} dan {penjualan} diisi tabel sumbernya, termasuk arsip (lihat sumber_transaksi).
+STATISTIK_BULANAN_SOURCE = '''
+    SELECT 'pembelian' AS jenis, substr(tanggal_pembelian, 1, 7) AS bulan,
+           COUNT(*) AS jumlah_transaksi, SUM(total_harga) AS total_harga
+    FROM {pembelian} GROUP BY bulan
+    UNION ALL
+    SELECT 'penjualan', substr(tanggal_penjualan, 1, 7), COUNT(*), SUM(total_harga)
+    FROM {penjualan} GROUP BY 2
+'''
+
+# Awal periode laporan (nomor hari) untuk tiap baris penjualan p.
+# Day 1 (0001-01-01) is a Monday, so weeks start on Monday like ISO weeks.
+LAPORAN_PERIODE_SQL = {
+    'hari': "p.hari_penjualan",
+    'minggu': "p.hari_penjualan - (p.hari_penjualan - 1) % 7",
+    'bulan': "p.hari_penjualan - CAST(substr(p.tanggal_penjualan, 9, 2) AS INTEGER) + 1",
+}
+
+DASHBOARD_STATS_REBUILD = f'''
+    DELETE FROM dashboard_stats;
+    INSERT INTO dashboard_stats (nama, nilai) VALUES
+        ('total_obat', (SELECT COUNT(*) FROM obat)),
+        ('total_pegawai', (SELECT COUNT(*) FROM pegawai));
+    
+    DELETE FROM statistik_bulanan;
+    INSERT INTO statistik_bulanan (jenis, bulan, jumlah_transaksi, total_harga)
+    {STATISTIK_BULANAN_SOURCE};
+'''
+
+# Migrasi skema database: (versi, script SQL). Versi yang sudah diterapkan
+# disimpan di PRAGMA user_version, jadi tambahkan migrasi baru di akhir list.
+MIGRATIONS = [
+    # 1: Tabel dasar
+    (1, '''
+        -- Tabel Obat
+        CREATE TABLE IF NOT EXISTS obat (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            nama_obat TEXT NOT NULL,
+            kategori TEXT NOT NULL,
+            harga_beli REAL NOT NULL,
+            harga_jual REAL NOT NULL,
+            stok INTEGER NOT NULL,
+            expired_date TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        
+        -- Tabel Pegawai
+        CREATE TABLE IF NOT EXISTS pegawai (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            nama_pegawai TEXT NOT NULL,
+            jabatan TEXT NOT NULL,
+            alamat TEXT NOT NULL,
+            telepon TEXT NOT NULL,
+            gaji REAL NOT NULL,
+            tanggal_masuk TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        
+        -- Tabel Pembelian
+        CREATE TABLE IF NOT EXISTS pembelian (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            id_obat INTEGER NOT NULL,
+            nama_supplier TEXT NOT NULL,
+            jumlah INTEGER NOT NULL,
+            harga_satuan REAL NOT NULL,
+            total_harga REAL NOT NULL,
+            tanggal_pembelian TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (id_obat) REFERENCES obat (id)
+        );
+        
+        -- Tabel Penjualan
+        CREATE TABLE IF NOT EXISTS penjualan (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            id_obat INTEGER NOT NULL,
+            id_pegawai INTEGER NOT NULL,
+            nama_pembeli TEXT NOT NULL,
+            jumlah INTEGER NOT NULL,
+            harga_satuan REAL NOT NULL,
+            total_harga REAL NOT NULL,
+            tanggal_penjualan TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (id_obat) REFERENCES obat (id),
+            FOREIGN KEY (id_pegawai) REFERENCES pegawai (id)
+        );
+    '''),
+    
+    # 2: Index untuk JOIN ke obat/pegawai dan filter tanggal
+    (2, '''
+        CREATE INDEX IF NOT EXISTS idx_pembelian_obat
+            ON pembelian (id_obat, tanggal_pembelian);
+        CREATE INDEX IF NOT EXISTS idx_penjualan_obat
+            ON penjualan (id_obat, tanggal_penjualan);
+        CREATE INDEX IF NOT EXISTS idx_penjualan_pegawai
+            ON penjualan (id_pegawai, tanggal_penjualan);
+        CREATE INDEX IF NOT EXISTS idx_pembelian_tanggal
+            ON pembelian (tanggal_pembelian, total_harga);
+        CREATE INDEX IF NOT EXISTS idx_penjualan_tanggal
+            ON penjualan (tanggal_penjualan, total_harga);
+    '''),
+    
+    # 3: Nomor hari (date.toordinal) di samping tanggal TEXT agar filter tanggal bisa pakai index
+    (3, '''
+        ALTER TABLE pembelian ADD COLUMN hari_pembelian INTEGER;
+        ALTER TABLE penjualan ADD COLUMN hari_penjualan INTEGER;
+        
+        UPDATE pembelian SET hari_pembelian = CAST(julianday(tanggal_pembelian) - 1721424.5 AS INTEGER);
+        UPDATE penjualan SET hari_penjualan = CAST(julianday(tanggal_penjualan) - 1721424.5 AS INTEGER);
+        
+        DROP INDEX IF EXISTS idx_pembelian_obat;
+        DROP INDEX IF EXISTS idx_penjualan_obat;
+        DROP INDEX IF EXISTS idx_penjualan_pegawai;
+        DROP INDEX IF EXISTS idx_pembelian_tanggal;
+        DROP INDEX IF EXISTS idx_penjualan_tanggal;
+        
+        CREATE INDEX idx_pembelian_obat ON pembelian (id_obat, hari_pembelian);
+        CREATE INDEX idx_penjualan_obat ON penjualan (id_obat, hari_penjualan);
+        CREATE INDEX idx_penjualan_pegawai ON penjualan (id_pegawai, hari_penjualan);
+        CREATE INDEX idx_pembelian_hari ON pembelian (hari_pembelian, total_harga);
+        CREATE INDEX idx_penjualan_hari ON penjualan (hari_penjualan, total_harga);
+    '''),
+    
+    # 4: Statistik dashboard yang dijaga trigger (lihat DASHBOARD_STATS_REBUILD)
+    (4, '''
+        CREATE TABLE dashboard_stats (
+            nama TEXT PRIMARY KEY,
+            nilai INTEGER NOT NULL DEFAULT 0
+        );
+        
+        -- Satu baris per jenis transaksi per bulan ('YYYY-MM')
+        CREATE TABLE statistik_bulanan (
+            jenis TEXT NOT NULL,
+            bulan TEXT NOT NULL,
+            jumlah_transaksi INTEGER NOT NULL DEFAULT 0,
+            total_harga REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (jenis, bulan)
+        );
+        
+        CREATE TRIGGER trg_obat_insert_stats AFTER INSERT ON obat BEGIN
+            UPDATE dashboard_stats SET nilai = nilai + 1 WHERE nama = 'total_obat';
+        END;
+        CREATE TRIGGER trg_obat_delete_stats AFTER DELETE ON obat BEGIN
+            UPDATE dashboard_stats SET nilai = nilai - 1 WHERE nama = 'total_obat';
+        END;
+        
+        CREATE TRIGGER trg_pegawai_insert_stats AFTER INSERT ON pegawai BEGIN
+            UPDATE dashboard_stats SET nilai = nilai + 1 WHERE nama = 'total_pegawai';
+        END;
+        CREATE TRIGGER trg_pegawai_delete_stats AFTER DELETE ON pegawai BEGIN
+            UPDATE dashboard_stats SET nilai = nilai - 1 WHERE nama = 'total_pegawai';
+        END;
+        
+        CREATE TRIGGER trg_pembelian_insert_stats AFTER INSERT ON pembelian BEGIN
+            INSERT INTO statistik_bulanan (jenis, bulan, jumlah_transaksi, total_harga)
+            VALUES ('pembelian', substr(NEW.tanggal_pembelian, 1, 7), 1, NEW.total_harga)
+            ON CONFLICT (jenis, bulan) DO UPDATE SET
+                jumlah_transaksi = jumlah_transaksi + 1,
+                total_harga = total_harga + excluded.total_harga;
+        END;
+        CREATE TRIGGER trg_pembelian_delete_stats AFTER DELETE ON pembelian BEGIN
+            UPDATE statistik_bulanan
+            SET jumlah_transaksi = jumlah_transaksi - 1, total_harga = total_harga - OLD.total_harga
+            WHERE jenis = 'pembelian' AND bulan = substr(OLD.tanggal_pembelian, 1, 7);
+        END;
+        CREATE TRIGGER trg_pembelian_update_stats
+        AFTER UPDATE OF tanggal_pembelian, total_harga ON pembelian BEGIN
+            UPDATE statistik_bulanan
+            SET jumlah_transaksi = jumlah_transaksi - 1, total_harga = total_harga - OLD.total_harga
+            WHERE jenis = 'pembelian' AND bulan = substr(OLD.tanggal_pembelian, 1, 7);
+            INSERT INTO statistik_bulanan (jenis, bulan, jumlah_transaksi, total_harga)
+            VALUES ('pembelian', substr(NEW.tanggal_pembelian, 1, 7), 1, NEW.total_harga)
+            ON CONFLICT (jenis, bulan) DO UPDATE SET
+                jumlah_transaksi = jumlah_transaksi + 1,
+                total_harga = total_harga + excluded.total_harga;
+        END;
+        
+        CREATE TRIGGER trg_penjualan_insert_stats AFTER INSERT ON penjualan BEGIN
+            INSERT INTO statistik_bulanan (jenis, bulan, jumlah_transaksi, total_harga)
+            VALUES ('penjualan', substr(NEW.tanggal_penjualan, 1, 7), 1, NEW.total_harga)
+            ON CONFLICT (jenis, bulan) DO UPDATE SET
+                jumlah_transaksi = jumlah_transaksi + 1,
+                total_harga = total_harga + excluded.total_harga;
+        END;
+        CREATE TRIGGER trg_penjualan_delete_stats AFTER DELETE ON penjualan BEGIN
+            UPDATE statistik_bulanan
+            SET jumlah_transaksi = jumlah_transaksi - 1, total_harga = total_harga - OLD.total_harga
+            WHERE jenis = 'penjualan' AND bulan = substr(OLD.tanggal_penjualan, 1, 7);
+        END;
+        CREATE TRIGGER trg_penjualan_update_stats
+        AFTER UPDATE OF tanggal_penjualan, total_harga ON penjualan BEGIN
+            UPDATE statistik_bulanan
+            SET jumlah_transaksi = jumlah_transaksi - 1, total_harga = total_harga - OLD.total_harga
+            WHERE jenis = 'penjualan' AND bulan = substr(OLD.tanggal_penjualan, 1, 7);
+            INSERT INTO statistik_bulanan (jenis, bulan, jumlah_transaksi, total_harga)
+            VALUES ('penjualan', substr(NEW.tanggal_penjualan, 1, 7), 1, NEW.total_harga)
+            ON CONFLICT (jenis, bulan) DO UPDATE SET
+                jumlah_transaksi = jumlah_transaksi + 1,
+                total_harga = total_harga + excluded.total_harga;
+        END;
+    ''' + DASHBOARD_STATS_REBUILD.format(pembelian='pembelian', penjualan='penjualan')),
+    
+    # 5: Index created_at untuk feed transaksi terakhir
+    (5, '''
+        CREATE INDEX idx_pembelian_created ON pembelian (created_at);
+        CREATE INDEX idx_penjualan_created ON penjualan (created_at);
+    '''),
+    
+    # 6: Index nama obat untuk upsert saat import katalog
+    (6, '''
+        CREATE INDEX idx_obat_nama ON obat (nama_obat);
+    '''),
+    
+    # 7: Index full-text (FTS5) nama dan kategori obat untuk pencarian
+    (7, '''
+        CREATE VIRTUAL TABLE obat_fts USING fts5 (
+            nama_obat, kategori,
+            content='obat', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+        );
+        
+        -- Name matches rank above category matches
+        INSERT INTO obat_fts (obat_fts, rank) VALUES ('rank', 'bm25(10.0, 1.0)');
+        INSERT INTO obat_fts (obat_fts) VALUES ('rebuild');
+        
+        CREATE TRIGGER trg_obat_insert_fts AFTER INSERT ON obat BEGIN
+            INSERT INTO obat_fts (rowid, nama_obat, kategori)
+            VALUES (NEW.id, NEW.nama_obat, NEW.kategori);
+        END;
+        CREATE TRIGGER trg_obat_delete_fts AFTER DELETE ON obat BEGIN
+            INSERT INTO obat_fts (obat_fts, rowid, nama_obat, kategori)
+            VALUES ('delete', OLD.id, OLD.nama_obat, OLD.kategori);
+        END;
+        CREATE TRIGGER trg_obat_update_fts AFTER UPDATE OF nama_obat, kategori ON obat BEGIN
+            INSERT INTO obat_fts (obat_fts, rowid, nama_obat, kategori)
+            VALUES ('delete', OLD.id, OLD.nama_obat, OLD.kategori);
+            INSERT INTO obat_fts (rowid, nama_obat, kategori)
+            VALUES (NEW.id, NEW.nama_obat, NEW.kategori);
+        END;
+    '''),
+    
+    # 8: Index nama obat tanpa beda huruf besar/kecil untuk picker typeahead (LIKE 'prefix%')
+    (8, '''
+        CREATE INDEX idx_obat_nama_nocase ON obat (nama_obat COLLATE NOCASE);
+    '''),
+    
+    # 9: Buku mutasi stok (append-only) dan snapshot stok berkala
+    (9, '''
+        -- Satu baris per perubahan stok; SUM(perubahan) per obat = obat.stok
+        CREATE TABLE mutasi_stok (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            id_obat INTEGER NOT NULL,
+            hari INTEGER NOT NULL,
+            perubahan INTEGER NOT NULL,
+            sumber TEXT NOT NULL,
+            id_sumber INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (id_obat) REFERENCES obat (id)
+        );
+        CREATE INDEX idx_mutasi_hari ON mutasi_stok (hari, id_obat, perubahan);
+        CREATE INDEX idx_mutasi_obat ON mutasi_stok (id_obat, hari);
+        
+        -- Stok tiap obat pada akhir hari snapshot
+        CREATE TABLE snapshot_stok (
+            id_obat INTEGER NOT NULL,
+            hari INTEGER NOT NULL,
+            stok INTEGER NOT NULL,
+            PRIMARY KEY (id_obat, hari)
+        ) WITHOUT ROWID;
+        CREATE INDEX idx_snapshot_hari ON snapshot_stok (hari);
+        
+        -- Backfill from the existing transactions
+        INSERT INTO mutasi_stok (id_obat, hari, perubahan, sumber, id_sumber)
+        SELECT id_obat, hari_pembelian, jumlah, 'pembelian', id FROM pembelian;
+        INSERT INTO mutasi_stok (id_obat, hari, perubahan, sumber, id_sumber)
+        SELECT id_obat, hari_penjualan, -jumlah, 'penjualan', id FROM penjualan;
+        
+        -- Opening balance so the ledger sums to the current stock
+        INSERT INTO mutasi_stok (id_obat, hari, perubahan, sumber, id_sumber)
+        SELECT id, hari, saldo, 'saldo_awal', id FROM (
+            SELECT o.id,
+                   MIN(CAST(julianday(o.created_at) - 1721424.5 AS INTEGER),
+                       COALESCE(MIN(m.hari), CAST(julianday(o.created_at) - 1721424.5 AS INTEGER))) AS hari,
+                   o.stok - COALESCE(SUM(m.perubahan), 0) AS saldo
+            FROM obat o
+            LEFT JOIN mutasi_stok m ON m.id_obat = o.id
+            GROUP BY o.id
+        )
+        WHERE saldo != 0;
+    '''),
+    
+    # 10: Stok per lot (batch) dengan tanggal expired sendiri, alokasi FEFO
+    (10, '''
+        -- SUM(sisa) per obat = obat.stok
+        CREATE TABLE lot_obat (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            id_obat INTEGER NOT NULL,
+            id_pembelian INTEGER,
+            expired_date TEXT NOT NULL,
+            hari_expired INTEGER NOT NULL,
+            jumlah_awal INTEGER NOT NULL,
+            sisa INTEGER NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (id_obat) REFERENCES obat (id),
+            FOREIGN KEY (id_pembelian) REFERENCES pembelian (id)
+        );
+        -- Only lots still on the shelf are indexed: FEFO per obat and the daily expiry sweep
+        CREATE INDEX idx_lot_fefo ON lot_obat (id_obat, hari_expired) WHERE sisa > 0;
+        CREATE INDEX idx_lot_expired ON lot_obat (hari_expired) WHERE sisa > 0;
+        CREATE INDEX idx_lot_pembelian ON lot_obat (id_pembelian) WHERE id_pembelian IS NOT NULL;
+        
+        -- Lots a sale was taken from, so an edit or delete returns stock to the same lots
+        CREATE TABLE alokasi_lot (
+            id_penjualan INTEGER NOT NULL,
+            id_lot INTEGER NOT NULL,
+            jumlah INTEGER NOT NULL,
+            PRIMARY KEY (id_penjualan, id_lot),
+            FOREIGN KEY (id_penjualan) REFERENCES penjualan (id),
+            FOREIGN KEY (id_lot) REFERENCES lot_obat (id)
+        ) WITHOUT ROWID;
+        
+        -- Current stock becomes one lot per obat with the catalog expiry
+        -- (an unreadable date becomes day 0 so the sweep reports it as expired)
+        INSERT INTO lot_obat (id_obat, expired_date, hari_expired, jumlah_awal, sisa)
+        SELECT id, expired_date, COALESCE(CAST(julianday(expired_date) - 1721424.5 AS INTEGER), 0), stok, stok
+        FROM obat WHERE stok > 0;
+    '''),
+    
+    # 11: Cache laporan penjualan per periode
+    (11, '''
+        -- Aggregates per period and dimension ('total', 'obat', 'pegawai'; id_dimensi 0 for total)
+        CREATE TABLE laporan_penjualan (
+            granularitas TEXT NOT NULL,
+            hari_mulai INTEGER NOT NULL,
+            dimensi TEXT NOT NULL,
+            id_dimensi INTEGER NOT NULL,
+            jumlah_transaksi INTEGER NOT NULL,
+            jumlah_terjual INTEGER NOT NULL,
+            pendapatan REAL NOT NULL,
+            modal REAL NOT NULL,
+            PRIMARY KEY (granularitas, hari_mulai, dimensi, id_dimensi)
+        ) WITHOUT ROWID;
+        
+        -- Closed periods whose rows above are final
+        CREATE TABLE laporan_periode (
+            hari_mulai INTEGER NOT NULL,
+            granularitas TEXT NOT NULL,
+            hari_akhir INTEGER NOT NULL,
+            PRIMARY KEY (hari_mulai, granularitas)
+        ) WITHOUT ROWID;
+        
+        -- A backdated sale reopens the periods it falls in (a month is at most 31 days)
+        CREATE TRIGGER trg_penjualan_insert_laporan AFTER INSERT ON penjualan BEGIN
+            DELETE FROM laporan_periode
+            WHERE hari_mulai BETWEEN NEW.hari_penjualan - 31 AND NEW.hari_penjualan
+              AND hari_akhir > NEW.hari_penjualan;
+        END;
+        
+        CREATE TRIGGER trg_penjualan_delete_laporan AFTER DELETE ON penjualan BEGIN
+            DELETE FROM laporan_periode
+            WHERE hari_mulai BETWEEN OLD.hari_penjualan - 31 AND OLD.hari_penjualan
+              AND hari_akhir > OLD.hari_penjualan;
+        END;
+        
+        CREATE TRIGGER trg_penjualan_update_laporan AFTER UPDATE ON penjualan BEGIN
+            DELETE FROM laporan_periode
+            WHERE (hari_mulai BETWEEN OLD.hari_penjualan - 31 AND OLD.hari_penjualan
+                   AND hari_akhir > OLD.hari_penjualan)
+               OR (hari_mulai BETWEEN NEW.hari_penjualan - 31 AND NEW.hari_penjualan
+                   AND hari_akhir > NEW.hari_penjualan);
+        END;
+    '''),
+    
+    # 12: Jumlah terjual per obat per hari untuk forecast permintaan
+    (12, '''
+        CREATE TABLE penjualan_harian (
+            id_obat INTEGER NOT NULL,
+            hari INTEGER NOT NULL,
+            jumlah INTEGER NOT NULL,
+            PRIMARY KEY (id_obat, hari)
+        ) WITHOUT ROWID;
+        
+        INSERT INTO penjualan_harian (id_obat, hari, jumlah)
+        SELECT id_obat, hari_penjualan, SUM(jumlah) FROM penjualan GROUP BY id_obat, hari_penjualan;
+        
+        CREATE TRIGGER trg_penjualan_insert_harian AFTER INSERT ON penjualan BEGIN
+            INSERT INTO penjualan_harian (id_obat, hari, jumlah)
+            VALUES (NEW.id_obat, NEW.hari_penjualan, NEW.jumlah)
+            ON CONFLICT (id_obat, hari) DO UPDATE SET jumlah = jumlah + excluded.jumlah;
+        END;
+        
+        CREATE TRIGGER trg_penjualan_delete_harian AFTER DELETE ON penjualan BEGIN
+            UPDATE penjualan_harian SET jumlah = jumlah - OLD.jumlah
+            WHERE id_obat = OLD.id_obat AND hari = OLD.hari_penjualan;
+        END;
+        
+        CREATE TRIGGER trg_penjualan_update_harian AFTER UPDATE OF id_obat, jumlah, hari_penjualan ON penjualan BEGIN
+            UPDATE penjualan_harian SET jumlah = jumlah - OLD.jumlah
+            WHERE id_obat = OLD.id_obat AND hari = OLD.hari_penjualan;
+            INSERT INTO penjualan_harian (id_obat, hari, jumlah)
+            VALUES (NEW.id_obat, NEW.hari_penjualan, NEW.jumlah)
+            ON CONFLICT (id_obat, hari) DO UPDATE SET jumlah = jumlah + excluded.jumlah;
+        END;
+    '''),
+    
+    # 13: Index untuk urutan kolom tabel; entri index urut (kolom, rowid) = keyset (kolom, id)
+    (13, '''
+        CREATE INDEX idx_obat_harga_jual ON obat (harga_jual);
+        CREATE INDEX idx_obat_stok ON obat (stok);
+        CREATE INDEX idx_obat_expired ON obat (expired_date);
+        CREATE INDEX idx_pembelian_total ON pembelian (total_harga);
+        CREATE INDEX idx_pembelian_urut_hari ON pembelian (hari_pembelian);
+        CREATE INDEX idx_penjualan_total ON penjualan (total_harga);
+        CREATE INDEX idx_penjualan_urut_hari ON penjualan (hari_penjualan);
+    '''),
+    
+    # 14: Arsip transaksi per tahun di file terpisah (lihat ApotekRepository.arsipkan)
+    (14, '''
+        -- One archive file per year; rows before hari_akhir have been moved there
+        CREATE TABLE arsip_periode (
+            tahun INTEGER PRIMARY KEY,
+            file TEXT NOT NULL,
+            hari_akhir INTEGER NOT NULL,
+            jumlah_penjualan INTEGER NOT NULL,
+            jumlah_pembelian INTEGER NOT NULL,
+            jumlah_alokasi INTEGER NOT NULL,
+            checksum TEXT NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        
+        -- Holds a row only inside the archiving transaction, so moved rows keep their aggregates
+        CREATE TABLE arsip_berjalan (aktif INTEGER NOT NULL);
+        
+        DROP TRIGGER trg_pembelian_delete_stats;
+        CREATE TRIGGER trg_pembelian_delete_stats AFTER DELETE ON pembelian
+        WHEN NOT EXISTS (SELECT 1 FROM arsip_berjalan) BEGIN
+            UPDATE statistik_bulanan
+            SET jumlah_transaksi = jumlah_transaksi - 1, total_harga = total_harga - OLD.total_harga
+            WHERE jenis = 'pembelian' AND bulan = substr(OLD.tanggal_pembelian, 1, 7);
+        END;
+        
+        DROP TRIGGER trg_penjualan_delete_stats;
+        CREATE TRIGGER trg_penjualan_delete_stats AFTER DELETE ON penjualan
+        WHEN NOT EXISTS (SELECT 1 FROM arsip_berjalan) BEGIN
+            UPDATE statistik_bulanan
+            SET jumlah_transaksi = jumlah_transaksi - 1, total_harga = total_harga - OLD.total_harga
+            WHERE jenis = 'penjualan' AND bulan = substr(OLD.tanggal_penjualan, 1, 7);
+        END;
+        
+        DROP TRIGGER trg_penjualan_delete_laporan;
+        CREATE TRIGGER trg_penjualan_delete_laporan AFTER DELETE ON penjualan
+        WHEN NOT EXISTS (SELECT 1 FROM arsip_berjalan) BEGIN
+            DELETE FROM laporan_periode
+            WHERE hari_mulai BETWEEN OLD.hari_penjualan - 31 AND OLD.hari_penjualan
+              AND hari_akhir > OLD.hari_penjualan;
+        END;
+        
+        DROP TRIGGER trg_penjualan_delete_harian;
+        CREATE TRIGGER trg_penjualan_delete_harian AFTER DELETE ON penjualan
+        WHEN NOT EXISTS (SELECT 1 FROM arsip_berjalan) BEGIN
+            UPDATE penjualan_harian SET jumlah = jumlah - OLD.jumlah
+            WHERE id_obat = OLD.id_obat AND hari = OLD.hari_penjualan;
+        END;
+        
+        -- Archived periods are closed for new and edited transactions
+        CREATE TRIGGER trg_pembelian_insert_arsip BEFORE INSERT ON pembelian
+        WHEN NEW.hari_pembelian < (SELECT MAX(hari_akhir) FROM arsip_periode) BEGIN
+            SELECT RAISE(ABORT, 'Periode tanggal ini sudah diarsipkan');
+        END;
+        CREATE TRIGGER trg_pembelian_update_arsip BEFORE UPDATE OF hari_pembelian ON pembelian
+        WHEN NEW.hari_pembelian < (SELECT MAX(hari_akhir) FROM arsip_periode) BEGIN
+            SELECT RAISE(ABORT, 'Periode tanggal ini sudah diarsipkan');
+        END;
+        CREATE TRIGGER trg_penjualan_insert_arsip BEFORE INSERT ON penjualan
+        WHEN NEW.hari_penjualan < (SELECT MAX(hari_akhir) FROM arsip_periode) BEGIN
+            SELECT RAISE(ABORT, 'Periode tanggal ini sudah diarsipkan');
+        END;
+        CREATE TRIGGER trg_penjualan_update_arsip BEFORE UPDATE OF hari_penjualan ON penjualan
+        WHEN NEW.hari_penjualan < (SELECT MAX(hari_akhir) FROM arsip_periode) BEGIN
+            SELECT RAISE(ABORT, 'Periode tanggal ini sudah diarsipkan');
+        END;
+    '''),
+]
+
+def parse_obat(values):
+    """Validasi data obat (aturan yang sama dengan form) dan ubah ke tipe kolom"""
+    values = {field: str(values.get(field) or '').strip() for field in OBAT_FIELDS}
+    if not all(values.values()):
+        raise ValueError("Semua field harus diisi!")
+        
+    try:
+        harga_beli = float(values['harga_beli'])
+        harga_jual = float(values['harga_jual'])
+    except ValueError:
+        raise ValueError("Harga harus berupa angka")
+        
+    try:
+        stok = int(values['stok'])
+    except ValueError:
+        raise ValueError("Stok harus berupa angka")
+        
+    try:
+        datetime.strptime(values['expired_date'], '%Y-%m-%d')
+    except ValueError:
+        raise ValueError("Tanggal format: YYYY-MM-DD")
+        
+    return (values['nama_obat'], values['kategori'], harga_beli,
+            harga_jual, stok, values['expired_date'])
+
+def date_key(tanggal):
+    """Ubah tanggal 'YYYY-MM-DD' menjadi nomor hari (integer) untuk kolom hari_*"""
+    return datetime.strptime(tanggal, '%Y-%m-%d').toordinal()
+
+def fts_query(teks, column=None):
+    """Ubah teks pencarian menjadi query FTS5 prefix ("para"* "500"*), None jika kosong"""
+    # Quoting each word keeps FTS5 operators and punctuation out of the query
+    terms = ' '.join(f'"{word}"*' for word in re.findall(r'\w+', teks))
+    if not terms:
+        return None
+    return f"{column} : ({terms})" if column else terms
+
+def keyset_urut(urutan, filters, last_row, id_kolom):
+    """Kondisi keyset, parameter, kolom urut tambahan dan ORDER BY untuk satu halaman tabel"""
+    # filters['urut'] = (column title, descending) picks a column from urutan, otherwise newest id first.
+    # The sort value is appended to each row; the next page continues from the last row's (value, id)
+    if 'urut' not in filters:
+        if not last_row:
+            return [], [], "", f"{id_kolom} DESC"
+        return [f"{id_kolom} < ?"], [last_row[0]], "", f"{id_kolom} DESC"
+        
+    judul, menurun = filters['urut']
+    kolom = urutan[judul]
+    arah, banding = ('DESC', '<') if menurun else ('ASC', '>')
+    conditions, params = [], []
+    if last_row:
+        # A row value comparison is one range scan on the (kolom, rowid) index
+        conditions.append(f"({kolom}, {id_kolom}) {banding} (?, ?)")
+        params.extend([last_row[-1], last_row[0]])
+    return conditions, params, f", {kolom}", f"{kolom} {arah}, {id_kolom} {arah}"
+
+def periode_laporan(granularitas, hari):
+    """Periode laporan ('hari', 'minggu', 'bulan') yang memuat hari: (hari_mulai, hari_akhir), akhir eksklusif"""
+    if granularitas == 'hari':
+        return hari, hari + 1
+    if granularitas == 'minggu':
+        mulai = hari - (hari - 1) % 7
+        return mulai, mulai + 7
+        
+    tanggal = datetime.fromordinal(hari)
+    akhir = datetime(tanggal.year + tanggal.month // 12, tanggal.month % 12 + 1, 1)
+    return hari - tanggal.day + 1, akhir.toordinal()
+    
+def label_periode(granularitas, hari_mulai):
+    """Nama periode laporan: '2024-05-17', '2024-W20' atau '2024-05'"""
+    tanggal = datetime.fromordinal(hari_mulai)
+    if granularitas == 'minggu':
+        tahun, minggu, _ = tanggal.isocalendar()
+        return f"{tahun}-W{minggu:02d}"
+    return tanggal.strftime('%Y-%m' if granularitas == 'bulan' else '%Y-%m-%d')
+    
+def hitung_reorder(posisi, hari, jumlah, stok, metode='ses', lead_time=REORDER_LEAD_TIME,
+                   n_hari=FORECAST_HISTORY_DAYS):
+    """Permintaan harian, safety stock, reorder point dan jumlah pesan semua obat sekaligus (array NumPy)"""
+    # posisi, hari, jumlah: sales per (obat index, day index 0..n_hari-1); stok: one entry per obat
+    n_obat = len(stok)
+    rata_rata = np.bincount(posisi, weights=jumlah, minlength=n_obat) / n_hari
+    
+    # Days without sales count as zero demand in the spread
+    kuadrat = np.bincount(posisi, weights=jumlah ** 2, minlength=n_obat) / n_hari
+    std = np.sqrt(np.maximum(kuadrat - rata_rata ** 2, 0))
+    
+    if metode == 'ma':
+        baru = hari >= n_hari - FORECAST_WINDOW
+        permintaan = np.bincount(posisi[baru], weights=jumlah[baru], minlength=n_obat) / FORECAST_WINDOW
+    else:
+        # The smoothed level after the last day is a weighted sum of every day's sales
+        bobot = FORECAST_ALPHA * (1 - FORECAST_ALPHA) ** (n_hari - 1 - hari)
+        permintaan = np.bincount(posisi, weights=jumlah * bobot, minlength=n_obat)
+        
+    safety_stock = REORDER_SERVICE_Z * std * np.sqrt(lead_time)
+    reorder_point = permintaan * lead_time + safety_stock
+    target = reorder_point + permintaan * REORDER_COVER_DAYS
+    pesan = np.where(stok <= reorder_point, np.ceil(np.maximum(target - stok, 0)), 0)
+    return permintaan, safety_stock, reorder_point, pesan
+    
+def query_shape(sql):
+    """Bentuk query untuk statistik: spasi dirapikan, daftar parameter (?, ?, ...) disatukan"""
+    return re.sub(r'\?(?:, \?)+', '?, ...', ' '.join(sql.split()))
+    
+def persentil(values, p):
+    """Persentil p (nearest-rank) dari list yang sudah diurutkan"""
+    return values[max(-(-len(values) * p // 100) - 1, 0)]
+    
+def ulangi_jika_terkunci(conn, func, *args, retries=LOCK_RETRIES):
+    """Jalankan func(*args), rollback dan ulangi dengan backoff selama database dikunci terminal lain"""
+    for attempt in range(retries + 1):
+        try:
+            return func(*args)
+        except Exception as e:
+            conn.rollback()
+            
+            locked = isinstance(e, sqlite3.OperationalError) and (
+                'locked' in str(e) or 'busy' in str(e))
+            if not locked or attempt == retries:
+                raise
+                
+            time.sleep(0.05 * 2 ** attempt)
+            
+def commit_bertahap(func):
+    """Tandai job yang commit per bagian, sehingga tidak diulang utuh oleh DatabaseWorker"""
+    func.commit_bertahap = True
+    return func
+    
+def timed_screen(func):
+    """Catat lama build layar show_* ke statistik query repo"""
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(self, *args, **kwargs)
+        finally:
+            self.repo.stats.record(f"[layar] {func.__name__}", (time.perf_counter() - start) * 1000)
+    return wrapper
+
+
+class StokTidakCukupError(Exception):
+    """Jumlah penjualan melebihi stok obat yang tersedia"""
+    
+    def __init__(self, stok):
+        super().__init__(f"Stok tidak mencukupi! Stok tersedia: {stok}")
+        self.stok = stok
+
+class KeranjangStokError(Exception):
+    """Satu atau lebih item keranjang melebihi stok, seluruh keranjang ditolak"""
+    
+    def __init__(self, kurang):
+        detail = "\n".join(f"{nama}: diminta {diminta}, stok {stok}" for nama, diminta, stok in kurang)
+        super().__init__(f"Stok tidak mencukupi, keranjang dibatalkan!\n{detail}")
+        self.kurang = kurang
+
+class ObatPunyaRiwayatError(Exception):
+    """Obat yang sudah punya transaksi pembelian/penjualan tidak boleh dihapus"""
+    
+    def __init__(self):
+        super().__init__("Obat sudah punya riwayat pembelian/penjualan dan tidak bisa dihapus!")
+
+class BackupDibatalkanError(Exception):
+    """Backup dihentikan sebelum selesai karena aplikasi ditutup"""
+    
+    def __init__(self):
+        super().__init__("Backup dibatalkan")
+
+class CatalogCache:
+    """Cache LRU data obat per id: (id, nama_obat, harga_jual, stok, expired_date), aman lintas thread"""
+    
+    def __init__(self, max_size=CATALOG_CACHE_SIZE):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.data_version = None
+        # Filled by the database workers, read by the Tk thread
+        self.lock = threading.Lock()
+        
+    def get(self, obat_id):
+        """Ambil data obat dari cache, None jika belum ada"""
+        with self.lock:
+            row = self.entries.get(obat_id)
+            if row is not None:
+                self.entries.move_to_end(obat_id)
+            return row
+            
+    def put(self, rows):
+        """Simpan/timpa data obat, buang yang paling lama tidak dipakai jika penuh"""
+        with self.lock:
+            for row in rows:
+                self.entries[row[0]] = row
+                self.entries.move_to_end(row[0])
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                
+    def invalidate(self, *obat_ids):
+        """Hapus obat tertentu dari cache, atau semuanya jika tanpa argumen"""
+        with self.lock:
+            if not obat_ids:
+                self.entries.clear()
+            for obat_id in obat_ids:
+                self.entries.pop(obat_id, None)
+                
+    def sync(self, data_version):
+        """Kosongkan cache jika data_version berubah (terminal lain sudah commit)"""
+        with self.lock:
+            if data_version != self.data_version:
+                self.entries.clear()
+                self.data_version = data_version
+
+def load_numpy():
+    """Import NumPy saat pertama dibutuhkan, False jika tidak terpasang"""
+    global np
+    if np is None:
+        try:
+            import numpy
+        except ImportError:
+            return False
+        np = numpy
+    return True
+
+class StartupProfile:
+    """Catat durasi tiap tahap startup, dicetak dengan --startup-profile"""
+    
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.last = self.start
+        self.marks = []
+        
+    def mark(self, tahap, ms=None):
+        """Tutup tahap di UI thread (durasi sejak mark sebelumnya) atau catat job worker berdurasi ms"""
+        now = time.perf_counter()
+        if ms is None:
+            ms = (now - self.last) * 1000
+            self.last = now
+        self.marks.append((tahap, ms, (now - self.start) * 1000))
+        
+    def timed(self, tahap, func):
+        """Bungkus job worker func(cursor, ...) agar durasinya ikut dicatat"""
+        @functools.wraps(func)
+        def wrapper(*args):
+            start = time.perf_counter()
+            try:
+                return func(*args)
+            finally:
+                self.mark(tahap, (time.perf_counter() - start) * 1000)
+        return wrapper
+        
+    def report(self):
+        """Cetak rincian startup ke stdout"""
+        print(f"{'tahap startup':<32} {'durasi ms':>10} {'selesai ms':>10}")
+        for tahap, ms, selesai in self.marks:
+            print(f"{tahap:<32} {ms:>10.1f} {selesai:>10.1f}")
+
+class QueryStats:
+    """Durasi dan jumlah baris per bentuk query (dan build layar) sejak aplikasi dibuka"""
+    
+    def __init__(self, slow_query_ms=SLOW_QUERY_MS, log_path=SLOW_QUERY_LOG):
+        self.slow_query_ms = slow_query_ms
+        self.log_path = log_path
+        # Recent durations per shape for the percentiles, bounded so a long session stays flat
+        self.durations = {}
+        # Running [jumlah, total ms, maks ms, baris] per shape over the whole session
+        self.totals = {}
+        self.lock = threading.Lock()
+        
+    def record(self, shape, ms, rows=0):
+        """Simpan satu pengukuran; yang melewati batas ditulis ke log query lambat"""
+        with self.lock:
+            if shape not in self.durations:
+                self.durations[shape] = deque(maxlen=QUERY_SAMPLE_SIZE)
+                self.totals[shape] = [0, 0.0, 0.0, 0]
+            self.durations[shape].append(ms)
+            total = self.totals[shape]
+            total[0] += 1
+            total[1] += ms
+            total[2] = max(total[2], ms)
+            total[3] += rows
+            
+            if self.slow_query_ms and ms >= self.slow_query_ms:
+                with open(self.log_path, 'a', encoding='utf-8') as f:
+                    f.write(f"{datetime.now():%Y-%m-%d %H:%M:%S}\t{ms:.1f} ms\t{rows} baris\t{shape}\n")
+                    
+    def summary(self):
+        """(bentuk, jumlah, p50, p95, p99, maks, rata-rata baris) per bentuk, total waktu terbesar dulu"""
+        # Percentiles cover the last QUERY_SAMPLE_SIZE samples, the other columns the whole session
+        with self.lock:
+            items = [(shape, sorted(durations), list(self.totals[shape]))
+                     for shape, durations in self.durations.items()]
+            
+        items.sort(key=lambda item: item[2][1], reverse=True)
+        return [(shape, jumlah, persentil(durations, 50), persentil(durations, 95),
+                 persentil(durations, 99), maks, rows / jumlah)
+                for shape, durations, (jumlah, _, maks, rows) in items]
+        
+class TimedCursor(sqlite3.Cursor):
+    """Cursor yang mencatat durasi (execute + fetch) dan jumlah baris tiap query ke stats koneksinya"""
+    
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.kueri = None
+        
+    def execute(self, sql, parameters=()):
+        self.selesai()
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self.kueri = [sql, (time.perf_counter() - start) * 1000, 0]
+            # Statements without a result set are done once executed
+            if self.description is None:
+                self.kueri[2] = max(self.rowcount, 0)
+                self.selesai()
+                
+    def executemany(self, sql, seq_of_parameters):
+        self.selesai()
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self.kueri = [sql, (time.perf_counter() - start) * 1000, max(self.rowcount, 0)]
+            self.selesai()
+            
+    def executescript(self, sql_script):
+        self.selesai()
+        start = time.perf_counter()
+        try:
+            return super().executescript(sql_script)
+        finally:
+            self.kueri = [sql_script, (time.perf_counter() - start) * 1000, 0]
+            self.selesai()
+            
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        self.catat_fetch(start, 0 if row is None else 1)
+        return row
+        
+    def fetchmany(self, size=None):
+        start = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self.catat_fetch(start, len(rows))
+        return rows
+        
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super().fetchall()
+        self.catat_fetch(start, len(rows))
+        return rows
+        
+    def catat_fetch(self, start, rows):
+        if self.kueri:
+            self.kueri[1] += (time.perf_counter() - start) * 1000
+            self.kueri[2] += rows
+            
+    def selesai(self):
+        """Simpan pengukuran query terakhir (otomatis saat query berikutnya dijalankan)"""
+        if self.kueri and self.connection.stats:
+            sql, ms, rows = self.kueri
+            self.connection.stats.record(query_shape(sql), ms, rows)
+        self.kueri = None
+        
+class TimedConnection(sqlite3.Connection):
+    """Koneksi SQLite yang memakai TimedCursor, juga untuk execute langsung di koneksi"""
+    stats = None
+    terbuka = None
+    
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+        
+    def execute(self, sql, parameters=()):
+        # Left open so the caller's fetch is counted, like a query on a cursor
+        self.selesai()
+        self.terbuka = self.cursor()
+        self.terbuka.execute(sql, parameters)
+        return self.terbuka
+        
+    def executemany(self, sql, seq_of_parameters):
+        self.selesai()
+        return self.cursor().executemany(sql, seq_of_parameters)
+        
+    def executescript(self, sql_script):
+        self.selesai()
+        return self.cursor().executescript(sql_script)
+        
+    def selesai(self):
+        """Simpan pengukuran query terakhir dari execute langsung di koneksi"""
+        if self.terbuka is not None:
+            self.terbuka.selesai()
+            self.terbuka = None
+            
+    def close(self):
+        self.selesai()
+        super().close()
+        
+class ApotekRepository:
+    """Akses data apotek tanpa Tk: setiap operasi adalah func(cursor, *args) untuk DatabaseWorker"""
+    
+    def __init__(self, db_path=DB_PATH, multi_terminal=False, stats=None):
+        self.db_path = db_path
+        self.multi_terminal = multi_terminal
+        self.cache = CatalogCache()
+        self.stats = stats or QueryStats()
+        
+    def connect(self, read_only=False):
+        """Buka koneksi SQLite ke db_path (boleh ':memory:'), setiap query diukur ke self.stats"""
+        # BackupWorker also reads through the writer's connection (SQLite serializes the calls)
+        conn = sqlite3.connect(self.db_path, timeout=BUSY_TIMEOUT, factory=TimedConnection,
+                               check_same_thread=read_only)
+        conn.stats = self.stats
+        
+        if self.multi_terminal and not read_only:
+            # WAL lets other tills keep reading while this one commits
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+        if read_only:
+            conn.execute("PRAGMA query_only=ON")
+            
+        return conn
+        
+    def setup_database(self, cursor):
+        """Setup database dan jalankan migrasi skema yang belum diterapkan"""
+        conn = cursor.connection
+        cursor.execute("PRAGMA user_version")
+        current_version = cursor.fetchone()[0]
+        
+        if current_version >= MIGRATIONS[-1][0]:
+            # Schema is current, a normal start costs only the PRAGMA above
+            return
+            
+        pending = [(version, script) for version, script in MIGRATIONS if version > current_version]
+        for version, script in pending:
+            # Each migration commits together with its version number
+            conn.executescript(f"""
+                BEGIN;
+                {script}
+                PRAGMA user_version = {version};
+                COMMIT;
+            """)
+            
+        # Refresh planner statistics so existing databases use the new indexes
+        self.optimize_database(cursor)
+        
+    def data_version(self, cursor):
+        """PRAGMA data_version koneksi ini, berubah setiap koneksi lain melakukan commit"""
+        cursor.execute("PRAGMA data_version")
+        data_version = cursor.fetchone()[0]
+        # Writes through this app are write-through, other terminals' writes are only seen here
+        self.cache.sync(data_version)
+        return data_version
+        
+    def optimize_database(self, cursor):
+        """Perbarui statistik query planner (ANALYZE)"""
+        cursor.execute("ANALYZE")
+        cursor.connection.commit()
+        
+    def get_statistics(self, cursor):
+        """Mendapatkan statistik untuk dashboard"""
+        stats = {}
+        
+        # Total obat dan pegawai (maintained by triggers)
+        cursor.execute("SELECT nama, nilai FROM dashboard_stats")
+        stats.update(cursor.fetchall())
+        
+        # Pembelian dan penjualan bulan ini from the monthly buckets
+        stats['pembelian_bulan'] = stats['penjualan_bulan'] = 0
+        stats['pendapatan_bulan'] = 0
+        
+        current_month = datetime.now().strftime('%Y-%m')
+        cursor.execute("""
+            SELECT jenis, jumlah_transaksi, total_harga FROM statistik_bulanan
+            WHERE bulan = ?
+        """, (current_month,))
+        
+        for jenis, jumlah_transaksi, total_harga in cursor.fetchall():
+            stats[f'{jenis}_bulan'] = jumlah_transaksi
+            if jenis == 'penjualan':
+                stats['pendapatan_bulan'] = total_harga
+                
+        return stats
+        
+    def check_dashboard_stats(self, cursor):
+        """Bandingkan statistik dashboard dengan hitungan ulang dari tabel transaksi"""
+        cursor.execute("SELECT nama, nilai FROM dashboard_stats")
+        stored = dict(cursor.fetchall())
+        
+        cursor.execute("SELECT COUNT(*) FROM obat")
+        total_obat = cursor.fetchone()[0]
+        cursor.execute("SELECT COUNT(*) FROM pegawai")
+        total_pegawai = cursor.fetchone()[0]
+        
+        mismatches = [nama for nama, nilai in (('total_obat', total_obat), ('total_pegawai', total_pegawai))
+                      if stored.get(nama) != nilai]
+        
+        # Buckets that differ in either direction (empty buckets are ignored)
+        source = STATISTIK_BULANAN_SOURCE.format(pembelian=self.sumber_transaksi(cursor, 'pembelian'),
+                                                 penjualan=self.sumber_transaksi(cursor, 'penjualan'))
+        cursor.execute(f"""
+            SELECT jenis, bulan FROM (
+                SELECT jenis, bulan, jumlah_transaksi, ROUND(total_harga, 2) FROM ({source})
+                EXCEPT
+                SELECT jenis, bulan, jumlah_transaksi, ROUND(total_harga, 2) FROM statistik_bulanan
+                WHERE jumlah_transaksi != 0
+            )
+            UNION
+            SELECT jenis, bulan FROM (
+                SELECT jenis, bulan, jumlah_transaksi, ROUND(total_harga, 2) FROM statistik_bulanan
+                WHERE jumlah_transaksi != 0
+                EXCEPT
+                SELECT jenis, bulan, jumlah_transaksi, ROUND(total_harga, 2) FROM ({source})
+            )
+        """)
+        mismatches += [f"{jenis} {bulan}" for jenis, bulan in cursor.fetchall()]
+        
+        return mismatches
+        
+    def rebuild_dashboard_stats(self, cursor):
+        """Hitung ulang semua statistik dashboard dari tabel transaksi dan arsipnya"""
+        rebuild = DASHBOARD_STATS_REBUILD.format(pembelian=self.sumber_transaksi(cursor, 'pembelian'),
+                                                 penjualan=self.sumber_transaksi(cursor, 'penjualan'))
+        cursor.connection.executescript(f"BEGIN; {rebuild} COMMIT;")
+        
+    def lokasi_arsip(self, file):
+        """Path file arsip, relatif terhadap folder database utama"""
+        return os.path.join(os.path.dirname(os.path.abspath(self.db_path)), file)
+        
+    def attach_arsip(self, cursor, dari=None, sampai=None):
+        """ATTACH arsip terdaftar yang tahunnya beririsan dengan nomor hari [dari, sampai); kembalikan schema-nya"""
+        cursor.execute("SELECT tahun, file FROM arsip_periode ORDER BY tahun")
+        arsip = [(tahun, file) for tahun, file in cursor.fetchall()
+                 if (dari is None or datetime(tahun + 1, 1, 1).toordinal() > dari)
+                 and (sampai is None or datetime(tahun, 1, 1).toordinal() < sampai)]
+        if not arsip:
+            return []
+            
+        cursor.execute("PRAGMA database_list")
+        attached = {row[1] for row in cursor.fetchall()}
+        for tahun, file in arsip:
+            if f"arsip_{tahun}" not in attached:
+                path = self.lokasi_arsip(file)
+                # ATTACH would silently create an empty file in its place
+                if not os.path.exists(path):
+                    raise FileNotFoundError(f"File arsip {path} tidak ditemukan")
+                cursor.execute("ATTACH DATABASE ? AS ?", (path, f"arsip_{tahun}"))
+        return [f"arsip_{tahun}" for tahun, _ in arsip]
+        
+    def sumber_transaksi(self, cursor, jenis, dari=None, sampai=None):
+        """Sumber FROM untuk jenis ('penjualan'/'pembelian') termasuk arsip yang mencakup [dari, sampai)"""
+        # Archives are ATTACHed on first use, so don't call this in the middle of a transaction
+        schemas = self.attach_arsip(cursor, dari, sampai)
+        if not schemas:
+            return jenis
+        # Filters on the outer query are pushed down into each part of the UNION ALL
+        return f"({' UNION ALL '.join(f'SELECT * FROM {schema}.{jenis}' for schema in ['main'] + schemas)})"
+        
+    def ringkasan_transaksi(self, cursor, schema, dari=None, sampai=None):
+        """(jumlah baris, checksum SHA-256) penjualan, pembelian dan alokasi_lot di schema, opsional [dari, sampai)"""
+        where, params = "", ()
+        if dari is not None:
+            where, params = "WHERE {hari} >= ? AND {hari} < ?", (dari, sampai)
+        penjualan = where.format(hari='hari_penjualan')
+        queries = {
+            'penjualan': f"SELECT * FROM {schema}.penjualan {penjualan} ORDER BY id",
+            'pembelian': f"SELECT * FROM {schema}.pembelian {where.format(hari='hari_pembelian')} ORDER BY id",
+            'alokasi_lot': f"""
+                SELECT * FROM {schema}.alokasi_lot
+                WHERE id_penjualan IN (SELECT id FROM {schema}.penjualan {penjualan})
+                ORDER BY id_penjualan, id_lot
+            """,
+        }
+        
+        ringkasan = {}
+        for tabel, query in queries.items():
+            checksum = hashlib.sha256()
+            jumlah = 0
+            cursor.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(EXPORT_BATCH_SIZE)
+                if not rows:
+                    break
+                for row in rows:
+                    checksum.update(repr(row).encode())
+                jumlah += len(rows)
+            ringkasan[tabel] = (jumlah, checksum.hexdigest())
+        return ringkasan
+        
+    def arsipkan(self, cursor, sampai):
+        """Pindahkan transaksi sebelum nomor hari sampai ke file arsip per tahun"""
+        # Returns one (tahun, file, penjualan, pembelian, alokasi) per archived year.
+        # Archived periods are closed for new transactions (migration 14 triggers)
+        if self.db_path == ':memory:':
+            raise ValueError("Arsip hanya bisa dibuat untuk database berupa file")
+        if sampai > datetime.now().toordinal():
+            raise ValueError("Batas arsip tidak boleh setelah hari ini")
+            
+        cursor.execute("""
+            SELECT MIN(hari) FROM (
+                SELECT MIN(hari_penjualan) AS hari FROM penjualan
+                UNION ALL
+                SELECT MIN(hari_pembelian) FROM pembelian
+            )
+        """)
+        awal = cursor.fetchone()[0]
+        if awal is None or awal >= sampai:
+            return []
+            
+        hasil = []
+        for tahun in range(datetime.fromordinal(awal).year, datetime.fromordinal(sampai - 1).year + 1):
+            dari = max(awal, datetime(tahun, 1, 1).toordinal())
+            hingga = min(sampai, datetime(tahun + 1, 1, 1).toordinal())
+            hasil.append(self.arsipkan_tahun(cursor, tahun, dari, hingga))
+            
+        # The hot tables just shrank, refresh the planner statistics
+        self.optimize_database(cursor)
+        return hasil
+        
+    def arsipkan_tahun(self, cursor, tahun, dari, sampai):
+        """Salin transaksi [dari, sampai) ke arsip tahun itu, verifikasi, lalu hapus dari database utama"""
+        conn = cursor.connection
+        schema = f"arsip_{tahun}"
+        file = ARSIP_FILE.format(nama_db=os.path.splitext(os.path.basename(self.db_path))[0], tahun=tahun)
+        cursor.execute("PRAGMA database_list")
+        if schema not in {row[1] for row in cursor.fetchall()}:
+            cursor.execute("ATTACH DATABASE ? AS ?", (self.lokasi_arsip(file), schema))
+            
+        # Archive tables take the live table definitions
+        cursor.execute("""
+            SELECT name, sql FROM main.sqlite_master
+            WHERE type = 'table' AND name IN ('penjualan', 'pembelian', 'alokasi_lot')
+        """)
+        for name, sql in cursor.fetchall():
+            cursor.execute(sql.replace(f"CREATE TABLE {name}", f"CREATE TABLE IF NOT EXISTS {schema}.{name}", 1))
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS {schema}.idx_penjualan_hari ON penjualan (hari_penjualan)")
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS {schema}.idx_pembelian_hari ON pembelian (hari_pembelian)")
+        
+        penjualan = "hari_penjualan >= ? AND hari_penjualan < ?"
+        pembelian = "hari_pembelian >= ? AND hari_pembelian < ?"
+        params = (dari, sampai)
+        
+        # Copy and commit the archive first, replacing whatever an interrupted run left behind
+        cursor.execute(f"""
+            DELETE FROM {schema}.alokasi_lot
+            WHERE id_penjualan IN (SELECT id FROM {schema}.penjualan WHERE {penjualan})
+        """, params)
+        cursor.execute(f"DELETE FROM {schema}.penjualan WHERE {penjualan}", params)
+        cursor.execute(f"DELETE FROM {schema}.pembelian WHERE {pembelian}", params)
+        cursor.execute(f"INSERT INTO {schema}.penjualan SELECT * FROM main.penjualan WHERE {penjualan}", params)
+        cursor.execute(f"""
+            INSERT INTO {schema}.alokasi_lot SELECT * FROM main.alokasi_lot
+            WHERE id_penjualan IN (SELECT id FROM main.penjualan WHERE {penjualan})
+        """, params)
+        cursor.execute(f"INSERT INTO {schema}.pembelian SELECT * FROM main.pembelian WHERE {pembelian}", params)
+        conn.commit()
+        
+        # Verify and delete under one write lock, so no till can change the rows in between
+        cursor.execute("BEGIN IMMEDIATE")
+        asli = self.ringkasan_transaksi(cursor, 'main', dari, sampai)
+        salinan = self.ringkasan_transaksi(cursor, schema, dari, sampai)
+        beda = [tabel for tabel in asli if asli[tabel] != salinan[tabel]]
+        if beda:
+            raise RuntimeError(f"Verifikasi arsip {tahun} gagal ({', '.join(beda)}), data tidak dihapus")
+            
+        cursor.execute("INSERT INTO arsip_berjalan (aktif) VALUES (1)")
+        cursor.execute(f"""
+            DELETE FROM main.alokasi_lot
+            WHERE id_penjualan IN (SELECT id FROM main.penjualan WHERE {penjualan})
+        """, params)
+        cursor.execute(f"DELETE FROM main.penjualan WHERE {penjualan}", params)
+        cursor.execute(f"DELETE FROM main.pembelian WHERE {pembelian}", params)
+        cursor.execute("DELETE FROM arsip_berjalan")
+        
+        # Counts and checksum of the whole archive file, for verifikasi_arsip
+        total = self.ringkasan_transaksi(cursor, schema)
+        checksum = hashlib.sha256(''.join(sha for _, sha in total.values()).encode()).hexdigest()
+        cursor.execute("""
+            INSERT INTO arsip_periode (tahun, file, hari_akhir, jumlah_penjualan, jumlah_pembelian,
+                jumlah_alokasi, checksum) VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (tahun) DO UPDATE SET
+                hari_akhir = MAX(hari_akhir, excluded.hari_akhir),
+                jumlah_penjualan = excluded.jumlah_penjualan,
+                jumlah_pembelian = excluded.jumlah_pembelian,
+                jumlah_alokasi = excluded.jumlah_alokasi,
+                checksum = excluded.checksum,
+                updated_at = CURRENT_TIMESTAMP
+        """, (tahun, file, sampai, total['penjualan'][0], total['pembelian'][0], total['alokasi_lot'][0], checksum))
+        conn.commit()
+        return (tahun, file, asli['penjualan'][0], asli['pembelian'][0], asli['alokasi_lot'][0])
+        
+    def fetch_arsip(self, cursor, verifikasi=False):
+        """Daftar arsip (tahun, file, hari_akhir, penjualan, pembelian, status), dicek ulang jika verifikasi"""
+        # Verifying recounts the rows, recomputes the checksum and runs integrity_check on each file
+        cursor.execute("""
+            SELECT tahun, file, hari_akhir, jumlah_penjualan, jumlah_pembelian, jumlah_alokasi, checksum
+            FROM arsip_periode ORDER BY tahun
+        """)
+        arsip = cursor.fetchall()
+        if not verifikasi:
+            return [row[:5] + (None,) for row in arsip]
+            
+        self.attach_arsip(cursor)
+        hasil = []
+        for tahun, file, hari_akhir, jumlah_penjualan, jumlah_pembelian, jumlah_alokasi, checksum in arsip:
+            schema = f"arsip_{tahun}"
+            cursor.execute(f"PRAGMA {schema}.quick_check")
+            integritas = cursor.fetchone()[0]
+            total = self.ringkasan_transaksi(cursor, schema)
+            if integritas != 'ok':
+                status = f"Rusak: {integritas}"
+            elif ((total['penjualan'][0], total['pembelian'][0], total['alokasi_lot'][0])
+                  != (jumlah_penjualan, jumlah_pembelian, jumlah_alokasi)):
+                status = "Jumlah baris berbeda"
+            elif hashlib.sha256(''.join(sha for _, sha in total.values()).encode()).hexdigest() != checksum:
+                status = "Checksum berbeda"
+            else:
+                status = "OK"
+            hasil.append((tahun, file, hari_akhir, jumlah_penjualan, jumlah_pembelian, status))
+        return hasil
+        
+    def backup_database(self, conn, folder=BACKUP_DIR, simpan=BACKUP_SIMPAN, batal=None):
+        """Backup online lewat conn, verifikasi salinannya lalu rotasi; kembalikan (path, halaman, detik)"""
+        # Writes through conn itself are copied without restarting, so pass the writer's connection;
+        # a commit from any other connection or terminal restarts the backup.
+        # Setting batal (threading.Event) stops it at the next step with BackupDibatalkanError
+        if self.db_path == ':memory:':
+            raise ValueError("Backup hanya bisa dibuat untuk database berupa file")
+            
+        folder = os.path.join(os.path.dirname(os.path.abspath(self.db_path)), folder)
+        os.makedirs(folder, exist_ok=True)
+        nama_db = os.path.splitext(os.path.basename(self.db_path))[0]
+        path = os.path.join(folder, f"{nama_db}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.db")
+        start = time.perf_counter()
+        halaman = [0]
+        
+        def jeda(status, remaining, total):
+            halaman[0] = total
+            # Raising here makes sqlite3 abort the backup and release the connection
+            if batal is not None and batal.is_set():
+                raise BackupDibatalkanError()
+            # The source is unlocked between steps, let the tills write
+            time.sleep(BACKUP_JEDA)
+            
+        # Written under a temporary name, so a backup file is always complete and verified
+        sementara = path + '.tmp'
+        target = sqlite3.connect(sementara)
+        try:
+            conn.backup(target, pages=BACKUP_PAGES, progress=jeda)
+            if batal is not None and batal.is_set():
+                raise BackupDibatalkanError()
+            # Restore check: the copy has to open and pass a full integrity_check
+            integritas = target.execute("PRAGMA integrity_check").fetchone()[0]
+            target.close()
+            if integritas != 'ok':
+                raise RuntimeError(f"Backup gagal diverifikasi: {integritas}")
+            os.replace(sementara, path)
+        except Exception:
+            # A failed copy leaves no half-written file in the backup folder
+            target.close()
+            if os.path.exists(sementara):
+                os.remove(sementara)
+            raise
+        
+        # Timestamped names sort by age, keep the newest ones
+        backups = sorted(file for file in os.listdir(folder)
+                         if re.fullmatch(rf"{re.escape(nama_db)}_\d{{8}}_\d{{6}}\.db", file))
+        for file in backups[:-simpan]:
+            os.remove(os.path.join(folder, file))
+            
+        return path, halaman[0], time.perf_counter() - start
+        
+    def fetch_laporan(self, cursor, granularitas, dari, sampai, top=LAPORAN_TOP_OBAT):
+        """Laporan penjualan per periode ('hari', 'minggu', 'bulan'): dict 'periode', 'obat' (terlaris) dan 'pegawai'"""
+        # The range is widened to whole periods; modal uses obat.harga_beli as of when a period is computed
+        mulai, _ = periode_laporan(granularitas, dari)
+        _, akhir = periode_laporan(granularitas, sampai)
+        self.hitung_laporan(cursor, granularitas, mulai, akhir)
+        params = (granularitas, mulai, akhir)
+        laporan = {}
+        
+        # Per period, with the change against the previous period
+        cursor.execute("""
+            SELECT hari_mulai, jumlah_transaksi, jumlah_terjual, pendapatan, modal,
+                   pendapatan - LAG(pendapatan) OVER (ORDER BY hari_mulai)
+            FROM laporan_penjualan
+            WHERE granularitas = ? AND hari_mulai >= ? AND hari_mulai < ? AND dimensi = 'total'
+            ORDER BY hari_mulai
+        """, params)
+        laporan['periode'] = [(label_periode(granularitas, row[0]),) + row[1:] for row in cursor.fetchall()]
+        
+        cursor.execute("""
+            SELECT RANK() OVER (ORDER BY SUM(l.jumlah_terjual) DESC), o.nama_obat,
+                   SUM(l.jumlah_terjual), SUM(l.pendapatan), SUM(l.pendapatan - l.modal)
+            FROM laporan_penjualan l
+            JOIN obat o ON o.id = l.id_dimensi
+            WHERE l.granularitas = ? AND l.hari_mulai >= ? AND l.hari_mulai < ? AND l.dimensi = 'obat'
+            GROUP BY l.id_dimensi
+            ORDER BY 1
+            LIMIT ?
+        """, params + (top,))
+        laporan['obat'] = cursor.fetchall()
+        
+        # Each pegawai's share of the revenue in the range
+        cursor.execute("""
+            SELECT pg.nama_pegawai, SUM(l.jumlah_transaksi), SUM(l.jumlah_terjual), SUM(l.pendapatan),
+                   SUM(l.pendapatan - l.modal), 100.0 * SUM(l.pendapatan) / SUM(SUM(l.pendapatan)) OVER ()
+            FROM laporan_penjualan l
+            JOIN pegawai pg ON pg.id = l.id_dimensi
+            WHERE l.granularitas = ? AND l.hari_mulai >= ? AND l.hari_mulai < ? AND l.dimensi = 'pegawai'
+            GROUP BY l.id_dimensi
+            ORDER BY 4 DESC
+        """, params)
+        laporan['pegawai'] = cursor.fetchall()
+        
+        return laporan
+        
+    def hitung_laporan(self, cursor, granularitas, mulai, akhir):
+        """Hitung agregat laporan untuk periode di [mulai, akhir) yang belum ditutup di cache"""
+        cursor.execute("""
+            SELECT hari_mulai FROM laporan_periode
+            WHERE hari_mulai >= ? AND hari_mulai < ? AND granularitas = ?
+        """, (mulai, akhir, granularitas))
+        tertutup = {row[0] for row in cursor.fetchall()}
+        
+        periode = []
+        while mulai < akhir:
+            periode.append(periode_laporan(granularitas, mulai))
+            mulai = periode[-1][1]
+            
+        belum = [hari_mulai for hari_mulai, _ in periode if hari_mulai not in tertutup]
+        if not belum:
+            return
+            
+        # One scan over the span of missing periods, usually just the current one
+        dari = belum[0]
+        sampai = periode_laporan(granularitas, belum[-1])[1]
+        penjualan = self.sumber_transaksi(cursor, 'penjualan', dari, sampai)
+        cursor.execute("""
+            DELETE FROM laporan_penjualan WHERE granularitas = ? AND hari_mulai >= ? AND hari_mulai < ?
+        """, (granularitas, dari, sampai))
+        cursor.execute(f"""
+            WITH dasar AS (
+                SELECT {LAPORAN_PERIODE_SQL[granularitas]} AS hari_mulai, p.id_obat, p.id_pegawai,
+                       COUNT(*) AS jumlah_transaksi, SUM(p.jumlah) AS jumlah_terjual,
+                       SUM(p.total_harga) AS pendapatan, SUM(p.jumlah * o.harga_beli) AS modal
+                FROM {penjualan} p
+                JOIN obat o ON o.id = p.id_obat
+                WHERE p.hari_penjualan >= ? AND p.hari_penjualan < ?
+                GROUP BY 1, p.id_obat, p.id_pegawai
+            )
+            INSERT INTO laporan_penjualan (granularitas, hari_mulai, dimensi, id_dimensi,
+                jumlah_transaksi, jumlah_terjual, pendapatan, modal)
+            SELECT ?, hari_mulai, 'total', 0, SUM(jumlah_transaksi), SUM(jumlah_terjual),
+                   SUM(pendapatan), SUM(modal)
+            FROM dasar GROUP BY hari_mulai
+            UNION ALL
+            SELECT ?, hari_mulai, 'obat', id_obat, SUM(jumlah_transaksi), SUM(jumlah_terjual),
+                   SUM(pendapatan), SUM(modal)
+            FROM dasar GROUP BY hari_mulai, id_obat
+            UNION ALL
+            SELECT ?, hari_mulai, 'pegawai', id_pegawai, SUM(jumlah_transaksi), SUM(jumlah_terjual),
+                   SUM(pendapatan), SUM(modal)
+            FROM dasar GROUP BY hari_mulai, id_pegawai
+        """, (dari, sampai, granularitas, granularitas, granularitas))
+        
+        # Periods without sales still get a total row, and finished ones are closed
+        dihitung = [(hari_mulai, hari_akhir) for hari_mulai, hari_akhir in periode if dari <= hari_mulai < sampai]
+        cursor.executemany("""
+            INSERT OR IGNORE INTO laporan_penjualan (granularitas, hari_mulai, dimensi, id_dimensi,
+                jumlah_transaksi, jumlah_terjual, pendapatan, modal) VALUES (?, ?, 'total', 0, 0, 0, 0, 0)
+        """, [(granularitas, hari_mulai) for hari_mulai, _ in dihitung])
+        
+        hari_ini = datetime.now().toordinal()
+        cursor.executemany("""
+            INSERT OR REPLACE INTO laporan_periode (hari_mulai, granularitas, hari_akhir) VALUES (?, ?, ?)
+        """, [(hari_mulai, granularitas, hari_akhir) for hari_mulai, hari_akhir in dihitung if hari_akhir <= hari_ini])
+        cursor.connection.commit()
+        
+    def fetch_rencana_pembelian(self, cursor, metode='ses', lead_time=REORDER_LEAD_TIME):
+        """Saran pembelian (supplier, id_obat, nama, stok, permintaan/hari, reorder point, pesan, biaya)"""
+        # One NumPy forecast for the whole catalog, ordered by supplier
+        if not load_numpy():
+            raise RuntimeError("Rencana pembelian membutuhkan NumPy (pip install numpy)")
+            
+        hari_ini = datetime.now().toordinal()
+        awal = hari_ini - FORECAST_HISTORY_DAYS + 1
+        
+        # Only stock in lots that have not expired can be sold
+        cursor.execute("""
+            SELECT o.id, o.nama_obat, COALESCE(SUM(l.sisa), 0)
+            FROM obat o
+            LEFT JOIN lot_obat l ON l.id_obat = o.id AND l.sisa > 0 AND l.hari_expired > ?
+            GROUP BY o.id
+            ORDER BY o.id
+        """, (hari_ini,))
+        obat = cursor.fetchall()
+        if not obat:
+            return []
+        ids = np.array([row[0] for row in obat])
+        stok = np.array([row[2] for row in obat], dtype=float)
+        
+        # Daily sales as one row per obat: both lists are built in the same pass, so they
+        # line up, and NumPy parses them in bulk instead of a Python tuple per day
+        cursor.execute("""
+            SELECT id_obat, COUNT(*), group_concat(hari - ?), group_concat(jumlah) FROM penjualan_harian
+            WHERE hari >= ? AND hari <= ?
+            GROUP BY id_obat
+        """, (awal, awal, hari_ini))
+        rows = cursor.fetchall()
+        id_obat = np.array([row[0] for row in rows], dtype=np.int64)
+        hari = np.array(','.join(row[2] for row in rows).split(',') if rows else [], dtype=np.int64)
+        jumlah = np.array(','.join(row[3] for row in rows).split(',') if rows else [], dtype=float)
+        
+        # Sales of deleted obat have no row in the catalog
+        posisi = np.minimum(np.searchsorted(ids, id_obat), len(ids) - 1)
+        ada = np.repeat(ids[posisi] == id_obat, [row[1] for row in rows])
+        posisi = np.repeat(posisi, [row[1] for row in rows])
+        permintaan, _, reorder_point, pesan = hitung_reorder(
+            posisi[ada], hari[ada], jumlah[ada], stok, metode, lead_time)
+        
+        # Supplier and price of the latest purchase of each obat
+        cursor.execute("""
+            SELECT id_obat, nama_supplier, harga_satuan FROM pembelian
+            WHERE id IN (SELECT MAX(id) FROM pembelian GROUP BY id_obat)
+        """)
+        supplier = {row[0]: row[1:] for row in cursor.fetchall()}
+        
+        rencana = []
+        for i in np.flatnonzero(pesan > 0):
+            obat_id, nama_obat, stok_layak = obat[i]
+            nama_supplier, harga_satuan = supplier.get(obat_id, ("(Belum ada supplier)", 0))
+            rencana.append((nama_supplier, obat_id, nama_obat, stok_layak, float(permintaan[i]),
+                            float(reorder_point[i]), int(pesan[i]), int(pesan[i]) * harga_satuan))
+            
+        rencana.sort(key=lambda row: (row[0], row[2]))
+        return rencana
+        
+    def fetch_recent_transactions(self, cursor, limit):
+        """Ambil transaksi terakhir (pembelian dan penjualan) urut waktu"""
+        # Each side reads at most `limit` rows from its created_at index,
+        # then the two short lists are merged
+        cursor.execute("""
+            SELECT tanggal, jenis, nama_obat, jumlah, total_harga FROM (
+                SELECT * FROM (
+                    SELECT p.created_at, p.id, p.tanggal_pembelian AS tanggal, 'Pembelian' AS jenis,
+                           o.nama_obat, p.jumlah, p.total_harga
+                    FROM pembelian p
+                    JOIN obat o ON p.id_obat = o.id
+                    ORDER BY p.created_at DESC, p.id DESC
+                    LIMIT ?
+                )
+                UNION ALL
+                SELECT * FROM (
+                    SELECT p.created_at, p.id, p.tanggal_penjualan, 'Penjualan',
+                           o.nama_obat, p.jumlah, p.total_harga
+                    FROM penjualan p
+                    JOIN obat o ON p.id_obat = o.id
+                    ORDER BY p.created_at DESC, p.id DESC
+                    LIMIT ?
+                )
+            )
+            ORDER BY created_at DESC, id DESC
+            LIMIT ?
+        """, (limit, limit, limit))
+        
+        return cursor.fetchall()
+        
+    def export_transaksi_csv(self, cursor, jenis, path, filters, progress):
+        """Tulis data transaksi (termasuk arsip) ke CSV per batch EXPORT_BATCH_SIZE agar memori tetap kecil"""
+        # Every batch is its own query (keyset on id), so a long export never holds the read
+        # lock and tills can commit in single-terminal mode (no WAL)
+        sumber = self.sumber_transaksi(cursor, jenis, filters.get('dari'), filters.get('sampai'))
+        if jenis == 'pembelian':
+            header = ('ID', 'Tanggal', 'Obat', 'Supplier', 'Jumlah', 'Harga Satuan', 'Total')
+            columns = "id, tanggal_pembelian, id_obat, nama_supplier, jumlah, harga_satuan, total_harga"
+            day_column = 'hari_pembelian'
+        else:
+            header = ('ID', 'Tanggal', 'Obat', 'Pegawai', 'Pembeli', 'Jumlah', 'Harga Satuan', 'Total')
+            columns = "id, tanggal_penjualan, id_obat, id_pegawai, nama_pembeli, jumlah, harga_satuan, total_harga"
+            day_column = 'hari_penjualan'
+            
+        conditions, params = [], []
+        if 'dari' in filters:
+            conditions.append(f"{day_column} >= ?")
+            params.append(filters['dari'])
+        if 'sampai' in filters:
+            conditions.append(f"{day_column} < ?")
+            params.append(filters['sampai'])
+            
+        # The day index finds the id span of the date range once; batches then walk only that
+        # span of the primary key (backdated rows widen the span, they are never missed)
+        id_awal, id_akhir = 0, None
+        if conditions:
+            cursor.execute(f"SELECT MIN(id), MAX(id) FROM {sumber} WHERE {' AND '.join(conditions)}", params)
+            id_awal, id_akhir = cursor.fetchone()
+            if id_awal is None:
+                id_awal, id_akhir = 0, 0
+            id_awal -= 1
+            # Unary + keeps the batches on the primary key instead of re-sorting the range per batch
+            conditions = [f"+{condition}" for condition in conditions]
+            conditions.append("id <= ?")
+            params.append(id_akhir)
+            
+        if 'nama_obat' in filters:
+            conditions.append("id_obat IN (SELECT id FROM obat WHERE nama_obat = ?)")
+            params.append(filters['nama_obat'])
+            
+        # No join, so a UNION ALL with the archives is flattened into an ordered merge
+        # and each batch reads only its own rows
+        conditions.insert(0, "id > ?")
+        query = f"SELECT {columns} FROM {sumber} WHERE {' AND '.join(conditions)} ORDER BY id LIMIT ?"
+        
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(header)
+            
+            last_id = id_awal
+            while True:
+                cursor.execute(query, [last_id] + params + [EXPORT_BATCH_SIZE])
+                rows = cursor.fetchall()
+                if not rows:
+                    break
+                last_id = rows[-1][0]
+                
+                # Names for this batch only; rows without a match are skipped like the join did
+                nama_obat = self.nama_per_id(cursor, 'obat', 'nama_obat', {row[2] for row in rows})
+                if jenis == 'penjualan':
+                    nama_pegawai = self.nama_per_id(cursor, 'pegawai', 'nama_pegawai', {row[3] for row in rows})
+                    rows = [(row[0], row[1], nama_obat[row[2]], nama_pegawai[row[3]]) + row[4:] for row in rows
+                            if row[2] in nama_obat and row[3] in nama_pegawai]
+                else:
+                    rows = [(row[0], row[1], nama_obat[row[2]]) + row[3:] for row in rows if row[2] in nama_obat]
+                writer.writerows(rows)
+                progress['rows'] += len(rows)
+                
+        return progress['rows']
+        
+    def nama_per_id(self, cursor, tabel, kolom, ids):
+        """{id: nama} dari tabel untuk ids tertentu"""
+        cursor.execute(f"SELECT id, {kolom} FROM {tabel} WHERE id IN ({', '.join('?' * len(ids))})", list(ids))
+        return dict(cursor.fetchall())
+        
+    def fetch_obat_page(self, cursor, last_row, limit, filters):
+        """Ambil satu halaman data obat setelah baris terakhir (keyset pada id atau kolom urut)"""
+        if 'cari' in filters:
+            return self.search_obat_page(cursor, last_row, limit, filters)
+            
+        conditions, params, kolom_urut, order_by = keyset_urut(URUTAN_OBAT, filters, last_row, 'id')
+            
+        # Only these rows, used to refresh a table after a save
+        if 'ids' in filters:
+            conditions.append(f"id IN ({', '.join('?' * len(filters['ids']))})")
+            params.extend(filters['ids'])
+            
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        cursor.execute(f"""
+            SELECT id, nama_obat, kategori, harga_beli, harga_jual, stok, expired_date{kolom_urut}
+            FROM obat o
+            {where}
+            ORDER BY {order_by}
+            LIMIT ?
+        """, params + [limit])
+        
+        return cursor.fetchall()
+        
+    def search_obat_page(self, cursor, last_row, limit, filters):
+        """Satu halaman hasil pencarian obat (FTS5), urut relevansi atau kolom urut; rank ikut di belakang"""
+        conditions, params = ["obat_fts MATCH ?"], [filters['cari']]
+        if 'urut' in filters:
+            urut_conditions, urut_params, kolom_urut, order_by = keyset_urut(URUTAN_OBAT, filters, last_row, 'o.id')
+            conditions.extend(urut_conditions)
+            params.extend(urut_params)
+        else:
+            kolom_urut, order_by = "", "f.rank, o.id"
+            if last_row:
+                # Keyset on (rank, id), rank is deterministic for a given query
+                conditions.append("(f.rank, o.id) > (?, ?)")
+                params.extend([last_row[-1], last_row[0]])
+            
+        if 'ids' in filters:
+            conditions.append(f"o.id IN ({', '.join('?' * len(filters['ids']))})")
+            params.extend(filters['ids'])
+            
+        cursor.execute(f"""
+            SELECT o.id, o.nama_obat, o.kategori, o.harga_beli, o.harga_jual, o.stok, o.expired_date,
+                   f.rank{kolom_urut}
+            FROM obat_fts f
+            JOIN obat o ON o.id = f.rowid
+            WHERE {' AND '.join(conditions)}
+            ORDER BY {order_by}
+            LIMIT ?
+        """, params + [limit])
+        
+        return cursor.fetchall()
+        
+    def save_obat_row(self, cursor, row, obat_id=None):
+        """Simpan obat baru, atau update obat_id jika diisi; kembalikan id obat"""
+        stok = row[4]
+        if obat_id:  # Edit mode
+            cursor.execute("SELECT stok FROM obat WHERE id = ?", (obat_id,))
+            stok_lama = cursor.fetchone()[0]
+            
+            cursor.execute("""
+                UPDATE obat SET nama_obat=?, kategori=?, harga_beli=?, 
+                harga_jual=?, stok=?, expired_date=? WHERE id=?
+            """, row + (obat_id,))
+            
+            # Stock typed into the form is a manual correction
+            self.catat_mutasi(cursor, [(obat_id, datetime.now().toordinal(), stok - stok_lama, 'koreksi', obat_id)])
+        else:  # Add mode
+            cursor.execute("""
+                INSERT INTO obat (nama_obat, kategori, harga_beli, 
+                harga_jual, stok, expired_date) VALUES (?, ?, ?, ?, ?, ?)
+            """, row)
+            obat_id = cursor.lastrowid
+            self.catat_mutasi(cursor, [(obat_id, datetime.now().toordinal(), stok, 'saldo_awal', obat_id)])
+            
+        cursor.connection.commit()
+        
+        # Write-through: the cache gets the values just committed
+        nama_obat, _, _, harga_jual, stok, expired_date = row
+        self.cache.put([(obat_id, nama_obat, harga_jual, stok, expired_date)])
+        return obat_id
+        
+    def get_obat(self, cursor, obat_id):
+        """Data obat (id, nama, harga_jual, stok, expired_date) untuk form dan cek stok, lewat cache"""
+        row = self.cache.get(obat_id)
+        if row is None:
+            cursor.execute("SELECT id, nama_obat, harga_jual, stok, expired_date FROM obat WHERE id = ?",
+                           (obat_id,))
+            row = cursor.fetchone()
+            if row:
+                self.cache.put([row])
+        return row
+        
+    def delete_obat_row(self, cursor, obat_id):
+        """Hapus obat yang belum punya transaksi, beserta buku mutasi, snapshot dan lot-nya"""
+        # Taking back a sale or purchase needs the obat's stock and lots, archived ones included
+        for schema in ['main'] + self.attach_arsip(cursor):
+            cursor.execute(f"""
+                SELECT EXISTS (SELECT 1 FROM {schema}.penjualan WHERE id_obat = ?)
+                    OR EXISTS (SELECT 1 FROM {schema}.pembelian WHERE id_obat = ?)
+            """, (obat_id, obat_id))
+            if cursor.fetchone()[0]:
+                raise ObatPunyaRiwayatError()
+                
+        # No sales, so no alokasi_lot rows point at these lots
+        cursor.execute("DELETE FROM obat WHERE id = ?", (obat_id,))
+        cursor.execute("DELETE FROM lot_obat WHERE id_obat = ?", (obat_id,))
+        cursor.execute("DELETE FROM mutasi_stok WHERE id_obat = ?", (obat_id,))
+        cursor.execute("DELETE FROM snapshot_stok WHERE id_obat = ?", (obat_id,))
+        cursor.connection.commit()
+        self.cache.invalidate(obat_id)
+        
+    @commit_bertahap
+    def import_obat_csv(self, cursor, path, progress):
+        """Import CSV katalog obat secara streaming, upsert per nama obat dalam chunk"""
+        result = {'inserted': 0, 'updated': 0, 'rejected': 0}
+        result['rejected_path'] = os.path.splitext(path)[0] + '_ditolak.csv'
+        rejected_file = rejected_writer = None
+        
+        def read_lines(f):
+            # Track how far into the file we are for the progress bar
+            for line in f:
+                progress['bytes'] += len(line)
+                yield line
+                
+        try:
+            with open(path, newline='', encoding='utf-8-sig') as f:
+                reader = csv.DictReader(read_lines(f))
+                missing = [field for field in OBAT_FIELDS if field not in (reader.fieldnames or [])]
+                if missing:
+                    raise ValueError(f"Kolom tidak ditemukan: {', '.join(missing)}")
+                    
+                chunk = []
+                for line_no, row in enumerate(reader, start=2):
+                    progress['rows'] += 1
+                    try:
+                        chunk.append(parse_obat(row))
+                    except ValueError as e:
+                        # Rejected rows are streamed to a side file, not kept in memory
+                        if rejected_writer is None:
+                            rejected_file = open(result['rejected_path'], 'w', newline='', encoding='utf-8')
+                            rejected_writer = csv.writer(rejected_file)
+                            rejected_writer.writerow(('baris', 'alasan') + OBAT_FIELDS)
+                        rejected_writer.writerow([line_no, str(e)] + [row.get(field) for field in OBAT_FIELDS])
+                        result['rejected'] += 1
+                        continue
+                        
+                    if len(chunk) >= IMPORT_CHUNK_SIZE:
+                        self.upsert_obat_chunk(cursor, chunk, result)
+                        chunk = []
+                        
+                if chunk:
+                    self.upsert_obat_chunk(cursor, chunk, result)
+        finally:
+            if rejected_file:
+                rejected_file.close()
+                
+        return result
+        
+    def upsert_obat_chunk(self, cursor, rows, result):
+        """Tulis satu chunk obat dalam satu transaksi: update nama yang sudah ada, insert sisanya"""
+        # Earlier chunks are already committed, so a lock only retries this one
+        updated, inserted = ulangi_jika_terkunci(cursor.connection, self.tulis_obat_chunk, cursor, rows)
+        
+        # Updates are matched by name, so drop the whole cache
+        self.cache.invalidate()
+        
+        result['updated'] += updated
+        result['inserted'] += inserted
+        
+    def tulis_obat_chunk(self, cursor, rows):
+        """Update/insert satu chunk obat lalu commit; kembalikan (jumlah update, jumlah insert)"""
+        # Later rows with the same name win
+        by_name = {row[0]: row for row in rows}
+        
+        placeholders = ', '.join('?' * len(by_name))
+        cursor.execute(f"SELECT id, nama_obat, stok FROM obat WHERE nama_obat IN ({placeholders})",
+                       list(by_name))
+        existing = cursor.fetchall()
+        existing_names = {nama_obat for _, nama_obat, _ in existing}
+        
+        updates = [row[1:] + (row[0],) for name, row in by_name.items() if name in existing_names]
+        inserts = [row for name, row in by_name.items() if name not in existing_names]
+        
+        cursor.execute("SELECT COALESCE(MAX(id), 0) FROM obat")
+        last_id = cursor.fetchone()[0]
+        
+        cursor.executemany("""
+            UPDATE obat SET kategori=?, harga_beli=?, harga_jual=?, stok=?, expired_date=?
+            WHERE nama_obat=?
+        """, updates)
+        cursor.executemany("""
+            INSERT INTO obat (nama_obat, kategori, harga_beli, 
+            harga_jual, stok, expired_date) VALUES (?, ?, ?, ?, ?, ?)
+        """, inserts)
+        
+        # Stock from the file is a correction for existing obat, an opening balance for new ones
+        hari = datetime.now().toordinal()
+        mutasi = [(obat_id, hari, by_name[nama_obat][4] - stok, 'koreksi', obat_id)
+                  for obat_id, nama_obat, stok in existing]
+        cursor.execute("SELECT id, stok FROM obat WHERE id > ?", (last_id,))
+        mutasi += [(obat_id, hari, stok, 'saldo_awal', obat_id) for obat_id, stok in cursor.fetchall()]
+        self.catat_mutasi(cursor, mutasi)
+        
+        cursor.connection.commit()
+        return len(updates), len(inserts)
+        
+    def fetch_pegawai_data(self, cursor, ids=None):
+        """Ambil semua data pegawai, atau hanya id tertentu"""
+        if ids:
+            cursor.execute(f"SELECT * FROM pegawai WHERE id IN ({', '.join('?' * len(ids))}) ORDER BY id DESC", ids)
+            return cursor.fetchall()
+            
+        # Get data from database
+        cursor.execute("SELECT * FROM pegawai ORDER BY id DESC")
+        return cursor.fetchall()
+        
+    def save_pegawai_row(self, cursor, row, pegawai_id=None):
+        """Simpan pegawai baru, atau update pegawai_id jika diisi; kembalikan id pegawai"""
+        if pegawai_id:  # Edit mode
+            cursor.execute("""
+                UPDATE pegawai SET nama_pegawai=?, jabatan=?, alamat=?, 
+                telepon=?, gaji=?, tanggal_masuk=? WHERE id=?
+            """, row + (pegawai_id,))
+        else:  # Add mode
+            cursor.execute("""
+                INSERT INTO pegawai (nama_pegawai, jabatan, alamat, 
+                telepon, gaji, tanggal_masuk) VALUES (?, ?, ?, ?, ?, ?)
+            """, row)
+            pegawai_id = cursor.lastrowid
+            
+        cursor.connection.commit()
+        return pegawai_id
+        
+    def delete_pegawai_row(self, cursor, pegawai_id):
+        """Hapus satu baris pegawai dari database"""
+        cursor.execute("DELETE FROM pegawai WHERE id = ?", (pegawai_id,))
+        cursor.connection.commit()
+        
+    def fetch_obat_options(self, cursor, teks='', in_stock=False, limit=TYPEAHEAD_LIMIT):
+        """Ambil maksimal limit obat untuk picker: ID persis jika angka, selain itu prefix nama"""
+        conditions, params = [], []
+        teks = teks.strip()
+        if teks.isdigit():
+            conditions.append("id = ?")
+            params.append(int(teks))
+        elif teks:
+            # Prefix LIKE is served by idx_obat_nama_nocase
+            escaped = teks.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+            conditions.append("nama_obat LIKE ? ESCAPE '\\'")
+            params.append(escaped + '%')
+            
+        if in_stock:
+            conditions.append("stok > 0")
+            
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        cursor.execute(f"""
+            SELECT id, nama_obat, harga_jual, stok, expired_date FROM obat
+            {where}
+            ORDER BY nama_obat COLLATE NOCASE
+            LIMIT ?
+        """, params + [limit])
+        
+        # Fresh rows for whatever the picker shows next
+        rows = cursor.fetchall()
+        self.cache.put(rows)
+        return rows
+        
+    def fetch_pegawai_options(self, cursor):
+        """Ambil daftar pegawai untuk dropdown penjualan"""
+        cursor.execute("SELECT id, nama_pegawai FROM pegawai")
+        return cursor.fetchall()
+        
+    def fetch_pembelian_page(self, cursor, last_row, limit, filters):
+        """Ambil satu halaman data pembelian setelah baris terakhir (keyset pada id atau kolom urut)"""
+        conditions, params, kolom_urut, order_by = keyset_urut(URUTAN_PEMBELIAN, filters, last_row, 'p.id')
+            
+        # Only these rows, used to refresh a table after a save
+        if 'ids' in filters:
+            conditions.append(f"p.id IN ({', '.join('?' * len(filters['ids']))})")
+            params.extend(filters['ids'])
+            
+        # Half-open date range on the indexed day number
+        if 'dari' in filters:
+            conditions.append("p.hari_pembelian >= ?")
+            params.append(filters['dari'])
+        if 'sampai' in filters:
+            conditions.append("p.hari_pembelian < ?")
+            params.append(filters['sampai'])
+            
+        # Medicine name search through the FTS index
+        if 'cari' in filters:
+            conditions.append("p.id_obat IN (SELECT rowid FROM obat_fts WHERE obat_fts MATCH ?)")
+            params.append(filters['cari'])
+            
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        
+        # Get data from database with JOIN
+        cursor.execute(f"""
+            SELECT p.id, o.nama_obat, p.nama_supplier, p.jumlah, p.harga_satuan, 
+                   p.total_harga, p.tanggal_pembelian{kolom_urut}
+            FROM pembelian p
+            JOIN obat o ON p.id_obat = o.id
+            {where}
+            ORDER BY {order_by}
+            LIMIT ?
+        """, params + [limit])
+        
+        return cursor.fetchall()
+        
+    def save_pembelian_row(self, cursor, row, pembelian_id=None, expired_date=None):
+        """Simpan pembelian (id_obat, supplier, jumlah, harga_satuan, total, tanggal) sebagai lot baru; kembalikan id"""
+        # Without expired_date the lot keeps the old lot's date (edit) or the catalog's expired_date
+        obat_id, jumlah, tanggal = row[0], row[2], row[5]
+        hari = date_key(tanggal)
+        mutasi = []
+        
+        if pembelian_id:  # Edit mode
+            # Reverse the old line, then apply the new one
+            cursor.execute("SELECT id_obat, jumlah, hari_pembelian FROM pembelian WHERE id = ?", (pembelian_id,))
+            obat_lama, jumlah_lama, hari_lama = cursor.fetchone()
+            mutasi.append((obat_lama, hari_lama, -jumlah_lama, 'pembelian', pembelian_id))
+            
+            if not expired_date and obat_lama == obat_id:
+                cursor.execute("SELECT expired_date FROM lot_obat WHERE id_pembelian = ? ORDER BY id DESC LIMIT 1",
+                               (pembelian_id,))
+                lot = cursor.fetchone()
+                expired_date = lot[0] if lot else None
+            
+            cursor.execute("""
+                UPDATE pembelian SET id_obat=?, nama_supplier=?, jumlah=?, 
+                harga_satuan=?, total_harga=?, tanggal_pembelian=?, hari_pembelian=? WHERE id=?
+            """, row + (hari, pembelian_id))
+        else:  # Add mode
+            cursor.execute("""
+                INSERT INTO pembelian (id_obat, nama_supplier, jumlah, harga_satuan, 
+                total_harga, tanggal_pembelian, hari_pembelian) VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, row + (hari,))
+            pembelian_id = cursor.lastrowid
+            
+        mutasi.append((obat_id, hari, jumlah, 'pembelian', pembelian_id))
+        
+        # Update stok obat
+        self.ubah_stok(cursor, mutasi, expired_date)
+        cursor.connection.commit()
+        return pembelian_id
+        
+    def delete_pembelian_row(self, cursor, pembelian_id):
+        """Hapus satu baris pembelian dari database dan kurangi lagi stoknya"""
+        cursor.execute("SELECT id_obat, jumlah, hari_pembelian FROM pembelian WHERE id = ?", (pembelian_id,))
+        obat_id, jumlah, hari = cursor.fetchone()
+        
+        cursor.execute("DELETE FROM pembelian WHERE id = ?", (pembelian_id,))
+        self.ubah_stok(cursor, [(obat_id, hari, -jumlah, 'pembelian', pembelian_id)])
+        cursor.connection.commit()
+        
+    def fetch_penjualan_page(self, cursor, last_row, limit, filters):
+        """Ambil satu halaman data penjualan setelah baris terakhir (keyset pada id atau kolom urut)"""
+        conditions, params, kolom_urut, order_by = keyset_urut(URUTAN_PENJUALAN, filters, last_row, 'p.id')
+            
+        # Only these rows, used to refresh a table after a save
+        if 'ids' in filters:
+            conditions.append(f"p.id IN ({', '.join('?' * len(filters['ids']))})")
+            params.extend(filters['ids'])
+            
+        # Half-open date range on the indexed day number
+        if 'dari' in filters:
+            conditions.append("p.hari_penjualan >= ?")
+            params.append(filters['dari'])
+        if 'sampai' in filters:
+            conditions.append("p.hari_penjualan < ?")
+            params.append(filters['sampai'])
+            
+        # Medicine name search through the FTS index
+        if 'cari' in filters:
+            conditions.append("p.id_obat IN (SELECT rowid FROM obat_fts WHERE obat_fts MATCH ?)")
+            params.append(filters['cari'])
+            
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        
+        # Get data from database with JOIN
+        cursor.execute(f"""
+            SELECT p.id, o.nama_obat, pg.nama_pegawai, p.nama_pembeli, p.jumlah, 
+                   p.harga_satuan, p.total_harga, p.tanggal_penjualan{kolom_urut}
+            FROM penjualan p
+            JOIN obat o ON p.id_obat = o.id
+            JOIN pegawai pg ON p.id_pegawai = pg.id
+            {where}
+            ORDER BY {order_by}
+            LIMIT ?
+        """, params + [limit])
+        
+        return cursor.fetchall()
+        
+    def save_penjualan_row(self, cursor, row, penjualan_id=None):
+        """Simpan penjualan (id_obat, id_pegawai, pembeli, jumlah, harga_satuan, total, tanggal) dan sesuaikan stok; kembalikan id"""
+        obat_id, jumlah, tanggal = row[0], row[3], row[6]
+        hari = date_key(tanggal)
+        mutasi = []
+        
+        # The form's price may come from a stale cache, the catalog decides
+        cursor.execute("SELECT harga_jual FROM obat WHERE id = ?", (obat_id,))
+        harga_satuan = cursor.fetchone()[0]
+        row = row[:4] + (harga_satuan, jumlah * harga_satuan) + row[6:]
+        
+        if penjualan_id:  # Edit mode
+            # Return the old line to stock, then take the new one
+            cursor.execute("SELECT id_obat, jumlah, hari_penjualan FROM penjualan WHERE id = ?", (penjualan_id,))
+            obat_lama, jumlah_lama, hari_lama = cursor.fetchone()
+            mutasi.append((obat_lama, hari_lama, jumlah_lama, 'penjualan', penjualan_id))
+            
+            cursor.execute("""
+                UPDATE penjualan SET id_obat=?, id_pegawai=?, nama_pembeli=?, jumlah=?, 
+                harga_satuan=?, total_harga=?, tanggal_penjualan=?, hari_penjualan=? WHERE id=?
+            """, row + (hari, penjualan_id))
+        else:  # Add mode
+            cursor.execute("""
+                INSERT INTO penjualan (id_obat, id_pegawai, nama_pembeli, jumlah, harga_satuan, 
+                total_harga, tanggal_penjualan, hari_penjualan) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, row + (hari,))
+            penjualan_id = cursor.lastrowid
+            
+        mutasi.append((obat_id, hari, -jumlah, 'penjualan', penjualan_id))
+        
+        # Update stok obat, guarded so a concurrent sale on another till can't oversell
+        self.ubah_stok(cursor, mutasi)
+        cursor.connection.commit()
+        return penjualan_id
+        
+    def ubah_stok(self, cursor, mutasi, expired_date=None):
+        """Terapkan mutasi (id_obat, hari, perubahan, sumber, id_sumber) ke obat.stok dan catat di buku mutasi"""
+        perubahan = {}
+        for obat_id, _, jumlah, _, _ in mutasi:
+            perubahan[obat_id] = perubahan.get(obat_id, 0) + jumlah
+            
+        # Net change per obat, guarded so stock never goes below zero
+        for obat_id, jumlah in perubahan.items():
+            cursor.execute("UPDATE obat SET stok = stok + ? WHERE id = ? AND stok + ? >= 0",
+                           (jumlah, obat_id, jumlah))
+            if cursor.rowcount == 0:
+                cursor.connection.rollback()
+                # The cached stock was wrong, reload it for the error message
+                self.cache.invalidate(obat_id)
+                obat = self.get_obat(cursor, obat_id)
+                raise StokTidakCukupError(obat[3] if obat else 0)
+                
+        # obat.stok still counts expired lots, a sale may only take the unexpired ones
+        kurang = self.catat_mutasi(cursor, mutasi, expired_date)
+        if kurang:
+            cursor.connection.rollback()
+            self.cache.invalidate(*perubahan)
+            obat_id, hari = next(iter(kurang))
+            raise StokTidakCukupError(self.stok_layak(cursor, [obat_id], hari)[obat_id])
+            
+        self.cache.invalidate(*perubahan)
+        
+    def catat_mutasi(self, cursor, mutasi, expired_date=None):
+        """Tambah baris buku mutasi stok; kembalikan {(id_obat, hari): kekurangan} yang tidak tertutup lot belum expired"""
+        mutasi = [row for row in mutasi if row[2]]
+        kurang = self.ubah_lot(cursor, mutasi, expired_date)
+        cursor.executemany("""
+            INSERT INTO mutasi_stok (id_obat, hari, perubahan, sumber, id_sumber) VALUES (?, ?, ?, ?, ?)
+        """, mutasi)
+        
+        # Only backdated rows touch snapshots, usually none
+        cursor.executemany("""
+            INSERT INTO snapshot_stok (id_obat, hari, stok)
+            SELECT ?, hari, ? FROM (SELECT DISTINCT hari FROM snapshot_stok WHERE hari >= ?)
+            WHERE true
+            ON CONFLICT (id_obat, hari) DO UPDATE SET stok = stok + excluded.stok
+        """, [(obat_id, jumlah, hari) for obat_id, hari, jumlah, _, _ in mutasi])
+        return kurang
+        
+    def ubah_lot(self, cursor, mutasi, expired_date=None):
+        """Sesuaikan sisa lot: stok masuk jadi lot baru, stok keluar diambil FEFO (expired terdekat dulu)"""
+        kurang = {}
+        
+        # Incoming rows first, so an edit never runs the lots short halfway through
+        for obat_id, hari, jumlah, sumber, id_sumber in sorted(mutasi, key=lambda row: row[2] < 0):
+            if jumlah < 0:
+                sisa = self.ambil_lot(cursor, obat_id, -jumlah, sumber, id_sumber, hari)
+                if sisa and sumber == 'penjualan':
+                    kurang[(obat_id, hari)] = kurang.get((obat_id, hari), 0) + sisa
+                continue
+                
+            if sumber == 'penjualan':
+                # A sale taken back goes to the lots it came from
+                cursor.execute("SELECT id_lot, jumlah FROM alokasi_lot WHERE id_penjualan = ?", (id_sumber,))
+                alokasi = cursor.fetchall()
+                cursor.executemany("UPDATE lot_obat SET sisa = sisa + ? WHERE id = ?",
+                                   [(jumlah_lot, lot_id) for lot_id, jumlah_lot in alokasi])
+                cursor.execute("DELETE FROM alokasi_lot WHERE id_penjualan = ?", (id_sumber,))
+                
+                # Sales from before lot tracking have no allocation
+                jumlah -= sum(jumlah_lot for _, jumlah_lot in alokasi)
+                if jumlah <= 0:
+                    continue
+                    
+            tanggal = expired_date if sumber == 'pembelian' else None
+            if not tanggal:
+                cursor.execute("SELECT expired_date FROM obat WHERE id = ?", (obat_id,))
+                tanggal = cursor.fetchone()[0]
+                
+            cursor.execute("""
+                INSERT INTO lot_obat (id_obat, id_pembelian, expired_date, hari_expired, jumlah_awal, sisa)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, (obat_id, id_sumber if sumber == 'pembelian' else None, tanggal, date_key(tanggal),
+                  jumlah, jumlah))
+            
+        return kurang
+        
+    def ambil_lot(self, cursor, obat_id, jumlah, sumber, id_sumber, hari=None):
+        """Kurangi sisa lot sebanyak jumlah; penjualan dicatat per lot di alokasi_lot. Kembalikan jumlah yang tidak tertutup"""
+        kandidat = []
+        if sumber == 'pembelian':
+            # A purchase taken back empties its own lot first
+            cursor.execute("""
+                SELECT id, sisa FROM lot_obat WHERE id_pembelian = ? AND id_obat = ? AND sisa > 0 ORDER BY id
+            """, (id_sumber, obat_id))
+            kandidat += cursor.fetchall()
+            
+        if sumber == 'penjualan':
+            # Lots expired by the sale date stay on the shelf for the expiry sweep
+            cursor.execute("""
+                SELECT id, sisa FROM lot_obat
+                WHERE id_obat = ? AND sisa > 0 AND (hari_expired IS NULL OR hari_expired > ?)
+                ORDER BY hari_expired, id
+            """, (obat_id, hari))
+        else:
+            cursor.execute("""
+                SELECT id, sisa FROM lot_obat WHERE id_obat = ? AND sisa > 0 ORDER BY hari_expired, id
+            """, (obat_id,))
+        kandidat += cursor.fetchall()
+        
+        diambil = {}
+        for lot_id, sisa in kandidat:
+            if jumlah == 0:
+                break
+            if lot_id in diambil:
+                continue
+            diambil[lot_id] = min(sisa, jumlah)
+            jumlah -= diambil[lot_id]
+            
+        cursor.executemany("UPDATE lot_obat SET sisa = sisa - ? WHERE id = ?",
+                           [(ambil, lot_id) for lot_id, ambil in diambil.items()])
+        if sumber == 'penjualan':
+            cursor.executemany("INSERT INTO alokasi_lot (id_penjualan, id_lot, jumlah) VALUES (?, ?, ?)",
+                               [(id_sumber, lot_id, ambil) for lot_id, ambil in diambil.items()])
+        return jumlah
+        
+    def stok_layak(self, cursor, obat_ids, hari):
+        """Stok yang boleh dijual pada hari tersebut per id obat: sisa lot yang belum expired"""
+        placeholders = ', '.join('?' * len(obat_ids))
+        cursor.execute(f"""
+            SELECT id_obat, SUM(sisa) FROM lot_obat
+            WHERE id_obat IN ({placeholders}) AND sisa > 0 AND (hari_expired IS NULL OR hari_expired > ?)
+            GROUP BY id_obat
+        """, list(obat_ids) + [hari])
+        layak = dict.fromkeys(obat_ids, 0)
+        layak.update(cursor.fetchall())
+        return layak
+        
+    def fetch_lot_kedaluwarsa(self, cursor, sampai_hari):
+        """Lot yang masih ada sisanya dan expired sebelum/pada sampai_hari, expired terdekat dulu"""
+        # sisa > 0 matches the partial index, so only lots on the shelf are read
+        cursor.execute("""
+            SELECT l.id, o.nama_obat, l.expired_date, l.sisa, l.hari_expired
+            FROM lot_obat l
+            JOIN obat o ON o.id = l.id_obat
+            WHERE l.sisa > 0 AND l.hari_expired <= ?
+            ORDER BY l.hari_expired, l.id
+        """, (sampai_hari,))
+        
+        return cursor.fetchall()
+        
+    def stok_per_tanggal(self, cursor, hari):
+        """Stok semua obat pada akhir hari: snapshot terdekat sebelumnya + mutasi sesudahnya"""
+        cursor.execute("SELECT MAX(hari) FROM snapshot_stok WHERE hari <= ?", (hari,))
+        dasar = cursor.fetchone()[0] or 0
+        
+        cursor.execute("""
+            SELECT o.id, o.nama_obat, COALESCE(s.stok, 0) + COALESCE(m.perubahan, 0)
+            FROM obat o
+            LEFT JOIN snapshot_stok s ON s.id_obat = o.id AND s.hari = ?
+            LEFT JOIN (
+                SELECT id_obat, SUM(perubahan) AS perubahan FROM mutasi_stok
+                WHERE hari > ? AND hari <= ?
+                GROUP BY id_obat
+            ) m ON m.id_obat = o.id
+            ORDER BY o.nama_obat
+        """, (dasar, dasar, hari))
+        
+        return cursor.fetchall()
+        
+    def buat_snapshot_stok(self, cursor, hari):
+        """Simpan stok semua obat pada akhir hari sebagai snapshot"""
+        cursor.executemany("INSERT OR REPLACE INTO snapshot_stok (id_obat, hari, stok) VALUES (?, ?, ?)",
+                           [(obat_id, hari, stok) for obat_id, _, stok in self.stok_per_tanggal(cursor, hari)])
+        cursor.connection.commit()
+        
+    def snapshot_stok_terjadwal(self, cursor):
+        """Buat snapshot hari ini jika snapshot terakhir sudah SNAPSHOT_INTERVAL hari atau lebih"""
+        hari_ini = datetime.now().toordinal()
+        cursor.execute("SELECT MAX(hari) FROM snapshot_stok")
+        terakhir = cursor.fetchone()[0]
+        
+        if terakhir is None or hari_ini - terakhir >= SNAPSHOT_INTERVAL:
+            self.buat_snapshot_stok(cursor, hari_ini)
+            
+    def checkout_keranjang(self, cursor, pegawai_id, nama_pembeli, tanggal, items):
+        """Simpan semua item keranjang (id_obat, jumlah, harga_satuan) dan kurangi stok dalam satu transaksi"""
+        # Same medicine on several lines is checked against stock as one total
+        diminta = {}
+        for obat_id, jumlah, harga_satuan in items:
+            diminta[obat_id] = diminta.get(obat_id, 0) + jumlah
+            
+        # Prices shown in the cart may come from a stale cache, the catalog decides
+        placeholders = ', '.join('?' * len(diminta))
+        cursor.execute(f"SELECT id, harga_jual FROM obat WHERE id IN ({placeholders})", list(diminta))
+        harga = dict(cursor.fetchall())
+        
+        # An obat deleted after it went into the cart has nothing left to sell
+        hilang = set(diminta) - set(harga)
+        if hilang:
+            self.cache.invalidate(*hilang)
+            raise KeranjangStokError([(f"Obat ID {obat_id} (sudah dihapus)", diminta[obat_id], 0)
+                                      for obat_id in sorted(hilang)])
+        items = [(obat_id, jumlah, harga[obat_id]) for obat_id, jumlah, _ in items]
+        
+        # Guarded decrements: a line short on stock matches no row
+        cursor.executemany("UPDATE obat SET stok = stok - ? WHERE id = ? AND stok >= ?",
+                           [(jumlah, obat_id, jumlah) for obat_id, jumlah in diminta.items()])
+        if cursor.rowcount != len(diminta):
+            cursor.connection.rollback()
+            
+            # Reload current stock into the cache and report every short line
+            cursor.execute(f"""
+                SELECT id, nama_obat, harga_jual, stok, expired_date FROM obat WHERE id IN ({placeholders})
+            """, list(diminta))
+            rows = cursor.fetchall()
+            self.cache.put(rows)
+            kurang = [(row[1], diminta[row[0]], row[3]) for row in rows if row[3] < diminta[row[0]]]
+            raise KeranjangStokError(kurang)
+            
+        hari = date_key(tanggal)
+        penjualan_ids = []
+        for obat_id, jumlah, harga_satuan in items:
+            cursor.execute("""
+                INSERT INTO penjualan (id_obat, id_pegawai, nama_pembeli, jumlah, harga_satuan, 
+                total_harga, tanggal_penjualan, hari_penjualan) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, (obat_id, pegawai_id, nama_pembeli, jumlah, harga_satuan, jumlah * harga_satuan, tanggal, hari))
+            penjualan_ids.append(cursor.lastrowid)
+            
+        kurang = self.catat_mutasi(cursor, [(obat_id, hari, -jumlah, 'penjualan', penjualan_id)
+                                            for (obat_id, jumlah, _), penjualan_id in zip(items, penjualan_ids)])
+        if kurang:
+            # Enough on the shelf, but part of it is expired
+            cursor.connection.rollback()
+            self.cache.invalidate(*diminta)
+            layak = self.stok_layak(cursor, list(diminta), hari)
+            cursor.execute(f"SELECT id, nama_obat FROM obat WHERE id IN ({placeholders})", list(diminta))
+            raise KeranjangStokError([(nama, diminta[obat_id], layak[obat_id])
+                                      for obat_id, nama in cursor.fetchall() if (obat_id, hari) in kurang])
+            
+        cursor.connection.commit()
+        self.cache.invalidate(*diminta)
+        return penjualan_ids, sum(jumlah * harga_satuan for _, jumlah, harga_satuan in items)
+        
+    def delete_penjualan_row(self, cursor, penjualan_id):
+        """Hapus satu baris penjualan dari database dan kembalikan stoknya"""
+        cursor.execute("SELECT id_obat, jumlah, hari_penjualan FROM penjualan WHERE id = ?", (penjualan_id,))
+        obat_id, jumlah, hari = cursor.fetchone()
+        
+        cursor.execute("DELETE FROM penjualan WHERE id = ?", (penjualan_id,))
+        self.ubah_stok(cursor, [(obat_id, hari, jumlah, 'penjualan', penjualan_id)])
+        cursor.connection.commit()
+
+class DatabaseWorker:
+    """Thread khusus untuk semua akses SQLite, hasilnya dikembalikan lewat Future"""
+    
+    def __init__(self, repo, read_only=False, name='DatabaseWorker'):
+        self.repo = repo
+        self.read_only = read_only
+        self.requests = queue.Queue()
+        self.thread = threading.Thread(target=self.run, name=name, daemon=True)
+        self.thread.start()
+        
+    def run(self):
+        """Loop worker: jalankan func(cursor, *args) satu per satu sesuai antrian"""
+        conn = self.repo.connect(self.read_only)
+        cursor = conn.cursor()
+        
+        while True:
+            job = self.requests.get()
+            if job is None:
+                break
+                
+            future, func, args = job
+            if not future.set_running_or_notify_cancel():
+                continue
+                
+            try:
+                future.set_result(self.execute(conn, cursor, func, args))
+            except Exception as e:
+                future.set_exception(e)
+                
+        conn.close()
+        
+    def execute(self, conn, cursor, func, args):
+        """Jalankan satu job, ulangi dengan backoff jika database dikunci terminal lain"""
+        # Re-running a job that already committed part of its work would repeat that part
+        retries = 0 if getattr(func, 'commit_bertahap', False) else LOCK_RETRIES
+        try:
+            return ulangi_jika_terkunci(conn, func, cursor, *args, retries=retries)
+        finally:
+            # The job's last query has no next execute to record it
+            cursor.selesai()
+            conn.selesai()
+        
+    def submit(self, func, *args):
+        """Masukkan job ke antrian dan kembalikan Future untuk hasilnya"""
+        future = Future()
+        self.requests.put((future, func, args))
+        return future
+        
+    def stop(self, timeout=5):
+        """Selesaikan job yang tersisa lalu hentikan worker"""
+        self.requests.put(None)
+        self.thread.join(timeout)
+
+class BackupWorker:
+    """Thread backup online: menyalin database lewat koneksi penulis DatabaseWorker tanpa menahan kasir"""
+    
+    def __init__(self, repo, db, folder=BACKUP_DIR, simpan=BACKUP_SIMPAN):
+        self.repo = repo
+        self.db = db
+        self.folder = folder
+        self.simpan = simpan
+        self.batal = threading.Event()
+        self.requests = queue.Queue()
+        self.thread = threading.Thread(target=self.run, name='BackupWorker', daemon=True)
+        self.thread.start()
+        
+    def run(self):
+        """Loop worker: jalankan backup satu per satu sesuai antrian"""
+        # The writer thread hands over its connection, see ApotekRepository.backup_database
+        conn = self.db.submit(lambda cursor: cursor.connection).result()
+        
+        while True:
+            future = self.requests.get()
+            if future is None:
+                break
+            if not future.set_running_or_notify_cancel():
+                continue
+                
+            try:
+                future.set_result(self.repo.backup_database(conn, self.folder, self.simpan, self.batal))
+            except Exception as e:
+                future.set_exception(e)
+                
+    def submit(self):
+        """Minta satu backup dan kembalikan Future untuk hasilnya"""
+        future = Future()
+        self.requests.put(future)
+        return future
+        
+    def stop(self):
+        """Batalkan backup yang sedang berjalan dan tunggu thread-nya selesai memakai koneksi penulis"""
+        self.batal.set()
+        self.requests.put(None)
+        # No timeout: the writer's connection may only close once the backup has let go of it
+        self.thread.join()
+
+def put_tree_row(tree, values, index='end'):
+    """Update baris treeview yang sudah ada (iid = id baris) atau insert baris baru"""
+    iid = str(values[0])
+    if tree.exists(iid):
+        tree.item(iid, values=values)
+    else:
+        tree.insert('', index, iid=iid, values=values)
+
+class TreePager:
+    """Tabel virtual: memuat isi treeview per halaman dengan keyset pagination"""
+    
+    def __init__(self, tree, scrollbar, fetch_page, run_db, page_size=PAGE_SIZE, ranked_search=False):
+        self.tree = tree
+        self.scrollbar = scrollbar
+        self.fetch_page = fetch_page
+        self.run_db = run_db
+        self.page_size = page_size
+        # fetch_page orders 'cari' results by rank (last column) instead of id
+        self.ranked_search = ranked_search
+        self.last_row = None
+        self.done = False
+        self.loading = False
+        self.generation = 0
+        self.filters = {}
+        self.sort_columns = {}
+        self.sort_keys = {}
+        
+        tree.configure(yscrollcommand=self.on_scroll)
+        
+    def enable_sort(self, columns):
+        """Header kolom di columns bisa diklik untuk mengurutkan di database, header ID kembali ke default"""
+        self.sort_columns = columns
+        for column in columns:
+            self.tree.heading(column, command=lambda c=column: self.sort_by(c))
+        self.tree.heading('ID', command=lambda: self.sort_by(None))
+        
+    def sort_by(self, column):
+        """Urutkan naik menurut column, klik kedua menurun; None kembali ke urutan default"""
+        menurun = self.filters.get('urut') == (column, False)
+        for judul in self.sort_columns:
+            self.tree.heading(judul, text=judul)
+            
+        if column is None:
+            self.filters.pop('urut', None)
+        else:
+            self.filters['urut'] = (column, menurun)
+            self.tree.heading(column, text=f"{column} {'▼' if menurun else '▲'}")
+        self.reset()
+        
+    def sort_order(self):
+        """Arah urutan menurut kolom terakhir (True = menurun), None jika tabel urut id terbaru dulu"""
+        if 'urut' in self.filters:
+            return self.filters['urut'][1]
+        if self.ranked_search and 'cari' in self.filters:
+            return False
+        return None
+        
+    def reset(self):
+        """Kosongkan tabel lalu muat halaman pertama"""
+        self.tree.delete(*self.tree.get_children())
+        self.sort_keys.clear()
+        self.last_row = None
+        self.done = False
+        self.loading = False
+        self.generation += 1
+        self.load_next_page()
+        
+    def on_scroll(self, first, last):
+        """Update scrollbar dan muat halaman berikutnya jika mendekati akhir"""
+        self.scrollbar.set(first, last)
+        if float(last) >= PREFETCH_THRESHOLD:
+            self.load_next_page()
+            
+    def load_next_page(self):
+        """Minta halaman berikutnya setelah baris terakhir yang sudah dimuat"""
+        if self.done or self.loading:
+            return
+            
+        self.loading = True
+        generation = self.generation
+        self.run_db(self.fetch_page, self.last_row, self.page_size, dict(self.filters),
+                    on_success=lambda rows: self.add_page(rows, generation),
+                    on_error=lambda e: self.page_failed(e, generation))
+        
+    def add_page(self, rows, generation):
+        """Masukkan hasil satu halaman ke treeview"""
+        # Ignore pages requested before the last reset or after the screen closed
+        if generation != self.generation or not self.tree.winfo_exists():
+            return
+            
+        self.loading = False
+        for row in rows:
+            put_tree_row(self.tree, row)
+            
+        # Sort value (or search rank) travels at the end of each row, see keyset_urut
+        if self.sort_order() is not None:
+            for row in rows:
+                self.sort_keys[str(row[0])] = (row[-1], row[0])
+            
+        if rows:
+            self.last_row = rows[-1]
+        self.done = len(rows) < self.page_size
+        
+    def refresh_rows(self, row_ids):
+        """Muat ulang hanya baris yang baru disimpan, tanpa membangun ulang tabel"""
+        generation = self.generation
+        self.run_db(self.fetch_page, None, len(row_ids), dict(self.filters, ids=list(row_ids)),
+                    on_success=lambda rows: self.apply_rows(row_ids, rows, generation))
+        
+    def apply_rows(self, row_ids, rows, generation):
+        """Tampilkan hasil refresh_rows: update, insert di atas, atau hapus jika tidak lolos filter"""
+        if generation != self.generation or not self.tree.winfo_exists():
+            return
+            
+        found = {row[0] for row in rows}
+        for row_id in row_ids:
+            if row_id not in found:
+                self.remove_row(row_id)
+                
+        # Sorted and ranked tables place rows by their last column, ids say nothing there
+        if self.sort_order() is not None:
+            for row in rows:
+                self.place_sorted(row)
+            return
+            
+        # Oldest first so the newest row ends up on top (table is ordered by id DESC)
+        for row in reversed(rows):
+            # Rows past the last loaded page arrive with a later page
+            if self.tree.exists(str(row[0])) or not self.last_row or row[0] > self.last_row[0]:
+                put_tree_row(self.tree, row, 0)
+                
+    def place_sorted(self, row):
+        """Pindahkan atau sisipkan baris hasil refresh ke posisinya menurut kolom urut atau rank"""
+        menurun = self.sort_order()
+        key = (row[-1], row[0])
+        
+        def before(a, b):
+            return a > b if menurun else a < b
+            
+        self.remove_row(row[0])
+        # Rows sorting past the last loaded page arrive with a later page
+        if self.last_row and not self.done and not before(key, (self.last_row[-1], self.last_row[0])):
+            return
+            
+        index = sum(1 for iid in self.tree.get_children() if before(self.sort_keys[iid], key))
+        self.sort_keys[str(row[0])] = key
+        put_tree_row(self.tree, row, index)
+        
+    def remove_row(self, row_id):
+        """Hapus satu baris dari treeview"""
+        self.sort_keys.pop(str(row_id), None)
+        if self.tree.exists(str(row_id)):
+            self.tree.delete(str(row_id))
+            
+    def page_failed(self, error, generation):
+        """Tampilkan error dan izinkan halaman dimuat ulang"""
+        if generation == self.generation:
+            self.loading = False
+        messagebox.showerror("Error", f"Terjadi kesalahan: {str(error)}")
+
+class ObatPicker:
+    """Combobox obat typeahead: cari prefix nama di database sambil mengetik, tampilkan N teratas"""
+    
+    def __init__(self, combo, fetch_options, run_db, in_stock=False, with_harga=False):
+        self.combo = combo
+        self.fetch_options = fetch_options
+        self.run_db = run_db
+        self.in_stock = in_stock
+        self.with_harga = with_harga
+        self.pending = None
+        self.generation = 0
+        
+        combo.bind('<KeyRelease>', self.on_key)
+        
+        # First N names, read straight from the index
+        self.search()
+        
+    def format_option(self, row):
+        """Teks pilihan: 'id - nama' (pembelian) atau dengan harga dan stok (penjualan)"""
+        if self.with_harga:
+            return f"{row[0]} - {row[1]} (Rp {row[2]:,.0f}) - Stok: {row[3]}"
+        return f"{row[0]} - {row[1]}"
+        
+    def on_key(self, event):
+        """Debounce ketikan sebelum query ke database"""
+        if event.keysym in ('Up', 'Down', 'Return', 'Escape', 'Tab'):
+            return
+            
+        if self.pending:
+            self.combo.after_cancel(self.pending)
+        self.pending = self.combo.after(SEARCH_DEBOUNCE, self.search)
+        
+    def search(self):
+        """Ambil pilihan obat untuk teks yang sedang diketik"""
+        self.pending = None
+        self.generation += 1
+        generation = self.generation
+        self.run_db(self.fetch_options, self.combo.get(), self.in_stock,
+                    on_success=lambda rows: self.show_options(rows, generation))
+        
+    def show_options(self, rows, generation):
+        """Isi dropdown, abaikan hasil dari ketikan yang sudah lewat"""
+        if generation != self.generation or not self.combo.winfo_exists():
+            return
+        self.combo['values'] = [self.format_option(row) for row in rows]
+        
+    def select_name(self, nama):
+        """Pilih obat dengan nama persis ini (mode edit)"""
+        def select(rows):
+            if not self.combo.winfo_exists():
+                return
+            for row in rows:
+                if row[1] == nama:
+                    self.combo.set(self.format_option(row))
+                    break
+                    
+        self.run_db(self.fetch_options, nama, on_success=select)
 
 class ApotekSystem:
-    def __init__(self, root):
+    def __init__(self, root, multi_terminal=False, db_path=DB_PATH, stats=None, startup=None,
+                 backup_interval=BACKUP_INTERVAL, backup_dir=BACKUP_DIR):
+        # Startup phases are always measured, only printed when a profile is passed in
+        self.startup = startup or StartupProfile()
+        self.print_startup = startup is not None
+        
         self.root = root
         self.root.title("Sistem Informasi Apotek")
         self.root.geometry("1200x800")
         self.root.configure(bg='#f0f8ff')
         
-        # Setup database
-        self.setup_database()
+        # Database worker, all SQLite access runs on its thread
+        self.repo = ApotekRepository(db_path, multi_terminal, stats)
+        self.db = DatabaseWorker(self.repo)
+        self.pending_jobs = []
+        self.recent_limit = RECENT_TRANSACTIONS_LIMIT
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        
+        # Built screens are kept and only hidden, see open_screen
+        self.screens = {}
+        self.screen_refresh = {}
+        self.screen_versions = {}
+        self.current_screen = None
+        self.write_count = 0
+        
+        # Setup database (queued first, so every later job sees the tables)
+        setup = self.run_db(self.startup.timed('skema database (worker)', self.repo.setup_database),
+                            write=True)
+        
+        if multi_terminal:
+            # Separate read connection so screen loads never queue behind writes
+            self.db_read = DatabaseWorker(self.repo, read_only=True, name='DatabaseReader')
+            # Reads wait until the schema is migrated
+            self.db_read.submit(lambda cursor: setup.exception())
+        else:
+            self.db_read = self.db
+            
+        # CSV exports get their own read connection on first use, so even in
+        # single-terminal mode they never hold up the worker screens and sales use
+        self.db_export = None
+        
+        # Online backups run on their own thread, scheduled once startup is done
+        self.backup = BackupWorker(self.repo, self.db, backup_dir)
+        self.backup_interval = backup_interval
         
         # Style configuration
         self.setup_styles()
         
         # Create main interface
         self.create_main_interface()
+        self.startup.mark('antarmuka utama')
         
-    def setup_database(self):
-        """Setup database dan tabel"""
-        self.conn = sqlite3.connect('apotek.db')
-        self.cursor = self.conn.cursor()
-        
-        # Tabel Obat
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS obat (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                nama_obat TEXT NOT NULL,
-                kategori TEXT NOT NULL,
-                harga_beli REAL NOT NULL,
-                harga_jual REAL NOT NULL,
-                stok INTEGER NOT NULL,
-                expired_date TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # Tabel Pegawai
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS pegawai (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                nama_pegawai TEXT NOT NULL,
-                jabatan TEXT NOT NULL,
-                alamat TEXT NOT NULL,
-                telepon TEXT NOT NULL,
-                gaji REAL NOT NULL,
-                tanggal_masuk TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # Tabel Pembelian
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS pembelian (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                id_obat INTEGER NOT NULL,
-                nama_supplier TEXT NOT NULL,
-                jumlah INTEGER NOT NULL,
-                harga_satuan REAL NOT NULL,
-                total_harga REAL NOT NULL,
-                tanggal_pembelian TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (id_obat) REFERENCES obat (id)
-            )
-        ''')
-        
-        # Tabel Penjualan
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS penjualan (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                id_obat INTEGER NOT NULL,
-                id_pegawai INTEGER NOT NULL,
-                nama_pembeli TEXT NOT NULL,
-                jumlah INTEGER NOT NULL,
-                harga_satuan REAL NOT NULL,
-                total_harga REAL NOT NULL,
-                tanggal_penjualan TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (id_obat) REFERENCES obat (id),
-                FOREIGN KEY (id_pegawai) REFERENCES pegawai (id)
-            )
-        ''')
+        # Start polling results from the database worker
+        self.poll_db_results()
+        
+    def start_dashboard(self):
+        """Bangun dashboard setelah jendela kosong tampil, lalu muat datanya di background"""
+        # Draw the header and menu before building the first screen
+        self.root.update_idletasks()
+        self.startup.mark('jendela tampil')
         
-        self.conn.commit()
+        # The user may already have opened another screen
+        if self.current_screen is None:
+            self.show_dashboard()
+            self.startup.mark('layar dashboard')
+            
+        # Jobs run in order, so this one finishes after the dashboard queries
+        self.run_db(lambda cursor: None, on_success=self.finish_startup)
+        
+    def finish_startup(self, _):
+        """Startup selesai: jadwalkan snapshot stok dan cetak profil startup jika diminta"""
+        self.startup.mark('data dashboard')
+        if self.print_startup:
+            self.startup.report()
+            
+        # Snapshotting may scan every lot, keep it behind the first dashboard load
+        self.run_db(self.repo.snapshot_stok_terjadwal, write=True)
+        
+        # An in-memory database has no file to back up; the button still explains why
+        if self.backup_interval and self.repo.db_path != ':memory:':
+            self.root.after(int(self.backup_interval * 60000), self.scheduled_backup)
+            
+    def run_backup(self, on_success=None):
+        """Jalankan backup online di BackupWorker, hasilnya lewat callback seperti job database"""
+        future = self.backup.submit()
+        self.pending_jobs.append((future, on_success, self.show_backup_error))
+        self.update_loading_indicator()
+        
+    def scheduled_backup(self):
+        """Backup terjadwal tiap backup_interval menit, hanya gagal yang ditampilkan"""
+        self.run_backup()
+        self.root.after(int(self.backup_interval * 60000), self.scheduled_backup)
+        
+    def backup_now(self):
+        """Backup online sekarang dan tampilkan hasilnya"""
+        def on_done(hasil):
+            path, halaman, detik = hasil
+            messagebox.showinfo("Sukses", f"Backup {halaman:,} halaman selesai dalam {detik:.1f} detik "
+                                          f"dan lolos integrity_check:\n{path}")
+            
+        self.run_backup(on_success=on_done)
+        
+    def show_backup_error(self, error):
+        """Tampilkan error backup online"""
+        messagebox.showerror("Error", f"Backup gagal: {str(error)}")
+        
+    def run_db(self, func, *args, on_success=None, on_error=None, write=False, count=True, worker=None):
+        """Jalankan func(cursor, *args) di worker database tanpa memblokir UI"""
+        # count=False: a writer job that changes nothing on screen (e.g. filling the report cache).
+        # worker: run on another worker (e.g. export_worker()) instead of the read/write pair
+        worker = worker or (self.db if write else self.db_read)
+        future = worker.submit(func, *args)
+        if write and count:
+            future.add_done_callback(self.count_write)
+        self.pending_jobs.append((future, on_success, on_error or self.show_db_error))
+        self.update_loading_indicator()
+        return future
+        
+    def export_worker(self):
+        """Worker baca khusus export CSV, dibuat saat export pertama"""
+        # A second connection to ':memory:' would open a new, empty database
+        if self.repo.db_path == ':memory:':
+            return self.db_read
+        if self.db_export is None:
+            self.db_export = DatabaseWorker(self.repo, read_only=True, name='DatabaseExport')
+        return self.db_export
+        
+    def poll_db_results(self):
+        """Jalankan callback untuk job database yang sudah selesai"""
+        jobs, self.pending_jobs = self.pending_jobs, []
+        
+        for job in jobs:
+            if not job[0].done():
+                self.pending_jobs.append(job)
+                continue
+                
+            try:
+                self.finish_db_job(*job)
+            except Exception:
+                # Keep polling even if one callback fails
+                self.root.report_callback_exception(*sys.exc_info())
+                
+        self.update_loading_indicator()
+        self.root.after(DB_POLL_INTERVAL, self.poll_db_results)
+        
+    def finish_db_job(self, future, on_success, on_error):
+        """Teruskan hasil atau error job database ke callback-nya"""
+        try:
+            result = future.result()
+        except Exception as e:
+            on_error(e)
+        else:
+            if on_success:
+                on_success(result)
+                
+    def update_loading_indicator(self):
+        """Tampilkan indikator loading selama masih ada job database"""
+        if hasattr(self, 'loading_label'):
+            self.loading_label.configure(text="⏳ Memuat..." if self.pending_jobs else "")
+            
+    def show_db_error(self, error):
+        """Tampilkan error dari worker database"""
+        messagebox.showerror("Error", f"Terjadi kesalahan: {str(error)}")
+        
+    def on_close(self):
+        """Tunggu job database selesai sebelum menutup aplikasi"""
+        # The backup reads through the writer's connection, so it is cancelled and joined first
+        self.backup.stop()
+        if self.db_read is not self.db:
+            self.db_read.stop()
+        if self.db_export:
+            self.db_export.stop()
+        self.db.stop()
+        self.root.destroy()
         
     def setup_styles(self):
         """Setup styling untuk UI"""
@@ -119,7 +2817,8 @@ class ApotekSystem:
             ("💊 Data Obat", self.show_obat, '#e74c3c'),
             ("👥 Data Pegawai", self.show_pegawai, '#2ecc71'),
             ("📦 Pembelian", self.show_pembelian, '#f39c12'),
-            ("💰 Penjualan", self.show_penjualan, '#9b59b6')
+            ("💰 Penjualan", self.show_penjualan, '#9b59b6'),
+            ("📈 Laporan", self.show_laporan, '#1abc9c')
         ]
         
         for i, (text, command, color) in enumerate(menu_buttons):
@@ -132,12 +2831,17 @@ class ApotekSystem:
             btn.bind('<Enter>', lambda e, b=btn, c=color: self.on_button_enter(b, c))
             btn.bind('<Leave>', lambda e, b=btn, c=color: self.on_button_leave(b, c))
         
+        # Loading indicator for background database jobs
+        self.loading_label = tk.Label(menu_frame, text="", font=('Arial', 11, 'bold'),
+                                      bg='#f0f8ff', fg='#7f8c8d')
+        self.loading_label.pack(side='right', padx=5)
+        
         # Content frame
         self.content_frame = tk.Frame(self.root, bg='#f0f8ff')
         self.content_frame.pack(fill='both', expand=True, padx=20, pady=10)
         
-        # Show dashboard by default
-        self.show_dashboard()
+        # Show dashboard by default, once the window itself is on screen
+        self.root.after_idle(self.start_dashboard)
         
     def on_button_enter(self, button, color):
         """Hover effect untuk button"""
@@ -154,37 +2858,139 @@ class ApotekSystem:
             '#e74c3c': '#ec7063',
             '#2ecc71': '#58d68d',
             '#f39c12': '#f8c471',
-            '#9b59b6': '#bb8fce'
+            '#9b59b6': '#bb8fce',
+            '#1abc9c': '#48c9b0'
         }
         return color_map.get(color, color)
         
-    def clear_content(self):
-        """Membersihkan content frame"""
-        for widget in self.content_frame.winfo_children():
-            widget.destroy()
+    def open_screen(self, name):
+        """Tampilkan layar name tanpa menghancurkan layar aktif; kembalikan frame kosong jika belum pernah dibangun"""
+        # A screen that is already built returns None and reloads only if the database changed
+        # since it was last shown
+        if self.current_screen and self.current_screen != name:
+            self.screens[self.current_screen].pack_forget()
+        self.current_screen = name
+        
+        frame = self.screens.get(name)
+        built = frame is not None
+        if not built:
+            frame = self.screens[name] = tk.Frame(self.content_frame, bg='#f0f8ff')
+        frame.pack(fill='both', expand=True)
+        
+        # Writes finishing after this point bump the counter, so they are never missed
+        write_count = self.write_count
+        
+        def on_version(data_version):
+            # Other connections' commits show up in data_version, this app's own writes in write_count
+            version = (data_version, write_count)
+            if built and self.screen_versions.get(name) != version:
+                self.screen_refresh[name]()
+            self.screen_versions[name] = version
             
+        self.check_data_version(on_version)
+        return None if built else frame
+        
+    def check_data_version(self, on_success=None):
+        """Baca PRAGMA data_version di koneksi tulis; cache katalog dikosongkan jika terminal lain commit"""
+        # The writer's own commits never move its data_version, so uncounted writes
+        # (report cache fills) don't make cached screens reload
+        self.run_db(self.repo.data_version, on_success=on_success, write=True, count=False)
+        
+    def count_write(self, future):
+        """Hitung job tulis yang selesai (versi lokal data untuk layar yang di-cache)"""
+        self.write_count += 1
+        
+    @timed_screen
     def show_dashboard(self):
         """Menampilkan dashboard"""
-        self.clear_content()
+        frame = self.open_screen('dashboard')
+        if frame is None:
+            return
         
         # Dashboard title
-        title = tk.Label(self.content_frame, text="📊 Dashboard", 
+        title = tk.Label(frame, text="📊 Dashboard", 
                         font=('Arial', 18, 'bold'), bg='#f0f8ff', fg='#2c3e50')
         title.pack(pady=(0, 20))
         
+        # Button frame
+        btn_frame = tk.Frame(frame, bg='#f0f8ff')
+        btn_frame.pack(fill='x')
+        
+        tk.Button(btn_frame, text="🔄 Cek Statistik", command=self.verify_dashboard_stats,
+                 font=('Arial', 10, 'bold'), bg='#3498db', fg='white',
+                 relief='flat', padx=20, pady=5).pack(side='right', padx=5)
+        
+        tk.Button(btn_frame, text="🩺 Diagnostik", command=self.show_diagnostik,
+                 font=('Arial', 10, 'bold'), bg='#7f8c8d', fg='white',
+                 relief='flat', padx=20, pady=5).pack(side='right', padx=5)
+        
+        tk.Button(btn_frame, text="💾 Backup Sekarang", command=self.backup_now,
+                 font=('Arial', 10, 'bold'), bg='#27ae60', fg='white',
+                 relief='flat', padx=20, pady=5).pack(side='right', padx=5)
+        
         # Stats frame
-        stats_frame = tk.Frame(self.content_frame, bg='#f0f8ff')
-        stats_frame.pack(fill='x', pady=10)
+        self.stats_frame = tk.Frame(frame, bg='#f0f8ff')
+        self.stats_frame.pack(fill='x', pady=10)
+        
+        # Recent transactions
+        recent_frame = tk.Frame(frame, bg='white', relief='raised', bd=2)
+        recent_frame.pack(fill='both', expand=True, pady=20)
+        
+        recent_header = tk.Frame(recent_frame, bg='white')
+        recent_header.pack(fill='x', pady=10)
+        
+        tk.Label(recent_header, text="📋 Transaksi Terakhir", 
+                font=('Arial', 14, 'bold'), bg='white').pack(side='left', expand=True)
+        
+        # Number of rows to show
+        limit_var = tk.IntVar(value=self.recent_limit)
+        tk.Spinbox(recent_header, from_=5, to=100, increment=5, width=5, textvariable=limit_var,
+                   font=('Arial', 10), command=lambda: self.set_recent_limit(limit_var.get())
+                   ).pack(side='right', padx=10)
+        tk.Label(recent_header, text="Tampilkan:", font=('Arial', 10, 'bold'),
+                bg='white').pack(side='right')
+        
+        # Recent transactions table
+        columns = ('Tanggal', 'Jenis', 'Obat', 'Jumlah', 'Total')
+        self.recent_tree = ttk.Treeview(recent_frame, columns=columns, show='headings', height=10)
+        
+        for col in columns:
+            self.recent_tree.heading(col, text=col)
+            self.recent_tree.column(col, width=150)
+        
+        # Scrollbar
+        scrollbar = ttk.Scrollbar(recent_frame, orient='vertical', command=self.recent_tree.yview)
+        self.recent_tree.configure(yscrollcommand=scrollbar.set)
+        
+        self.recent_tree.pack(side='left', fill='both', expand=True, padx=10, pady=10)
+        scrollbar.pack(side='right', fill='y', pady=10)
+        
+        # Load statistics and recent transactions
+        self.screen_refresh['dashboard'] = self.refresh_dashboard
+        self.refresh_dashboard()
         
-        # Get statistics
-        stats = self.get_statistics()
+    def refresh_dashboard(self):
+        """Muat ulang kartu statistik dan transaksi terakhir di background"""
+        self.run_db(self.repo.get_statistics, on_success=self.show_statistics)
+        self.load_recent_transactions()
         
+    def show_statistics(self, stats):
+        """Menampilkan kartu statistik dashboard"""
+        stats_frame = self.stats_frame
+        if not stats_frame.winfo_exists():
+            return
+            
+        # Replace the cards from the previous refresh
+        for widget in stats_frame.winfo_children():
+            widget.destroy()
+            
         # Stats cards
         stats_data = [
             ("Total Obat", stats['total_obat'], '#e74c3c'),
             ("Total Pegawai", stats['total_pegawai'], '#2ecc71'),
             ("Pembelian Bulan Ini", stats['pembelian_bulan'], '#f39c12'),
-            ("Penjualan Bulan Ini", stats['penjualan_bulan'], '#9b59b6')
+            ("Penjualan Bulan Ini", stats['penjualan_bulan'], '#9b59b6'),
+            ("Pendapatan Bulan Ini", f"Rp {stats['pendapatan_bulan']:,.0f}", '#1abc9c')
         ]
         
         for i, (label, value, color) in enumerate(stats_data):
@@ -196,95 +3002,469 @@ class ApotekSystem:
             tk.Label(card, text=label, font=('Arial', 12), 
                     bg=color, fg='white').pack(pady=5)
         
-        # Recent transactions
-        recent_frame = tk.Frame(self.content_frame, bg='white', relief='raised', bd=2)
-        recent_frame.pack(fill='both', expand=True, pady=20)
+    def show_diagnostik(self):
+        """Tampilkan p50/p95/p99 durasi per bentuk query dan per layar sejak aplikasi dibuka"""
+        stats = self.repo.stats
+        window = tk.Toplevel(self.root)
+        window.title("Diagnostik")
+        window.geometry("1000x500")
+        window.configure(bg='#f0f8ff')
         
-        tk.Label(recent_frame, text="📋 Transaksi Terakhir", 
-                font=('Arial', 14, 'bold'), bg='white').pack(pady=10)
+        tk.Label(window, text="🩺 Diagnostik Query", font=('Arial', 16, 'bold'), 
+                bg='#f0f8ff', fg='#2c3e50').pack(pady=(20, 5))
         
-        # Recent transactions table
-        columns = ('Tanggal', 'Jenis', 'Obat', 'Jumlah', 'Total')
-        tree = ttk.Treeview(recent_frame, columns=columns, show='headings', height=10)
+        log_info = (f"Query lambat (>= {stats.slow_query_ms} ms) dicatat di {os.path.abspath(stats.log_path)}"
+                    if stats.slow_query_ms else "Log query lambat tidak aktif")
+        tk.Label(window, text=log_info, font=('Arial', 10), bg='#f0f8ff', fg='#7f8c8d').pack()
         
+        columns = ('Query / Layar', 'Jumlah', 'p50 ms', 'p95 ms', 'p99 ms', 'Maks ms', 'Rata-rata Baris')
+        tree = ttk.Treeview(window, columns=columns, show='headings', height=15)
         for col in columns:
             tree.heading(col, text=col)
-            tree.column(col, width=150)
+            tree.column(col, width=80)
+        tree.column('Query / Layar', width=500)
         
-        # Scrollbar
-        scrollbar = ttk.Scrollbar(recent_frame, orient='vertical', command=tree.yview)
+        scrollbar = ttk.Scrollbar(window, orient='vertical', command=tree.yview)
         tree.configure(yscrollcommand=scrollbar.set)
         
+        def refresh():
+            for item in tree.get_children():
+                tree.delete(item)
+                
+            for shape, jumlah, p50, p95, p99, maks, baris in stats.summary():
+                tree.insert('', 'end', values=(shape, jumlah, f"{p50:.2f}", f"{p95:.2f}", f"{p99:.2f}",
+                                               f"{maks:.2f}", f"{baris:.1f}"))
+                
+        tk.Button(window, text="🔄 Refresh", command=refresh,
+                 font=('Arial', 10, 'bold'), bg='#3498db', fg='white',
+                 relief='flat', padx=20, pady=5).pack(pady=5)
+        
         tree.pack(side='left', fill='both', expand=True, padx=10, pady=10)
         scrollbar.pack(side='right', fill='y', pady=10)
         
-        # Load recent transactions
-        self.load_recent_transactions(tree)
+        refresh()
         
-    def get_statistics(self):
-        """Mendapatkan statistik untuk dashboard"""
-        stats = {}
+    def verify_dashboard_stats(self):
+        """Cek konsistensi statistik dashboard dan tawarkan hitung ulang"""
+        def on_checked(mismatches):
+            if not mismatches:
+                messagebox.showinfo("Sukses", "Statistik dashboard sudah konsisten.")
+                return
+                
+            detail = "\n".join(mismatches[:10])
+            if messagebox.askyesno("Konfirmasi", f"Statistik tidak konsisten:\n{detail}\n\nHitung ulang sekarang?"):
+                self.run_db(self.repo.rebuild_dashboard_stats, on_success=lambda _: self.show_dashboard(),
+                            write=True)
+                
+        self.run_db(self.repo.check_dashboard_stats, on_success=on_checked)
         
-        # Total obat
-        self.cursor.execute("SELECT COUNT(*) FROM obat")
-        stats['total_obat'] = self.cursor.fetchone()[0]
+    def set_recent_limit(self, limit):
+        """Ubah jumlah transaksi terakhir yang ditampilkan"""
+        self.recent_limit = limit
+        self.load_recent_transactions()
         
-        # Total pegawai
-        self.cursor.execute("SELECT COUNT(*) FROM pegawai")
-        stats['total_pegawai'] = self.cursor.fetchone()[0]
+    def load_recent_transactions(self):
+        """Load transaksi terakhir"""
+        tree = self.recent_tree
         
-        # Pembelian bulan ini
-        current_month = datetime.now().strftime('%Y-%m')
-        self.cursor.execute("SELECT COUNT(*) FROM pembelian WHERE tanggal_pembelian LIKE ?", (f'{current_month}%',))
-        stats['pembelian_bulan'] = self.cursor.fetchone()[0]
+        def show_rows(rows):
+            if not tree.winfo_exists():
+                return
+                
+            # Clear existing items
+            for item in tree.get_children():
+                tree.delete(item)
+                
+            for row in rows:
+                tree.insert('', 'end', values=row)
+                
+        self.run_db(self.repo.fetch_recent_transactions, self.recent_limit, on_success=show_rows)
+        
+    @timed_screen
+    def show_laporan(self):
+        """Menampilkan laporan penjualan: pendapatan, margin, obat terlaris dan per pegawai"""
+        frame = self.open_screen('laporan')
+        if frame is None:
+            return
         
-        # Penjualan bulan ini
-        self.cursor.execute("SELECT COUNT(*) FROM penjualan WHERE tanggal_penjualan LIKE ?", (f'{current_month}%',))
-        stats['penjualan_bulan'] = self.cursor.fetchone()[0]
+        title = tk.Label(frame, text="📈 Laporan Penjualan", 
+                        font=('Arial', 18, 'bold'), bg='#f0f8ff', fg='#2c3e50')
+        title.pack(pady=(0, 20))
         
-        return stats
+        # Report controls, default to the last 12 months
+        control_frame = tk.Frame(frame, bg='#f0f8ff')
+        control_frame.pack(fill='x')
+        
+        now = datetime.now()
+        bulan_awal = now.year * 12 + now.month - 12
+        dari_default = datetime(bulan_awal // 12, bulan_awal % 12 + 1, 1)
+        
+        granularitas = {'Harian': 'hari', 'Mingguan': 'minggu', 'Bulanan': 'bulan'}
+        tk.Label(control_frame, text="Periode:", font=('Arial', 10, 'bold'),
+                bg='#f0f8ff').pack(side='left')
+        periode_var = tk.StringVar(value='Bulanan')
+        ttk.Combobox(control_frame, textvariable=periode_var, values=list(granularitas),
+                     state='readonly', width=10).pack(side='left', padx=(2, 8))
+        
+        tk.Label(control_frame, text="Dari:", font=('Arial', 10, 'bold'),
+                bg='#f0f8ff').pack(side='left')
+        dari_entry = tk.Entry(control_frame, font=('Arial', 10), width=11)
+        dari_entry.insert(0, dari_default.strftime('%Y-%m-%d'))
+        dari_entry.pack(side='left', padx=(2, 8))
+        
+        tk.Label(control_frame, text="Sampai:", font=('Arial', 10, 'bold'),
+                bg='#f0f8ff').pack(side='left')
+        sampai_entry = tk.Entry(control_frame, font=('Arial', 10), width=11)
+        sampai_entry.insert(0, now.strftime('%Y-%m-%d'))
+        sampai_entry.pack(side='left', padx=(2, 8))
+        
+        summary_label = tk.Label(frame, text="", font=('Arial', 11, 'bold'),
+                                 bg='#f0f8ff', fg='#2c3e50')
+        summary_label.pack(pady=10)
+        
+        def create_tree(parent, columns, height):
+            frame = tk.Frame(parent, bg='white', relief='raised', bd=2)
+            tree = ttk.Treeview(frame, columns=columns, show='headings', height=height)
+            for col in columns:
+                tree.heading(col, text=col)
+                tree.column(col, width=100)
+                
+            scrollbar = ttk.Scrollbar(frame, orient='vertical', command=tree.yview)
+            tree.configure(yscrollcommand=scrollbar.set)
+            
+            tree.pack(side='left', fill='both', expand=True, padx=5, pady=5)
+            scrollbar.pack(side='right', fill='y', pady=5)
+            return frame, tree
+            
+        periode_frame, periode_tree = create_tree(
+            frame, ('Periode', 'Transaksi', 'Terjual', 'Pendapatan', 'Modal', 'Margin',
+                                 'Margin %', 'Selisih'), 8)
+        periode_frame.pack(fill='both', expand=True)
         
-    def load_recent_transactions(self, tree):
-        """Load transaksi terakhir"""
-        # Clear existing items
-        for item in tree.get_children():
-            tree.delete(item)
+        bottom_frame = tk.Frame(frame, bg='#f0f8ff')
+        bottom_frame.pack(fill='both', expand=True, pady=(10, 0))
+        
+        obat_frame, obat_tree = create_tree(bottom_frame, ('Rank', 'Obat Terlaris', 'Terjual',
+                                                           'Pendapatan', 'Margin'), 8)
+        obat_frame.pack(side='left', fill='both', expand=True, padx=(0, 5))
+        
+        pegawai_frame, pegawai_tree = create_tree(bottom_frame, ('Pegawai', 'Transaksi', 'Terjual',
+                                                                 'Pendapatan', 'Margin', 'Porsi %'), 8)
+        pegawai_frame.pack(side='left', fill='both', expand=True, padx=(5, 0))
+        
+        def show_report(laporan):
+            if not periode_tree.winfo_exists():
+                return
+                
+            for tree in (periode_tree, obat_tree, pegawai_tree):
+                for item in tree.get_children():
+                    tree.delete(item)
+                    
+            for label, transaksi, terjual, pendapatan, modal, selisih in laporan['periode']:
+                margin = pendapatan - modal
+                persen = margin * 100 / pendapatan if pendapatan else 0
+                periode_tree.insert('', 'end', values=(
+                    label, transaksi, terjual, f"{pendapatan:,.0f}", f"{modal:,.0f}", f"{margin:,.0f}",
+                    f"{persen:.1f}", '-' if selisih is None else f"{selisih:+,.0f}"))
+                
+            for rank, nama_obat, terjual, pendapatan, margin in laporan['obat']:
+                obat_tree.insert('', 'end', values=(rank, nama_obat, terjual, f"{pendapatan:,.0f}",
+                                                    f"{margin:,.0f}"))
+                
+            for nama_pegawai, transaksi, terjual, pendapatan, margin, porsi in laporan['pegawai']:
+                pegawai_tree.insert('', 'end', values=(nama_pegawai, transaksi, terjual, f"{pendapatan:,.0f}",
+                                                       f"{margin:,.0f}", f"{porsi or 0:.1f}"))
+                
+            pendapatan = sum(row[3] for row in laporan['periode'])
+            margin = pendapatan - sum(row[4] for row in laporan['periode'])
+            summary_label.config(text=f"Total pendapatan: Rp {pendapatan:,.0f}    Margin kotor: Rp {margin:,.0f}")
             
-        # Get recent purchases
-        self.cursor.execute("""
-            SELECT p.tanggal_pembelian, 'Pembelian' as jenis, o.nama_obat, p.jumlah, p.total_harga
-            FROM pembelian p
-            JOIN obat o ON p.id_obat = o.id
-            ORDER BY p.created_at DESC
-            LIMIT 5
-        """)
+        def load_report():
+            try:
+                dari = date_key(dari_entry.get().strip())
+                sampai = date_key(sampai_entry.get().strip())
+            except ValueError:
+                messagebox.showerror("Error", "Format tanggal tidak valid!\nTanggal format: YYYY-MM-DD")
+                return
+                
+            if dari > sampai:
+                messagebox.showerror("Error", "Tanggal awal harus sebelum tanggal akhir!")
+                return
+                
+            # Computing open periods fills the report cache, so this runs on the writer;
+            # the cache is not data other screens show, so it doesn't count as a write
+            self.run_db(self.repo.fetch_laporan, granularitas[periode_var.get()], dari, sampai,
+                        on_success=show_report, write=True, count=False)
+            
+        tk.Button(control_frame, text="📈 Tampilkan", command=load_report,
+                 font=('Arial', 10, 'bold'), bg='#1abc9c', fg='white',
+                 relief='flat', padx=10, pady=5).pack(side='left', padx=2)
         
-        for row in self.cursor.fetchall():
-            tree.insert('', 'end', values=row)
+        tk.Button(control_frame, text="🗄️ Arsip Transaksi", command=self.show_arsip,
+                 font=('Arial', 10, 'bold'), bg='#7f8c8d', fg='white',
+                 relief='flat', padx=10, pady=5).pack(side='right', padx=2)
+        
+        self.screen_refresh['laporan'] = load_report
+        load_report()
+        
+    def show_arsip(self):
+        """Window arsip transaksi per tahun: daftar file arsip, verifikasi dan arsipkan periode lama"""
+        window = tk.Toplevel(self.root)
+        window.title("Arsip Transaksi")
+        window.geometry("750x500")
+        window.configure(bg='#f0f8ff')
+        
+        tk.Label(window, text="🗄️ Arsip Transaksi", font=('Arial', 16, 'bold'),
+                bg='#f0f8ff', fg='#2c3e50').pack(pady=20)
+        
+        control_frame = tk.Frame(window, bg='#f0f8ff')
+        control_frame.pack(fill='x', padx=10)
+        
+        tk.Label(control_frame, text="Arsipkan transaksi sebelum:", font=('Arial', 10, 'bold'),
+                bg='#f0f8ff').pack(side='left')
+        sampai_entry = tk.Entry(control_frame, font=('Arial', 10), width=11)
+        sampai_entry.insert(0, datetime(datetime.now().year - ARSIP_SIMPAN_TAHUN + 1, 1, 1).strftime('%Y-%m-%d'))
+        sampai_entry.pack(side='left', padx=(2, 8))
+        
+        columns = ('Tahun', 'File', 'Sampai', 'Penjualan', 'Pembelian', 'Status')
+        tree = ttk.Treeview(window, columns=columns, show='headings', height=12)
+        for col in columns:
+            tree.heading(col, text=col)
+            tree.column(col, width=100)
+        tree.column('File', width=220)
+        
+        scrollbar = ttk.Scrollbar(window, orient='vertical', command=tree.yview)
+        tree.configure(yscrollcommand=scrollbar.set)
+        
+        tree.pack(side='left', fill='both', expand=True, padx=10, pady=10)
+        scrollbar.pack(side='right', fill='y', pady=10)
+        
+        def show_rows(rows):
+            if not tree.winfo_exists():
+                return
+            tree.delete(*tree.get_children())
+            for tahun, file, hari_akhir, penjualan, pembelian, status in rows:
+                sampai = datetime.fromordinal(hari_akhir - 1).strftime('%Y-%m-%d')
+                tree.insert('', 'end', values=(tahun, file, sampai, f"{penjualan:,}", f"{pembelian:,}",
+                                               status or '-'))
+                
+        def load_rows(verifikasi=False):
+            self.run_db(self.repo.fetch_arsip, verifikasi, on_success=show_rows)
             
-        # Get recent sales
-        self.cursor.execute("""
-            SELECT p.tanggal_penjualan, 'Penjualan' as jenis, o.nama_obat, p.jumlah, p.total_harga
-            FROM penjualan p
-            JOIN obat o ON p.id_obat = o.id
-            ORDER BY p.created_at DESC
-            LIMIT 5
-        """)
+        def on_archived(hasil):
+            penjualan = sum(row[2] for row in hasil)
+            pembelian = sum(row[3] for row in hasil)
+            messagebox.showinfo("Sukses", f"{penjualan:,} penjualan dan {pembelian:,} pembelian "
+                                          f"dipindahkan ke {len(hasil)} file arsip", parent=window)
+            load_rows()
+            
+        def start_archive():
+            try:
+                sampai = date_key(sampai_entry.get().strip())
+            except ValueError:
+                messagebox.showerror("Error", "Format tanggal tidak valid!\nTanggal format: YYYY-MM-DD", parent=window)
+                return
+                
+            if not messagebox.askyesno("Konfirmasi", f"Pindahkan semua transaksi sebelum {sampai_entry.get().strip()} "
+                                       "ke file arsip? Periode itu tidak bisa diubah lagi.", parent=window):
+                return
+            self.run_db(self.repo.arsipkan, sampai, on_success=on_archived, write=True)
+            
+        tk.Button(control_frame, text="🗄️ Arsipkan", command=start_archive,
+                 font=('Arial', 10, 'bold'), bg='#e67e22', fg='white',
+                 relief='flat', padx=10, pady=5).pack(side='left', padx=2)
+        
+        tk.Button(control_frame, text="✔ Verifikasi Arsip", command=lambda: load_rows(True),
+                 font=('Arial', 10, 'bold'), bg='#3498db', fg='white',
+                 relief='flat', padx=10, pady=5).pack(side='right', padx=2)
+        
+        load_rows()
+        
+    def create_date_filter(self, parent, pager):
+        """Membuat kontrol filter rentang tanggal untuk tabel transaksi"""
+        filter_frame = tk.Frame(parent, bg='#f0f8ff')
+        filter_frame.pack(side='right', padx=5)
+        
+        tk.Label(filter_frame, text="Dari:", font=('Arial', 10, 'bold'),
+                bg='#f0f8ff').pack(side='left')
+        dari_entry = tk.Entry(filter_frame, font=('Arial', 10), width=11)
+        dari_entry.pack(side='left', padx=(2, 8))
+        
+        tk.Label(filter_frame, text="Sampai:", font=('Arial', 10, 'bold'),
+                bg='#f0f8ff').pack(side='left')
+        sampai_entry = tk.Entry(filter_frame, font=('Arial', 10), width=11)
+        sampai_entry.pack(side='left', padx=(2, 8))
+        
+        def apply_filter():
+            filters = {}
+            try:
+                if dari_entry.get().strip():
+                    filters['dari'] = date_key(dari_entry.get().strip())
+                if sampai_entry.get().strip():
+                    # Inclusive end date becomes an exclusive upper bound
+                    filters['sampai'] = date_key(sampai_entry.get().strip()) + 1
+            except ValueError:
+                messagebox.showerror("Error", "Format tanggal tidak valid!\nTanggal format: YYYY-MM-DD")
+                return
+                
+            # Keep the search filter, replace only the date range
+            pager.filters.pop('dari', None)
+            pager.filters.pop('sampai', None)
+            pager.filters.update(filters)
+            pager.reset()
+            
+        def reset_filter():
+            dari_entry.delete(0, 'end')
+            sampai_entry.delete(0, 'end')
+            pager.filters.pop('dari', None)
+            pager.filters.pop('sampai', None)
+            pager.reset()
+            
+        tk.Button(filter_frame, text="🔍 Filter", command=apply_filter,
+                 font=('Arial', 10, 'bold'), bg='#3498db', fg='white',
+                 relief='flat', padx=10, pady=5).pack(side='left', padx=2)
+        
+        tk.Button(filter_frame, text="Reset", command=reset_filter,
+                 font=('Arial', 10, 'bold'), bg='#95a5a6', fg='white',
+                 relief='flat', padx=10, pady=5).pack(side='left', padx=2)
+        
+    def create_search_bar(self, parent, pager, column=None):
+        """Membuat kotak pencarian obat (FTS5) yang memfilter tabel sambil mengetik"""
+        tk.Label(parent, text="🔎 Cari Obat:", font=('Arial', 10, 'bold'),
+                bg='#f0f8ff').pack(side='left', padx=(5, 2))
+        search_var = tk.StringVar()
+        search_entry = tk.Entry(parent, textvariable=search_var, font=('Arial', 10), width=30)
+        search_entry.pack(side='left', padx=2)
+        
+        pending = [None]
+        
+        def run_search():
+            pending[0] = None
+            query = fts_query(search_var.get(), column)
+            if query == pager.filters.get('cari'):
+                return
+                
+            if query:
+                pager.filters['cari'] = query
+            else:
+                pager.filters.pop('cari', None)
+            pager.reset()
+            
+        def on_key(event=None):
+            # Debounce: only search once typing pauses
+            if pending[0]:
+                self.root.after_cancel(pending[0])
+            pending[0] = self.root.after(SEARCH_DEBOUNCE, run_search)
+            
+        search_entry.bind('<KeyRelease>', on_key)
+        
+    def export_transaksi(self, jenis):
+        """Window export data pembelian/penjualan ke CSV"""
+        window = tk.Toplevel(self.root)
+        window.title(f"Export {jenis.title()}")
+        window.geometry("400x380")
+        window.configure(bg='#f0f8ff')
+        window.resizable(False, False)
+        
+        # Title
+        tk.Label(window, text=f"📤 Export {jenis.title()}", font=('Arial', 16, 'bold'), 
+                bg='#f0f8ff', fg='#2c3e50').pack(pady=20)
         
-        for row in self.cursor.fetchall():
-            tree.insert('', 'end', values=row)
+        # Form frame
+        form_frame = tk.Frame(window, bg='#f0f8ff')
+        form_frame.pack(padx=30, pady=10, fill='both', expand=True)
+        
+        # Optional filters
+        fields = [
+            ("Dari Tanggal (opsional):", "dari"),
+            ("Sampai Tanggal (opsional):", "sampai"),
+            ("Nama Obat (opsional):", "nama_obat")
+        ]
+        
+        entries = {}
+        
+        for label, field in fields:
+            tk.Label(form_frame, text=label, font=('Arial', 11, 'bold'), 
+                    bg='#f0f8ff').pack(anchor='w', pady=(10, 0))
+            
+            entry = tk.Entry(form_frame, font=('Arial', 11), width=40)
+            entry.pack(pady=(5, 0), fill='x')
+            entries[field] = entry
+            
+        status_label = tk.Label(form_frame, text="", font=('Arial', 10), bg='#f0f8ff')
+        status_label.pack(pady=(10, 0))
+        
+        # Button frame
+        btn_frame = tk.Frame(window, bg='#f0f8ff')
+        btn_frame.pack(pady=20)
+        
+        def start_export():
+            filters = {}
+            try:
+                if entries['dari'].get().strip():
+                    filters['dari'] = date_key(entries['dari'].get().strip())
+                if entries['sampai'].get().strip():
+                    filters['sampai'] = date_key(entries['sampai'].get().strip()) + 1
+            except ValueError:
+                messagebox.showerror("Error", "Format tanggal tidak valid!\nTanggal format: YYYY-MM-DD")
+                return
+                
+            if entries['nama_obat'].get().strip():
+                filters['nama_obat'] = entries['nama_obat'].get().strip()
+                
+            path = filedialog.asksaveasfilename(
+                parent=window, title="Simpan Export", defaultextension=".csv",
+                initialfile=f"{jenis}_{datetime.now().strftime('%Y%m%d')}.csv",
+                filetypes=[("CSV", "*.csv")])
+            if not path:
+                return
+                
+            # Updated by the worker thread, read by the Tk thread
+            progress = {'rows': 0}
+            
+            def refresh_progress():
+                if not window.winfo_exists() or job.done():
+                    return
+                status_label.config(text=f"Diekspor: {progress['rows']:,} baris")
+                window.after(100, refresh_progress)
+                
+            def on_exported(rows):
+                if window.winfo_exists():
+                    window.destroy()
+                messagebox.showinfo("Sukses", f"{rows:,} baris {jenis} berhasil diekspor ke:\n{path}")
+                
+            def on_failed(e):
+                export_button.config(state='normal')
+                messagebox.showerror("Error", f"Export gagal: {str(e)}")
+                
+            export_button.config(state='disabled')
+            job = self.run_db(self.repo.export_transaksi_csv, jenis, path, filters, progress,
+                              on_success=on_exported, on_error=on_failed, worker=self.export_worker())
+            refresh_progress()
             
+        export_button = tk.Button(btn_frame, text="📤 Export", command=start_export,
+                                 font=('Arial', 11, 'bold'), bg='#27ae60', fg='white',
+                                 relief='flat', padx=30, pady=10)
+        export_button.pack(side='left', padx=10)
+        
+        tk.Button(btn_frame, text="❌ Batal", command=window.destroy,
+                 font=('Arial', 11, 'bold'), bg='#e74c3c', fg='white',
+                 relief='flat', padx=30, pady=10).pack(side='left', padx=10)
+        
+    @timed_screen
     def show_obat(self):
         """Menampilkan data obat"""
-        self.clear_content()
+        frame = self.open_screen('obat')
+        if frame is None:
+            return
         
         # Title
-        title = tk.Label(self.content_frame, text="💊 Data Obat", 
+        title = tk.Label(frame, text="💊 Data Obat", 
                         font=('Arial', 18, 'bold'), bg='#f0f8ff', fg='#2c3e50')
         title.pack(pady=(0, 20))
         
         # Button frame
-        btn_frame = tk.Frame(self.content_frame, bg='#f0f8ff')
+        btn_frame = tk.Frame(frame, bg='#f0f8ff')
         btn_frame.pack(fill='x', pady=10)
         
         tk.Button(btn_frame, text="+ Tambah Obat", command=self.add_obat,
@@ -299,8 +3479,24 @@ class ApotekSystem:
                  font=('Arial', 10, 'bold'), bg='#e74c3c', fg='white',
                  relief='flat', padx=20, pady=5).pack(side='left', padx=5)
         
+        tk.Button(btn_frame, text="📥 Import CSV", command=self.import_obat,
+                 font=('Arial', 10, 'bold'), bg='#3498db', fg='white',
+                 relief='flat', padx=20, pady=5).pack(side='left', padx=5)
+        
+        tk.Button(btn_frame, text="📅 Stok per Tanggal", command=self.show_stok_per_tanggal,
+                 font=('Arial', 10, 'bold'), bg='#9b59b6', fg='white',
+                 relief='flat', padx=20, pady=5).pack(side='left', padx=5)
+        
+        tk.Button(btn_frame, text="⏰ Lot Kedaluwarsa", command=self.show_lot_kedaluwarsa,
+                 font=('Arial', 10, 'bold'), bg='#e67e22', fg='white',
+                 relief='flat', padx=20, pady=5).pack(side='left', padx=5)
+        
+        # Search bar (filled once the pager exists)
+        search_frame = tk.Frame(frame, bg='#f0f8ff')
+        search_frame.pack(fill='x')
+        
         # Table frame
-        table_frame = tk.Frame(self.content_frame, bg='white', relief='raised', bd=2)
+        table_frame = tk.Frame(frame, bg='white', relief='raised', bd=2)
         table_frame.pack(fill='both', expand=True, pady=10)
         
         # Treeview
@@ -313,26 +3509,22 @@ class ApotekSystem:
         
         # Scrollbar
         scrollbar = ttk.Scrollbar(table_frame, orient='vertical', command=self.obat_tree.yview)
-        self.obat_tree.configure(yscrollcommand=scrollbar.set)
+        self.obat_pager = TreePager(self.obat_tree, scrollbar, self.repo.fetch_obat_page, self.run_db,
+                                    ranked_search=True)
+        self.obat_pager.enable_sort(URUTAN_OBAT)
+        self.create_search_bar(search_frame, self.obat_pager)
         
         self.obat_tree.pack(side='left', fill='both', expand=True, padx=10, pady=10)
         scrollbar.pack(side='right', fill='y', pady=10)
         
         # Load data
+        self.screen_refresh['obat'] = self.load_obat_data
         self.load_obat_data()
         
     def load_obat_data(self):
         """Load data obat"""
-        # Clear existing items
-        for item in self.obat_tree.get_children():
-            self.obat_tree.delete(item)
-            
-        # Get data from database
-        self.cursor.execute("SELECT * FROM obat ORDER BY id DESC")
+        self.obat_pager.reset()
         
-        for row in self.cursor.fetchall():
-            self.obat_tree.insert('', 'end', values=row[:-1])  # Exclude created_at
-            
     def add_obat(self):
         """Tambah obat baru"""
         self.obat_form_window("Tambah Obat Baru")
@@ -344,26 +3536,165 @@ class ApotekSystem:
             messagebox.showwarning("Peringatan", "Silakan pilih obat yang akan diedit!")
             return
             
-        item = self.obat_tree.item(selected_item)
-        values = item['values']
-        self.obat_form_window("Edit Obat", values)
+        item = self.obat_tree.item(selected_item)
+        values = item['values']
+        self.obat_form_window("Edit Obat", values)
+        
+    def delete_obat(self):
+        """Hapus obat yang dipilih"""
+        selected_item = self.obat_tree.selection()
+        if not selected_item:
+            messagebox.showwarning("Peringatan", "Silakan pilih obat yang akan dihapus!")
+            return
+            
+        item = self.obat_tree.item(selected_item)
+        obat_id = item['values'][0]
+        
+        def on_failed(e):
+            if isinstance(e, ObatPunyaRiwayatError):
+                messagebox.showerror("Error", str(e))
+            else:
+                messagebox.showerror("Error", f"Terjadi kesalahan: {str(e)}")
+                
+        if messagebox.askyesno("Konfirmasi", "Apakah Anda yakin ingin menghapus obat ini?"):
+            self.run_db(self.repo.delete_obat_row, obat_id,
+                        on_success=lambda _: self.on_obat_deleted(obat_id), on_error=on_failed, write=True)
+            
+    def on_obat_deleted(self, obat_id):
+        """Hapus baris dari tabel setelah obat dihapus"""
+        if self.obat_tree.winfo_exists():
+            self.obat_pager.remove_row(obat_id)
+        messagebox.showinfo("Sukses", "Obat berhasil dihapus!")
+            
+    def show_stok_per_tanggal(self):
+        """Tampilkan stok semua obat pada tanggal tertentu (dari snapshot + buku mutasi)"""
+        tanggal = simpledialog.askstring("Stok per Tanggal", "Tanggal (YYYY-MM-DD):",
+                                         initialvalue=datetime.now().strftime('%Y-%m-%d'))
+        if not tanggal:
+            return
+            
+        try:
+            hari = date_key(tanggal.strip())
+        except ValueError:
+            messagebox.showerror("Error", "Format tanggal tidak valid!\nTanggal format: YYYY-MM-DD")
+            return
+            
+        def show_rows(rows):
+            window = tk.Toplevel(self.root)
+            window.title(f"Stok per {tanggal}")
+            window.geometry("500x500")
+            window.configure(bg='#f0f8ff')
+            
+            tk.Label(window, text=f"📅 Stok per {tanggal}", font=('Arial', 16, 'bold'), 
+                    bg='#f0f8ff', fg='#2c3e50').pack(pady=20)
+            
+            columns = ('ID', 'Obat', 'Stok')
+            tree = ttk.Treeview(window, columns=columns, show='headings', height=15)
+            for col in columns:
+                tree.heading(col, text=col)
+                tree.column(col, width=150)
+                
+            scrollbar = ttk.Scrollbar(window, orient='vertical', command=tree.yview)
+            tree.configure(yscrollcommand=scrollbar.set)
+            
+            tree.pack(side='left', fill='both', expand=True, padx=10, pady=10)
+            scrollbar.pack(side='right', fill='y', pady=10)
+            
+            for row in rows:
+                tree.insert('', 'end', values=row)
+                
+        self.run_db(self.repo.stok_per_tanggal, hari, on_success=show_rows)
+        
+    def show_lot_kedaluwarsa(self):
+        """Tampilkan lot yang sudah expired tapi masih ada stoknya, dan yang expired dalam N hari"""
+        n_hari = simpledialog.askinteger("Lot Kedaluwarsa", "Expired dalam berapa hari ke depan?",
+                                         initialvalue=30, minvalue=0)
+        if n_hari is None:
+            return
+            
+        hari_ini = datetime.now().toordinal()
         
-    def delete_obat(self):
-        """Hapus obat yang dipilih"""
-        selected_item = self.obat_tree.selection()
-        if not selected_item:
-            messagebox.showwarning("Peringatan", "Silakan pilih obat yang akan dihapus!")
+        def show_rows(rows):
+            window = tk.Toplevel(self.root)
+            window.title("Lot Kedaluwarsa")
+            window.geometry("650x500")
+            window.configure(bg='#f0f8ff')
+            
+            expired = sum(1 for row in rows if row[4] < hari_ini)
+            tk.Label(window, text=f"⏰ {expired} lot sudah expired, {len(rows) - expired} lot expired dalam {n_hari} hari",
+                    font=('Arial', 14, 'bold'), bg='#f0f8ff', fg='#2c3e50').pack(pady=20)
+            
+            columns = ('Lot', 'Obat', 'Expired', 'Sisa', 'Status')
+            tree = ttk.Treeview(window, columns=columns, show='headings', height=15)
+            for col in columns:
+                tree.heading(col, text=col)
+                tree.column(col, width=120)
+                
+            scrollbar = ttk.Scrollbar(window, orient='vertical', command=tree.yview)
+            tree.configure(yscrollcommand=scrollbar.set)
+            
+            tree.pack(side='left', fill='both', expand=True, padx=10, pady=10)
+            scrollbar.pack(side='right', fill='y', pady=10)
+            
+            for lot_id, nama_obat, expired_date, sisa, hari_expired in rows:
+                sisa_hari = hari_expired - hari_ini
+                status = "Sudah expired" if sisa_hari < 0 else f"{sisa_hari} hari lagi"
+                tree.insert('', 'end', values=(lot_id, nama_obat, expired_date, sisa, status))
+                
+        self.run_db(self.repo.fetch_lot_kedaluwarsa, hari_ini + n_hari, on_success=show_rows)
+        
+    def import_obat(self):
+        """Import katalog obat dari file CSV"""
+        path = filedialog.askopenfilename(title="Pilih File Katalog Obat",
+                                          filetypes=[("CSV", "*.csv"), ("Semua File", "*.*")])
+        if not path:
             return
             
-        item = self.obat_tree.item(selected_item)
-        obat_id = item['values'][0]
+        # Progress window
+        window = tk.Toplevel(self.root)
+        window.title("Import Katalog Obat")
+        window.geometry("400x150")
+        window.configure(bg='#f0f8ff')
+        window.resizable(False, False)
         
-        if messagebox.askyesno("Konfirmasi", "Apakah Anda yakin ingin menghapus obat ini?"):
-            self.cursor.execute("DELETE FROM obat WHERE id = ?", (obat_id,))
-            self.conn.commit()
-            self.load_obat_data()
-            messagebox.showinfo("Sukses", "Obat berhasil dihapus!")
+        tk.Label(window, text=os.path.basename(path), font=('Arial', 11, 'bold'),
+                bg='#f0f8ff').pack(pady=(20, 10))
+        
+        progress_bar = ttk.Progressbar(window, maximum=max(os.path.getsize(path), 1), length=340)
+        progress_bar.pack(pady=5)
+        
+        status_label = tk.Label(window, text="Memulai...", font=('Arial', 10), bg='#f0f8ff')
+        status_label.pack(pady=5)
+        
+        # Updated by the worker thread, read by the Tk thread
+        progress = {'bytes': 0, 'rows': 0}
+        
+        def refresh_progress():
+            if not window.winfo_exists() or job.done():
+                return
+            progress_bar['value'] = progress['bytes']
+            status_label.config(text=f"Diproses: {progress['rows']:,} baris")
+            window.after(100, refresh_progress)
+            
+        def on_imported(result):
+            window.destroy()
+            message = (f"Import selesai!\nDitambah: {result['inserted']:,}\n"
+                       f"Diperbarui: {result['updated']:,}\nDitolak: {result['rejected']:,}")
+            if result['rejected']:
+                message += f"\n\nBaris yang ditolak disimpan di:\n{result['rejected_path']}"
+            messagebox.showinfo("Sukses", message)
+            
+            if self.obat_tree.winfo_exists():
+                self.load_obat_data()
+                
+        def on_failed(e):
+            window.destroy()
+            messagebox.showerror("Error", f"Import gagal: {str(e)}")
             
+        job = self.run_db(self.repo.import_obat_csv, path, progress,
+                          on_success=on_imported, on_error=on_failed, write=True)
+        refresh_progress()
+        
     def obat_form_window(self, title, data=None):
         """Window form untuk tambah/edit obat"""
         window = tk.Toplevel(self.root)
@@ -418,61 +3749,52 @@ class ApotekSystem:
                 return
                 
             try:
-                # Get values
+                # Get values and validate numeric/date fields
                 values = {field: entries[field].get().strip() for field in entries}
+                row = parse_obat(values)
                 
-                # Validate numeric fields
-                float(values['harga_beli'])
-                float(values['harga_jual'])
-                int(values['stok'])
+            except ValueError as e:
+                messagebox.showerror("Error", "Format data tidak valid!\nHarga harus berupa angka, Stok harus berupa angka, Tanggal format: YYYY-MM-DD")
+                return
                 
-                # Validate date format
-                datetime.strptime(values['expired_date'], '%Y-%m-%d')
-                
-                if data:  # Edit mode
-                    self.cursor.execute("""
-                        UPDATE obat SET nama_obat=?, kategori=?, harga_beli=?, 
-                        harga_jual=?, stok=?, expired_date=? WHERE id=?
-                    """, (values['nama_obat'], values['kategori'], 
-                         float(values['harga_beli']), float(values['harga_jual']),
-                         int(values['stok']), values['expired_date'], data[0]))
-                else:  # Add mode
-                    self.cursor.execute("""
-                        INSERT INTO obat (nama_obat, kategori, harga_beli, 
-                        harga_jual, stok, expired_date) VALUES (?, ?, ?, ?, ?, ?)
-                    """, (values['nama_obat'], values['kategori'], 
-                         float(values['harga_beli']), float(values['harga_jual']),
-                         int(values['stok']), values['expired_date']))
-                
-                self.conn.commit()
-                self.load_obat_data()
+            def on_saved(obat_id):
+                if self.obat_tree.winfo_exists():
+                    self.obat_pager.refresh_rows([obat_id])
                 window.destroy()
                 messagebox.showinfo("Sukses", "Data obat berhasil disimpan!")
                 
-            except ValueError as e:
-                messagebox.showerror("Error", "Format data tidak valid!\nHarga harus berupa angka, Stok harus berupa angka, Tanggal format: YYYY-MM-DD")
-            except Exception as e:
+            def on_failed(e):
+                save_button.config(state='normal')
                 messagebox.showerror("Error", f"Terjadi kesalahan: {str(e)}")
+                
+            # Save in the background, disable the button to avoid double submits
+            save_button.config(state='disabled')
+            self.run_db(self.repo.save_obat_row, row, data[0] if data else None,
+                        on_success=on_saved, on_error=on_failed, write=True)
         
-        tk.Button(btn_frame, text="💾 Simpan", command=save_obat,
-                 font=('Arial', 11, 'bold'), bg='#27ae60', fg='white',
-                 relief='flat', padx=30, pady=10).pack(side='left', padx=10)
+        save_button = tk.Button(btn_frame, text="💾 Simpan", command=save_obat,
+                               font=('Arial', 11, 'bold'), bg='#27ae60', fg='white',
+                               relief='flat', padx=30, pady=10)
+        save_button.pack(side='left', padx=10)
         
         tk.Button(btn_frame, text="❌ Batal", command=window.destroy,
                  font=('Arial', 11, 'bold'), bg='#e74c3c', fg='white',
                  relief='flat', padx=30, pady=10).pack(side='left', padx=10)
         
+    @timed_screen
     def show_pegawai(self):
         """Menampilkan data pegawai"""
-        self.clear_content()
+        frame = self.open_screen('pegawai')
+        if frame is None:
+            return
         
         # Title
-        title = tk.Label(self.content_frame, text="👥 Data Pegawai", 
+        title = tk.Label(frame, text="👥 Data Pegawai", 
                         font=('Arial', 18, 'bold'), bg='#f0f8ff', fg='#2c3e50')
         title.pack(pady=(0, 20))
         
         # Button frame
-        btn_frame = tk.Frame(self.content_frame, bg='#f0f8ff')
+        btn_frame = tk.Frame(frame, bg='#f0f8ff')
         btn_frame.pack(fill='x', pady=10)
         
         tk.Button(btn_frame, text="+ Tambah Pegawai", command=self.add_pegawai,
@@ -488,7 +3810,7 @@ class ApotekSystem:
                  relief='flat', padx=20, pady=5).pack(side='left', padx=5)
         
         # Table frame
-        table_frame = tk.Frame(self.content_frame, bg='white', relief='raised', bd=2)
+        table_frame = tk.Frame(frame, bg='white', relief='raised', bd=2)
         table_frame.pack(fill='both', expand=True, pady=10)
         
         # Treeview
@@ -507,20 +3829,37 @@ class ApotekSystem:
         scrollbar.pack(side='right', fill='y', pady=10)
         
         # Load data
+        self.screen_refresh['pegawai'] = self.load_pegawai_data
         self.load_pegawai_data()
         
     def load_pegawai_data(self):
         """Load data pegawai"""
-        # Clear existing items
-        for item in self.pegawai_tree.get_children():
-            self.pegawai_tree.delete(item)
-            
-        # Get data from database
-        self.cursor.execute("SELECT * FROM pegawai ORDER BY id DESC")
+        tree = self.pegawai_tree
+        
+        def show_rows(rows):
+            if not tree.winfo_exists():
+                return
+                
+            # Clear existing items
+            for item in tree.get_children():
+                tree.delete(item)
+                
+            for row in rows:
+                put_tree_row(tree, row[:-1])  # Exclude created_at
+                
+        self.run_db(self.repo.fetch_pegawai_data, on_success=show_rows)
+        
+    def refresh_pegawai_row(self, pegawai_id):
+        """Update atau insert satu baris pegawai setelah disimpan"""
+        tree = self.pegawai_tree
+        
+        def show_rows(rows):
+            if tree.winfo_exists():
+                for row in rows:
+                    put_tree_row(tree, row[:-1], 0)  # Exclude created_at
+                    
+        self.run_db(self.repo.fetch_pegawai_data, [pegawai_id], on_success=show_rows)
         
-        for row in self.cursor.fetchall():
-            self.pegawai_tree.insert('', 'end', values=row[:-1])  # Exclude created_at
-            
     def add_pegawai(self):
         """Tambah pegawai baru"""
         self.pegawai_form_window("Tambah Pegawai Baru")
@@ -547,10 +3886,14 @@ class ApotekSystem:
         pegawai_id = item['values'][0]
         
         if messagebox.askyesno("Konfirmasi", "Apakah Anda yakin ingin menghapus pegawai ini?"):
-            self.cursor.execute("DELETE FROM pegawai WHERE id = ?", (pegawai_id,))
-            self.conn.commit()
-            self.load_pegawai_data()
-            messagebox.showinfo("Sukses", "Pegawai berhasil dihapus!")
+            self.run_db(self.repo.delete_pegawai_row, pegawai_id,
+                        on_success=lambda _: self.on_pegawai_deleted(pegawai_id), write=True)
+            
+    def on_pegawai_deleted(self, pegawai_id):
+        """Hapus baris dari tabel setelah pegawai dihapus"""
+        if self.pegawai_tree.winfo_exists() and self.pegawai_tree.exists(str(pegawai_id)):
+            self.pegawai_tree.delete(str(pegawai_id))
+        messagebox.showinfo("Sukses", "Pegawai berhasil dihapus!")
             
     def pegawai_form_window(self, title, data=None):
         """Window form untuk tambah/edit pegawai"""
@@ -624,48 +3967,51 @@ class ApotekSystem:
                 # Validate date format
                 datetime.strptime(values['tanggal_masuk'], '%Y-%m-%d')
                 
-                if data:  # Edit mode
-                    self.cursor.execute("""
-                        UPDATE pegawai SET nama_pegawai=?, jabatan=?, alamat=?, 
-                        telepon=?, gaji=?, tanggal_masuk=? WHERE id=?
-                    """, (values['nama_pegawai'], values['jabatan'], values['alamat'],
-                         values['telepon'], float(values['gaji']), values['tanggal_masuk'], data[0]))
-                else:  # Add mode
-                    self.cursor.execute("""
-                        INSERT INTO pegawai (nama_pegawai, jabatan, alamat, 
-                        telepon, gaji, tanggal_masuk) VALUES (?, ?, ?, ?, ?, ?)
-                    """, (values['nama_pegawai'], values['jabatan'], values['alamat'],
-                         values['telepon'], float(values['gaji']), values['tanggal_masuk']))
-                
-                self.conn.commit()
-                self.load_pegawai_data()
+            except ValueError as e:
+                messagebox.showerror("Error", "Format data tidak valid!\nGaji harus berupa angka, Tanggal format: YYYY-MM-DD")
+                return
+                
+            row = (values['nama_pegawai'], values['jabatan'], values['alamat'],
+                   values['telepon'], float(values['gaji']), values['tanggal_masuk'])
+            
+            def on_saved(pegawai_id):
+                if self.pegawai_tree.winfo_exists():
+                    self.refresh_pegawai_row(pegawai_id)
                 window.destroy()
                 messagebox.showinfo("Sukses", "Data pegawai berhasil disimpan!")
                 
-            except ValueError as e:
-                messagebox.showerror("Error", "Format data tidak valid!\nGaji harus berupa angka, Tanggal format: YYYY-MM-DD")
-            except Exception as e:
+            def on_failed(e):
+                save_button.config(state='normal')
                 messagebox.showerror("Error", f"Terjadi kesalahan: {str(e)}")
+                
+            # Save in the background, disable the button to avoid double submits
+            save_button.config(state='disabled')
+            self.run_db(self.repo.save_pegawai_row, row, data[0] if data else None,
+                        on_success=on_saved, on_error=on_failed, write=True)
         
-        tk.Button(btn_frame, text="💾 Simpan", command=save_pegawai,
-                 font=('Arial', 11, 'bold'), bg='#27ae60', fg='white',
-                 relief='flat', padx=30, pady=10).pack(side='left', padx=10)
+        save_button = tk.Button(btn_frame, text="💾 Simpan", command=save_pegawai,
+                               font=('Arial', 11, 'bold'), bg='#27ae60', fg='white',
+                               relief='flat', padx=30, pady=10)
+        save_button.pack(side='left', padx=10)
         
         tk.Button(btn_frame, text="❌ Batal", command=window.destroy,
                  font=('Arial', 11, 'bold'), bg='#e74c3c', fg='white',
                  relief='flat', padx=30, pady=10).pack(side='left', padx=10)
         
+    @timed_screen
     def show_pembelian(self):
         """Menampilkan data pembelian"""
-        self.clear_content()
+        frame = self.open_screen('pembelian')
+        if frame is None:
+            return
         
         # Title
-        title = tk.Label(self.content_frame, text="📦 Data Pembelian", 
+        title = tk.Label(frame, text="📦 Data Pembelian", 
                         font=('Arial', 18, 'bold'), bg='#f0f8ff', fg='#2c3e50')
         title.pack(pady=(0, 20))
         
         # Button frame
-        btn_frame = tk.Frame(self.content_frame, bg='#f0f8ff')
+        btn_frame = tk.Frame(frame, bg='#f0f8ff')
         btn_frame.pack(fill='x', pady=10)
         
         tk.Button(btn_frame, text="+ Tambah Pembelian", command=self.add_pembelian,
@@ -680,8 +4026,20 @@ class ApotekSystem:
                  font=('Arial', 10, 'bold'), bg='#e74c3c', fg='white',
                  relief='flat', padx=20, pady=5).pack(side='left', padx=5)
         
+        tk.Button(btn_frame, text="📤 Export CSV", command=lambda: self.export_transaksi('pembelian'),
+                 font=('Arial', 10, 'bold'), bg='#3498db', fg='white',
+                 relief='flat', padx=20, pady=5).pack(side='left', padx=5)
+        
+        tk.Button(btn_frame, text="🧮 Rencana Pembelian", command=self.show_rencana_pembelian,
+                 font=('Arial', 10, 'bold'), bg='#1abc9c', fg='white',
+                 relief='flat', padx=20, pady=5).pack(side='left', padx=5)
+        
+        # Search bar (filled once the pager exists)
+        search_frame = tk.Frame(frame, bg='#f0f8ff')
+        search_frame.pack(fill='x')
+        
         # Table frame
-        table_frame = tk.Frame(self.content_frame, bg='white', relief='raised', bd=2)
+        table_frame = tk.Frame(frame, bg='white', relief='raised', bd=2)
         table_frame.pack(fill='both', expand=True, pady=10)
         
         # Treeview
@@ -694,32 +4052,24 @@ class ApotekSystem:
         
         # Scrollbar
         scrollbar = ttk.Scrollbar(table_frame, orient='vertical', command=self.pembelian_tree.yview)
-        self.pembelian_tree.configure(yscrollcommand=scrollbar.set)
+        self.pembelian_pager = TreePager(self.pembelian_tree, scrollbar, self.repo.fetch_pembelian_page, self.run_db)
+        self.pembelian_pager.enable_sort(URUTAN_PEMBELIAN)
+        
+        # Date range filter and medicine name search
+        self.create_date_filter(btn_frame, self.pembelian_pager)
+        self.create_search_bar(search_frame, self.pembelian_pager, column='nama_obat')
         
         self.pembelian_tree.pack(side='left', fill='both', expand=True, padx=10, pady=10)
         scrollbar.pack(side='right', fill='y', pady=10)
         
         # Load data
+        self.screen_refresh['pembelian'] = self.load_pembelian_data
         self.load_pembelian_data()
         
     def load_pembelian_data(self):
         """Load data pembelian"""
-        # Clear existing items
-        for item in self.pembelian_tree.get_children():
-            self.pembelian_tree.delete(item)
-            
-        # Get data from database with JOIN
-        self.cursor.execute("""
-            SELECT p.id, o.nama_obat, p.nama_supplier, p.jumlah, p.harga_satuan, 
-                   p.total_harga, p.tanggal_pembelian
-            FROM pembelian p
-            JOIN obat o ON p.id_obat = o.id
-            ORDER BY p.id DESC
-        """)
+        self.pembelian_pager.reset()
         
-        for row in self.cursor.fetchall():
-            self.pembelian_tree.insert('', 'end', values=row)
-            
     def add_pembelian(self):
         """Tambah pembelian baru"""
         self.pembelian_form_window("Tambah Pembelian Baru")
@@ -746,11 +4096,100 @@ class ApotekSystem:
         pembelian_id = item['values'][0]
         
         if messagebox.askyesno("Konfirmasi", "Apakah Anda yakin ingin menghapus pembelian ini?"):
-            self.cursor.execute("DELETE FROM pembelian WHERE id = ?", (pembelian_id,))
-            self.conn.commit()
-            self.load_pembelian_data()
-            messagebox.showinfo("Sukses", "Pembelian berhasil dihapus!")
+            self.run_db(self.repo.delete_pembelian_row, pembelian_id,
+                        on_success=lambda _: self.on_pembelian_deleted(pembelian_id), write=True)
+            
+    def on_pembelian_deleted(self, pembelian_id):
+        """Hapus baris dari tabel setelah pembelian dihapus"""
+        if self.pembelian_tree.winfo_exists():
+            self.pembelian_pager.remove_row(pembelian_id)
+        messagebox.showinfo("Sukses", "Pembelian berhasil dihapus!")
+            
+    @timed_screen
+    def show_rencana_pembelian(self):
+        """Tampilkan saran pembelian per supplier dari forecast permintaan"""
+        window = tk.Toplevel(self.root)
+        window.title("Rencana Pembelian")
+        window.geometry("900x550")
+        window.configure(bg='#f0f8ff')
+        
+        tk.Label(window, text="🧮 Rencana Pembelian", font=('Arial', 16, 'bold'), 
+                bg='#f0f8ff', fg='#2c3e50').pack(pady=20)
+        
+        control_frame = tk.Frame(window, bg='#f0f8ff')
+        control_frame.pack(fill='x', padx=10)
+        
+        metode = {'Exponential smoothing': 'ses', 'Moving average': 'ma'}
+        tk.Label(control_frame, text="Metode:", font=('Arial', 10, 'bold'),
+                bg='#f0f8ff').pack(side='left')
+        metode_var = tk.StringVar(value='Exponential smoothing')
+        ttk.Combobox(control_frame, textvariable=metode_var, values=list(metode),
+                     state='readonly', width=22).pack(side='left', padx=(2, 8))
+        
+        tk.Label(control_frame, text="Lead Time (hari):", font=('Arial', 10, 'bold'),
+                bg='#f0f8ff').pack(side='left')
+        lead_time_var = tk.IntVar(value=REORDER_LEAD_TIME)
+        tk.Spinbox(control_frame, from_=1, to=90, width=5, textvariable=lead_time_var,
+                   font=('Arial', 10)).pack(side='left', padx=(2, 8))
+        
+        summary_label = tk.Label(window, text="", font=('Arial', 11, 'bold'), bg='#f0f8ff', fg='#2c3e50')
+        summary_label.pack(pady=5)
+        
+        # Suppliers are parent rows, their obat the children
+        columns = ('Stok Layak', 'Permintaan/Hari', 'Reorder Point', 'Pesan', 'Estimasi Biaya')
+        tree = ttk.Treeview(window, columns=columns, show='tree headings', height=15)
+        tree.heading('#0', text='Supplier / Obat')
+        tree.column('#0', width=250)
+        for col in columns:
+            tree.heading(col, text=col)
+            tree.column(col, width=120)
+            
+        scrollbar = ttk.Scrollbar(window, orient='vertical', command=tree.yview)
+        tree.configure(yscrollcommand=scrollbar.set)
+        
+        tree.pack(side='left', fill='both', expand=True, padx=10, pady=10)
+        scrollbar.pack(side='right', fill='y', pady=10)
+        
+        def show_rows(rencana):
+            if not tree.winfo_exists():
+                return
+                
+            for item in tree.get_children():
+                tree.delete(item)
+                
+            per_supplier = {}
+            for nama_supplier, _, nama_obat, stok, permintaan, reorder_point, pesan, biaya in rencana:
+                if nama_supplier not in per_supplier:
+                    per_supplier[nama_supplier] = [tree.insert('', 'end', text=nama_supplier, open=True), 0]
+                parent = per_supplier[nama_supplier]
+                parent[1] += biaya
+                tree.insert(parent[0], 'end', text=nama_obat, values=(
+                    stok, f"{permintaan:.2f}", f"{reorder_point:.0f}", pesan, f"{biaya:,.0f}"))
+                
+            for parent, biaya in per_supplier.values():
+                tree.item(parent, values=('', '', '', '', f"{biaya:,.0f}"))
+                
+            total = sum(biaya for _, biaya in per_supplier.values())
+            summary_label.config(text=f"{len(rencana)} obat dari {len(per_supplier)} supplier, "
+                                      f"estimasi biaya Rp {total:,.0f}")
+            
+        def hitung():
+            try:
+                lead_time = int(lead_time_var.get())
+            except (ValueError, tk.TclError):
+                messagebox.showerror("Error", "Lead time harus berupa angka!")
+                return
+                
+            summary_label.config(text="Menghitung...")
+            self.run_db(self.repo.fetch_rencana_pembelian, metode[metode_var.get()], lead_time,
+                        on_success=show_rows)
             
+        tk.Button(control_frame, text="🧮 Hitung", command=hitung,
+                 font=('Arial', 10, 'bold'), bg='#1abc9c', fg='white',
+                 relief='flat', padx=10, pady=5).pack(side='left', padx=2)
+        
+        hitung()
+        
     def pembelian_form_window(self, title, data=None):
         """Window form untuk tambah/edit pembelian"""
         window = tk.Toplevel(self.root)
@@ -767,25 +4206,28 @@ class ApotekSystem:
         form_frame = tk.Frame(window, bg='#f0f8ff')
         form_frame.pack(padx=30, pady=10, fill='both', expand=True)
         
-        # Get obat list for dropdown
-        self.cursor.execute("SELECT id, nama_obat FROM obat")
-        obat_list = self.cursor.fetchall()
-        
         # Obat selection
         tk.Label(form_frame, text="Pilih Obat:", font=('Arial', 11, 'bold'), 
                 bg='#f0f8ff').pack(anchor='w', pady=(10, 0))
         
         obat_var = tk.StringVar()
         obat_combo = ttk.Combobox(form_frame, textvariable=obat_var, font=('Arial', 11), width=37)
-        obat_combo['values'] = [f"{obat[0]} - {obat[1]}" for obat in obat_list]
         obat_combo.pack(pady=(5, 0), fill='x')
         
+        # Typeahead: only the top matches for what has been typed are loaded
+        obat_picker = ObatPicker(obat_combo, self.repo.fetch_obat_options, self.run_db)
+        
+        # Find and select obat if editing
+        if data:
+            obat_picker.select_name(data[1])  # data[1] is obat name
+        
         # Other fields
         fields = [
             ("Nama Supplier:", "nama_supplier"),
             ("Jumlah:", "jumlah"),
             ("Harga Satuan:", "harga_satuan"),
-            ("Tanggal Pembelian:", "tanggal_pembelian")
+            ("Tanggal Pembelian:", "tanggal_pembelian"),
+            ("Tanggal Expired Lot (opsional):", "expired_date")
         ]
         
         entries = {}
@@ -827,12 +4269,6 @@ class ApotekSystem:
         
         # Fill data if editing
         if data:
-            # Find and select obat
-            for i, (obat_id, obat_name) in enumerate(obat_list):
-                if obat_name == data[1]:  # data[1] is obat name
-                    obat_combo.current(i)
-                    break
-            
             # Fill other fields
             field_values = [data[2], data[3], data[4], data[6]]  # supplier, jumlah, harga_satuan, tanggal
             for i, field in enumerate(['nama_supplier', 'jumlah', 'harga_satuan', 'tanggal_pembelian']):
@@ -846,7 +4282,9 @@ class ApotekSystem:
         
         def save_pembelian():
             # Validate input
-            if not obat_var.get() or not all(entries[field].get().strip() for field in entries):
+            # Lot expiry may be left empty
+            if not obat_var.get() or not all(entries[field].get().strip() for field in entries
+                                             if field != 'expired_date'):
                 messagebox.showerror("Error", "Semua field harus diisi!")
                 return
                 
@@ -864,52 +4302,54 @@ class ApotekSystem:
                 
                 # Validate date format
                 datetime.strptime(values['tanggal_pembelian'], '%Y-%m-%d')
+                if values['expired_date']:
+                    datetime.strptime(values['expired_date'], '%Y-%m-%d')
                 
-                if data:  # Edit mode
-                    self.cursor.execute("""
-                        UPDATE pembelian SET id_obat=?, nama_supplier=?, jumlah=?, 
-                        harga_satuan=?, total_harga=?, tanggal_pembelian=? WHERE id=?
-                    """, (obat_id, values['nama_supplier'], jumlah, harga_satuan, 
-                         total_harga, values['tanggal_pembelian'], data[0]))
-                else:  # Add mode
-                    self.cursor.execute("""
-                        INSERT INTO pembelian (id_obat, nama_supplier, jumlah, 
-                        harga_satuan, total_harga, tanggal_pembelian) VALUES (?, ?, ?, ?, ?, ?)
-                    """, (obat_id, values['nama_supplier'], jumlah, harga_satuan, 
-                         total_harga, values['tanggal_pembelian']))
-                    
-                    # Update stok obat
-                    self.cursor.execute("UPDATE obat SET stok = stok + ? WHERE id = ?", (jumlah, obat_id))
+            except ValueError as e:
+                messagebox.showerror("Error", "Format data tidak valid!\nJumlah harus berupa angka, Harga harus berupa angka, Tanggal format: YYYY-MM-DD")
+                return
                 
-                self.conn.commit()
-                self.load_pembelian_data()
+            row = (obat_id, values['nama_supplier'], jumlah, harga_satuan,
+                   total_harga, values['tanggal_pembelian'])
+            
+            def on_saved(pembelian_id):
+                if self.pembelian_tree.winfo_exists():
+                    self.pembelian_pager.refresh_rows([pembelian_id])
                 window.destroy()
                 messagebox.showinfo("Sukses", "Data pembelian berhasil disimpan!")
                 
-            except ValueError as e:
-                messagebox.showerror("Error", "Format data tidak valid!\nJumlah harus berupa angka, Harga harus berupa angka, Tanggal format: YYYY-MM-DD")
-            except Exception as e:
+            def on_failed(e):
+                save_button.config(state='normal')
                 messagebox.showerror("Error", f"Terjadi kesalahan: {str(e)}")
+                
+            # Save in the background, disable the button to avoid double submits
+            save_button.config(state='disabled')
+            self.run_db(self.repo.save_pembelian_row, row, data[0] if data else None,
+                        values['expired_date'] or None, on_success=on_saved, on_error=on_failed, write=True)
         
-        tk.Button(btn_frame, text="💾 Simpan", command=save_pembelian,
-                 font=('Arial', 11, 'bold'), bg='#27ae60', fg='white',
-                 relief='flat', padx=30, pady=10).pack(side='left', padx=10)
+        save_button = tk.Button(btn_frame, text="💾 Simpan", command=save_pembelian,
+                               font=('Arial', 11, 'bold'), bg='#27ae60', fg='white',
+                               relief='flat', padx=30, pady=10)
+        save_button.pack(side='left', padx=10)
         
         tk.Button(btn_frame, text="❌ Batal", command=window.destroy,
                  font=('Arial', 11, 'bold'), bg='#e74c3c', fg='white',
                  relief='flat', padx=30, pady=10).pack(side='left', padx=10)
         
+    @timed_screen
     def show_penjualan(self):
         """Menampilkan data penjualan"""
-        self.clear_content()
+        frame = self.open_screen('penjualan')
+        if frame is None:
+            return
         
         # Title
-        title = tk.Label(self.content_frame, text="💰 Data Penjualan", 
+        title = tk.Label(frame, text="💰 Data Penjualan", 
                         font=('Arial', 18, 'bold'), bg='#f0f8ff', fg='#2c3e50')
         title.pack(pady=(0, 20))
         
         # Button frame
-        btn_frame = tk.Frame(self.content_frame, bg='#f0f8ff')
+        btn_frame = tk.Frame(frame, bg='#f0f8ff')
         btn_frame.pack(fill='x', pady=10)
         
         tk.Button(btn_frame, text="+ Tambah Penjualan", command=self.add_penjualan,
@@ -924,8 +4364,20 @@ class ApotekSystem:
                  font=('Arial', 10, 'bold'), bg='#e74c3c', fg='white',
                  relief='flat', padx=20, pady=5).pack(side='left', padx=5)
         
+        tk.Button(btn_frame, text="🛒 Keranjang", command=self.keranjang_window,
+                 font=('Arial', 10, 'bold'), bg='#9b59b6', fg='white',
+                 relief='flat', padx=20, pady=5).pack(side='left', padx=5)
+        
+        tk.Button(btn_frame, text="📤 Export CSV", command=lambda: self.export_transaksi('penjualan'),
+                 font=('Arial', 10, 'bold'), bg='#3498db', fg='white',
+                 relief='flat', padx=20, pady=5).pack(side='left', padx=5)
+        
+        # Search bar (filled once the pager exists)
+        search_frame = tk.Frame(frame, bg='#f0f8ff')
+        search_frame.pack(fill='x')
+        
         # Table frame
-        table_frame = tk.Frame(self.content_frame, bg='white', relief='raised', bd=2)
+        table_frame = tk.Frame(frame, bg='white', relief='raised', bd=2)
         table_frame.pack(fill='both', expand=True, pady=10)
         
         # Treeview
@@ -938,33 +4390,24 @@ class ApotekSystem:
         
         # Scrollbar
         scrollbar = ttk.Scrollbar(table_frame, orient='vertical', command=self.penjualan_tree.yview)
-        self.penjualan_tree.configure(yscrollcommand=scrollbar.set)
+        self.penjualan_pager = TreePager(self.penjualan_tree, scrollbar, self.repo.fetch_penjualan_page, self.run_db)
+        self.penjualan_pager.enable_sort(URUTAN_PENJUALAN)
+        
+        # Date range filter and medicine name search
+        self.create_date_filter(btn_frame, self.penjualan_pager)
+        self.create_search_bar(search_frame, self.penjualan_pager, column='nama_obat')
         
         self.penjualan_tree.pack(side='left', fill='both', expand=True, padx=10, pady=10)
         scrollbar.pack(side='right', fill='y', pady=10)
         
         # Load data
+        self.screen_refresh['penjualan'] = self.load_penjualan_data
         self.load_penjualan_data()
         
     def load_penjualan_data(self):
         """Load data penjualan"""
-        # Clear existing items
-        for item in self.penjualan_tree.get_children():
-            self.penjualan_tree.delete(item)
-            
-        # Get data from database with JOIN
-        self.cursor.execute("""
-            SELECT p.id, o.nama_obat, pg.nama_pegawai, p.nama_pembeli, p.jumlah, 
-                   p.harga_satuan, p.total_harga, p.tanggal_penjualan
-            FROM penjualan p
-            JOIN obat o ON p.id_obat = o.id
-            JOIN pegawai pg ON p.id_pegawai = pg.id
-            ORDER BY p.id DESC
-        """)
+        self.penjualan_pager.reset()
         
-        for row in self.cursor.fetchall():
-            self.penjualan_tree.insert('', 'end', values=row)
-            
     def add_penjualan(self):
         """Tambah penjualan baru"""
         self.penjualan_form_window("Tambah Penjualan Baru")
@@ -991,10 +4434,14 @@ class ApotekSystem:
         penjualan_id = item['values'][0]
         
         if messagebox.askyesno("Konfirmasi", "Apakah Anda yakin ingin menghapus penjualan ini?"):
-            self.cursor.execute("DELETE FROM penjualan WHERE id = ?", (penjualan_id,))
-            self.conn.commit()
-            self.load_penjualan_data()
-            messagebox.showinfo("Sukses", "Penjualan berhasil dihapus!")
+            self.run_db(self.repo.delete_penjualan_row, penjualan_id,
+                        on_success=lambda _: self.on_penjualan_deleted(penjualan_id), write=True)
+            
+    def on_penjualan_deleted(self, penjualan_id):
+        """Hapus baris dari tabel setelah penjualan dihapus"""
+        if self.penjualan_tree.winfo_exists():
+            self.penjualan_pager.remove_row(penjualan_id)
+        messagebox.showinfo("Sukses", "Penjualan berhasil dihapus!")
             
     def penjualan_form_window(self, title, data=None):
         """Window form untuk tambah/edit penjualan"""
@@ -1012,20 +4459,12 @@ class ApotekSystem:
         form_frame = tk.Frame(window, bg='#f0f8ff')
         form_frame.pack(padx=30, pady=10, fill='both', expand=True)
         
-        # Get obat and pegawai lists for dropdown
-        self.cursor.execute("SELECT id, nama_obat, harga_jual, stok FROM obat WHERE stok > 0")
-        obat_list = self.cursor.fetchall()
-        
-        self.cursor.execute("SELECT id, nama_pegawai FROM pegawai")
-        pegawai_list = self.cursor.fetchall()
-        
         # Obat selection
         tk.Label(form_frame, text="Pilih Obat:", font=('Arial', 11, 'bold'), 
                 bg='#f0f8ff').pack(anchor='w', pady=(10, 0))
         
         obat_var = tk.StringVar()
         obat_combo = ttk.Combobox(form_frame, textvariable=obat_var, font=('Arial', 11), width=37)
-        obat_combo['values'] = [f"{obat[0]} - {obat[1]} (Rp {obat[2]:,.0f}) - Stok: {obat[3]}" for obat in obat_list]
         obat_combo.pack(pady=(5, 0), fill='x')
         
         # Pegawai selection
@@ -1034,9 +4473,35 @@ class ApotekSystem:
         
         pegawai_var = tk.StringVar()
         pegawai_combo = ttk.Combobox(form_frame, textvariable=pegawai_var, font=('Arial', 11), width=37)
-        pegawai_combo['values'] = [f"{pegawai[0]} - {pegawai[1]}" for pegawai in pegawai_list]
         pegawai_combo.pack(pady=(5, 0), fill='x')
         
+        # Typeahead over obat in stock, only the top matches are loaded
+        obat_picker = ObatPicker(obat_combo, self.repo.fetch_obat_options, self.run_db,
+                                 in_stock=True, with_harga=True)
+        
+        def fill_pegawai_options(pegawai_list):
+            if not window.winfo_exists():
+                return
+                
+            pegawai_combo['values'] = [f"{pegawai[0]} - {pegawai[1]}" for pegawai in pegawai_list]
+            
+            # Find and select pegawai
+            if data:
+                for i, pegawai in enumerate(pegawai_list):
+                    if pegawai[1] == data[2]:  # data[2] is pegawai name
+                        pegawai_combo.current(i)
+                        break
+                        
+        # Find and select obat if editing
+        if data:
+            obat_picker.select_name(data[1])  # data[1] is obat name
+            
+        # Drop cached prices/stock if another terminal wrote since the last check
+        self.check_data_version()
+        
+        # Get pegawai list for dropdown in the background
+        self.run_db(self.repo.fetch_pegawai_options, on_success=fill_pegawai_options)
+        
         # Other fields
         fields = [
             ("Nama Pembeli:", "nama_pembeli"),
@@ -1069,19 +4534,29 @@ class ApotekSystem:
         total_entry.pack(pady=(5, 0), fill='x')
         
         # Update harga when obat changes
+        def show_harga(obat):
+            if not obat or not window.winfo_exists():
+                return
+                
+            harga_entry.config(state='normal')
+            harga_entry.delete(0, 'end')
+            harga_entry.insert(0, f"{obat[2]:,.2f}")
+            harga_entry.config(state='readonly')
+            
+            calculate_total()
+            
         def update_harga(*args):
-            if obat_var.get():
-                try:
-                    harga_jual = float(obat_var.get().split('(Rp ')[1].split(')')[0].replace(',', ''))
-                    
-                    harga_entry.config(state='normal')
-                    harga_entry.delete(0, 'end')
-                    harga_entry.insert(0, f"{harga_jual:,.2f}")
-                    harga_entry.config(state='readonly')
-                    
-                    calculate_total()
-                except:
-                    pass
+            try:
+                obat_id = int(obat_var.get().split(' - ')[0])
+            except ValueError:
+                return
+                
+            # Display price from the catalog cache (the save re-reads it), the database only on a miss
+            obat = self.repo.cache.get(obat_id)
+            if obat:
+                show_harga(obat)
+            else:
+                self.run_db(self.repo.get_obat, obat_id, on_success=show_harga)
         
         obat_var.trace('w', update_harga)
         
@@ -1106,18 +4581,6 @@ class ApotekSystem:
         
         # Fill data if editing
         if data:
-            # Find and select obat
-            for i, obat in enumerate(obat_list):
-                if obat[1] == data[1]:  # data[1] is obat name
-                    obat_combo.current(i)
-                    break
-            
-            # Find and select pegawai
-            for i, pegawai in enumerate(pegawai_list):
-                if pegawai[1] == data[2]:  # data[2] is pegawai name
-                    pegawai_combo.current(i)
-                    break
-            
             # Fill other fields
             entries['nama_pembeli'].insert(0, str(data[3]))
             entries['jumlah'].insert(0, str(data[4]))
@@ -1148,54 +4611,422 @@ class ApotekSystem:
                 harga_satuan = float(harga_entry.get().replace(',', ''))
                 total_harga = jumlah * harga_satuan
                 
-                # Check stok
-                self.cursor.execute("SELECT stok FROM obat WHERE id = ?", (obat_id,))
-                current_stok = self.cursor.fetchone()[0]
-                
-                if not data and jumlah > current_stok:
-                    messagebox.showerror("Error", f"Stok tidak mencukupi! Stok tersedia: {current_stok}")
-                    return
-                
                 # Validate date format
                 datetime.strptime(values['tanggal_penjualan'], '%Y-%m-%d')
                 
-                if data:  # Edit mode
-                    self.cursor.execute("""
-                        UPDATE penjualan SET id_obat=?, id_pegawai=?, nama_pembeli=?, jumlah=?, 
-                        harga_satuan=?, total_harga=?, tanggal_penjualan=? WHERE id=?
-                    """, (obat_id, pegawai_id, values['nama_pembeli'], jumlah, harga_satuan, 
-                         total_harga, values['tanggal_penjualan'], data[0]))
-                else:  # Add mode
-                    self.cursor.execute("""
-                        INSERT INTO penjualan (id_obat, id_pegawai, nama_pembeli, jumlah, 
-                        harga_satuan, total_harga, tanggal_penjualan) VALUES (?, ?, ?, ?, ?, ?, ?)
-                    """, (obat_id, pegawai_id, values['nama_pembeli'], jumlah, harga_satuan, 
-                         total_harga, values['tanggal_penjualan']))
-                    
-                    # Update stok obat
-                    self.cursor.execute("UPDATE obat SET stok = stok - ? WHERE id = ?", (jumlah, obat_id))
+            except ValueError as e:
+                messagebox.showerror("Error", "Format data tidak valid!\nJumlah harus berupa angka, Tanggal format: YYYY-MM-DD")
+                return
+                
+            # Early stock check against the cache, the guarded UPDATE still decides
+            obat = self.repo.cache.get(obat_id)
+            if not data and obat and jumlah > obat[3]:
+                messagebox.showerror("Error", str(StokTidakCukupError(obat[3])))
+                return
                 
-                self.conn.commit()
-                self.load_penjualan_data()
+            row = (obat_id, pegawai_id, values['nama_pembeli'], jumlah, harga_satuan,
+                   total_harga, values['tanggal_penjualan'])
+            
+            def on_saved(penjualan_id):
+                if self.penjualan_tree.winfo_exists():
+                    self.penjualan_pager.refresh_rows([penjualan_id])
                 window.destroy()
                 messagebox.showinfo("Sukses", "Data penjualan berhasil disimpan!")
                 
-            except ValueError as e:
-                messagebox.showerror("Error", "Format data tidak valid!\nJumlah harus berupa angka, Tanggal format: YYYY-MM-DD")
-            except Exception as e:
-                messagebox.showerror("Error", f"Terjadi kesalahan: {str(e)}")
+            def on_failed(e):
+                save_button.config(state='normal')
+                if isinstance(e, StokTidakCukupError):
+                    messagebox.showerror("Error", str(e))
+                else:
+                    messagebox.showerror("Error", f"Terjadi kesalahan: {str(e)}")
+                    
+            # Save in the background, disable the button to avoid double submits
+            save_button.config(state='disabled')
+            self.run_db(self.repo.save_penjualan_row, row, data[0] if data else None,
+                        on_success=on_saved, on_error=on_failed, write=True)
         
-        tk.Button(btn_frame, text="💾 Simpan", command=save_penjualan,
-                 font=('Arial', 11, 'bold'), bg='#27ae60', fg='white',
+        save_button = tk.Button(btn_frame, text="💾 Simpan", command=save_penjualan,
+                               font=('Arial', 11, 'bold'), bg='#27ae60', fg='white',
+                               relief='flat', padx=30, pady=10)
+        save_button.pack(side='left', padx=10)
+        
+        tk.Button(btn_frame, text="❌ Batal", command=window.destroy,
+                 font=('Arial', 11, 'bold'), bg='#e74c3c', fg='white',
                  relief='flat', padx=30, pady=10).pack(side='left', padx=10)
         
+    def keranjang_window(self):
+        """Window kasir: beberapa obat dalam satu penjualan, disimpan sekaligus"""
+        window = tk.Toplevel(self.root)
+        window.title("Keranjang Penjualan")
+        window.geometry("650x650")
+        window.configure(bg='#f0f8ff')
+        
+        # Title
+        tk.Label(window, text="🛒 Keranjang Penjualan", font=('Arial', 16, 'bold'), 
+                bg='#f0f8ff', fg='#2c3e50').pack(pady=20)
+        
+        # Form frame
+        form_frame = tk.Frame(window, bg='#f0f8ff')
+        form_frame.pack(padx=30, fill='x')
+        
+        tk.Label(form_frame, text="Pilih Pegawai:", font=('Arial', 11, 'bold'), 
+                bg='#f0f8ff').grid(row=0, column=0, sticky='w', pady=5)
+        pegawai_var = tk.StringVar()
+        pegawai_combo = ttk.Combobox(form_frame, textvariable=pegawai_var, font=('Arial', 11), width=30)
+        pegawai_combo.grid(row=0, column=1, sticky='w', pady=5)
+        
+        tk.Label(form_frame, text="Nama Pembeli:", font=('Arial', 11, 'bold'), 
+                bg='#f0f8ff').grid(row=1, column=0, sticky='w', pady=5)
+        pembeli_entry = tk.Entry(form_frame, font=('Arial', 11), width=32)
+        pembeli_entry.grid(row=1, column=1, sticky='w', pady=5)
+        
+        tk.Label(form_frame, text="Tanggal Penjualan:", font=('Arial', 11, 'bold'), 
+                bg='#f0f8ff').grid(row=2, column=0, sticky='w', pady=5)
+        tanggal_entry = tk.Entry(form_frame, font=('Arial', 11), width=32)
+        tanggal_entry.insert(0, datetime.now().strftime('%Y-%m-%d'))
+        tanggal_entry.grid(row=2, column=1, sticky='w', pady=5)
+        
+        # Item picker: choose from the list, or type/scan the obat ID and press Enter
+        tk.Label(form_frame, text="Obat (ID / pilih):", font=('Arial', 11, 'bold'), 
+                bg='#f0f8ff').grid(row=3, column=0, sticky='w', pady=5)
+        obat_var = tk.StringVar()
+        obat_combo = ttk.Combobox(form_frame, textvariable=obat_var, font=('Arial', 11), width=30)
+        obat_combo.grid(row=3, column=1, sticky='w', pady=5)
+        
+        tk.Label(form_frame, text="Jumlah:", font=('Arial', 11, 'bold'), 
+                bg='#f0f8ff').grid(row=4, column=0, sticky='w', pady=5)
+        jumlah_entry = tk.Entry(form_frame, font=('Arial', 11), width=10)
+        jumlah_entry.insert(0, "1")
+        jumlah_entry.grid(row=4, column=1, sticky='w', pady=5)
+        
+        # Cart table, one row per obat (iid is the obat id)
+        columns = ('Obat', 'Jumlah', 'Harga Satuan', 'Subtotal')
+        cart_tree = ttk.Treeview(window, columns=columns, show='headings', height=8)
+        for col in columns:
+            cart_tree.heading(col, text=col)
+            cart_tree.column(col, width=140)
+        cart_tree.pack(padx=30, pady=10, fill='both', expand=True)
+        
+        total_label = tk.Label(window, text="Total: Rp 0", font=('Arial', 14, 'bold'),
+                              bg='#f0f8ff', fg='#2c3e50')
+        total_label.pack(anchor='e', padx=30)
+        
+        cart = {}  # obat_id -> [nama_obat, jumlah, harga_satuan]
+        
+        # Drop cached prices/stock if another terminal wrote since the last check
+        self.check_data_version()
+        
+        # Typeahead over obat in stock, only the top matches are loaded
+        ObatPicker(obat_combo, self.repo.fetch_obat_options, self.run_db, in_stock=True, with_harga=True)
+        
+        def fill_pegawai_options(pegawai_list):
+            if window.winfo_exists():
+                pegawai_combo['values'] = [f"{pegawai[0]} - {pegawai[1]}" for pegawai in pegawai_list]
+                
+        # Get pegawai list for dropdown in the background
+        self.run_db(self.repo.fetch_pegawai_options, on_success=fill_pegawai_options)
+        
+        def refresh_cart():
+            cart_tree.delete(*cart_tree.get_children())
+            for obat_id, (nama_obat, jumlah, harga_satuan) in cart.items():
+                cart_tree.insert('', 'end', iid=str(obat_id), values=(
+                    nama_obat, jumlah, f"{harga_satuan:,.2f}", f"{jumlah * harga_satuan:,.2f}"))
+                    
+            total = sum(jumlah * harga_satuan for _, jumlah, harga_satuan in cart.values())
+            total_label.config(text=f"Total: Rp {total:,.0f}")
+            
+        def add_item(event=None):
+            try:
+                obat_id = int(obat_var.get().split(' - ')[0])
+                jumlah = int(jumlah_entry.get())
+            except ValueError:
+                messagebox.showerror("Error", "ID obat dan jumlah harus berupa angka!", parent=window)
+                return
+                
+            # Price and stock from the catalog cache for display, checkout re-reads both
+            obat = self.repo.cache.get(obat_id)
+            if obat:
+                put_item(obat, jumlah)
+            else:
+                self.run_db(self.repo.get_obat, obat_id, on_success=lambda obat: put_item(obat, jumlah))
+                
+        def put_item(obat, jumlah):
+            if not window.winfo_exists():
+                return
+                
+            if not obat or obat[3] <= 0 or jumlah <= 0:
+                messagebox.showerror("Error", "Obat tidak ditemukan atau stok habis!", parent=window)
+                return
+                
+            obat_id, nama_obat, harga_jual, stok, _ = obat
+            jumlah += cart.get(obat_id, [None, 0])[1]
+            if jumlah > stok:
+                messagebox.showerror("Error", f"Stok tidak mencukupi! Stok tersedia: {stok}", parent=window)
+                return
+                
+            cart[obat_id] = [nama_obat, jumlah, harga_jual]
+            refresh_cart()
+            
+            # Ready for the next scan
+            obat_var.set("")
+            jumlah_entry.delete(0, 'end')
+            jumlah_entry.insert(0, "1")
+            obat_combo.focus_set()
+            
+        def remove_item():
+            for iid in cart_tree.selection():
+                cart.pop(int(iid), None)
+            refresh_cart()
+            
+        obat_combo.bind('<Return>', add_item)
+        jumlah_entry.bind('<Return>', add_item)
+        
+        item_frame = tk.Frame(form_frame, bg='#f0f8ff')
+        item_frame.grid(row=4, column=1, sticky='e')
+        
+        tk.Button(item_frame, text="+ Tambah", command=add_item,
+                 font=('Arial', 10, 'bold'), bg='#27ae60', fg='white',
+                 relief='flat', padx=10, pady=3).pack(side='left', padx=2)
+        
+        tk.Button(item_frame, text="Hapus Item", command=remove_item,
+                 font=('Arial', 10, 'bold'), bg='#e74c3c', fg='white',
+                 relief='flat', padx=10, pady=3).pack(side='left', padx=2)
+        
+        # Button frame
+        btn_frame = tk.Frame(window, bg='#f0f8ff')
+        btn_frame.pack(pady=20)
+        
+        def checkout():
+            if not cart or not pegawai_var.get() or not pembeli_entry.get().strip():
+                messagebox.showerror("Error", "Pegawai, nama pembeli dan minimal satu obat harus diisi!", parent=window)
+                return
+                
+            try:
+                pegawai_id = int(pegawai_var.get().split(' - ')[0])
+                tanggal = tanggal_entry.get().strip()
+                datetime.strptime(tanggal, '%Y-%m-%d')
+            except ValueError:
+                messagebox.showerror("Error", "Format data tidak valid!\nTanggal format: YYYY-MM-DD", parent=window)
+                return
+                
+            items = [(obat_id, jumlah, harga_satuan) for obat_id, (_, jumlah, harga_satuan) in cart.items()]
+            
+            def on_saved(result):
+                penjualan_ids, total = result
+                if self.penjualan_tree.winfo_exists():
+                    self.penjualan_pager.refresh_rows(penjualan_ids)
+                window.destroy()
+                messagebox.showinfo("Sukses", f"{len(items)} item terjual, total Rp {total:,.0f}")
+                
+            def on_failed(e):
+                checkout_button.config(state='normal')
+                if isinstance(e, KeranjangStokError):
+                    messagebox.showerror("Error", str(e), parent=window)
+                else:
+                    messagebox.showerror("Error", f"Terjadi kesalahan: {str(e)}", parent=window)
+                    
+            # Save in the background, disable the button to avoid double submits
+            checkout_button.config(state='disabled')
+            self.run_db(self.repo.checkout_keranjang, pegawai_id, pembeli_entry.get().strip(), tanggal, items,
+                        on_success=on_saved, on_error=on_failed, write=True)
+            
+        checkout_button = tk.Button(btn_frame, text="💾 Bayar", command=checkout,
+                                   font=('Arial', 11, 'bold'), bg='#27ae60', fg='white',
+                                   relief='flat', padx=30, pady=10)
+        checkout_button.pack(side='left', padx=10)
+        
         tk.Button(btn_frame, text="❌ Batal", command=window.destroy,
                  font=('Arial', 11, 'bold'), bg='#e74c3c', fg='white',
                  relief='flat', padx=30, pady=10).pack(side='left', padx=10)
 
+def seed_benchmark_data(cursor, jumlah_penjualan):
+    """Isi database dengan data sintetis: obat, pegawai, pembelian dan penjualan"""
+    rng = random.Random(42)
+    jumlah_obat = 1000
+    jumlah_pegawai = 20
+    hari_terakhir = datetime.now().toordinal()
+    
+    def tanggal(hari):
+        return datetime.fromordinal(hari).strftime('%Y-%m-%d')
+        
+    cursor.executemany("""
+        INSERT INTO obat (nama_obat, kategori, harga_beli, 
+        harga_jual, stok, expired_date) VALUES (?, ?, ?, ?, ?, ?)
+    """, ((f"Obat {i:04d}", f"Kategori {i % 20}", 1000 + i, 1500 + i, 10 ** 9,
+           tanggal(hari_terakhir + 365)) for i in range(jumlah_obat)))
+    
+    cursor.executemany("""
+        INSERT INTO pegawai (nama_pegawai, jabatan, alamat, 
+        telepon, gaji, tanggal_masuk) VALUES (?, ?, ?, ?, ?, ?)
+    """, ((f"Pegawai {i}", "Kasir", "Jl. Contoh", "08123456789", 3000000,
+           tanggal(hari_terakhir - 1000)) for i in range(jumlah_pegawai)))
+    
+    def transaksi(jumlah):
+        # Spread over the last year, in date order like a real till
+        for i in range(jumlah):
+            hari = hari_terakhir - 365 + i * 365 // jumlah
+            yield hari, rng.randint(1, jumlah_obat), rng.randint(1, 10)
+            
+    cursor.executemany("""
+        INSERT INTO pembelian (id_obat, nama_supplier, jumlah, harga_satuan, 
+        total_harga, tanggal_pembelian, hari_pembelian, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    """, ((obat_id, "Supplier", jumlah * 10, 1000, jumlah * 10000, tanggal(hari), hari,
+           f"{tanggal(hari)} 08:00:00") for hari, obat_id, jumlah in transaksi(jumlah_penjualan // 10)))
+    
+    cursor.executemany("""
+        INSERT INTO penjualan (id_obat, id_pegawai, nama_pembeli, jumlah, harga_satuan, 
+        total_harga, tanggal_penjualan, hari_penjualan, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, ((obat_id, rng.randint(1, jumlah_pegawai), "Pembeli", jumlah, 1500, jumlah * 1500,
+           tanggal(hari), hari, f"{tanggal(hari)} 12:00:00")
+          for hari, obat_id, jumlah in transaksi(jumlah_penjualan)))
+    
+    # Stock ledger for the seeded transactions, like the migration backfill
+    cursor.execute("""
+        INSERT INTO mutasi_stok (id_obat, hari, perubahan, sumber, id_sumber)
+        SELECT id_obat, hari_pembelian, jumlah, 'pembelian', id FROM pembelian
+    """)
+    cursor.execute("""
+        INSERT INTO mutasi_stok (id_obat, hari, perubahan, sumber, id_sumber)
+        SELECT id_obat, hari_penjualan, -jumlah, 'penjualan', id FROM penjualan
+    """)
+    
+    # A lot per purchase expiring 6 to 24 months later, plus the catalog stock as one lot per obat
+    cursor.execute("""
+        INSERT INTO lot_obat (id_obat, id_pembelian, expired_date, hari_expired, jumlah_awal, sisa)
+        SELECT id_obat, id, date(hari_pembelian + 180 + id % 540 + 1721424.5), 
+               hari_pembelian + 180 + id % 540, jumlah, jumlah
+        FROM pembelian
+    """)
+    cursor.execute("""
+        INSERT INTO lot_obat (id_obat, expired_date, hari_expired, jumlah_awal, sisa)
+        SELECT id, expired_date, ?, stok, stok FROM obat
+    """, (hari_terakhir + 365,))
+    
+    cursor.connection.commit()
+    
+def time_operation(func, *args, repeat=BENCHMARK_REPEAT):
+    """Jalankan func beberapa kali, kembalikan waktu tiap putaran dalam milidetik"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+    
+def run_benchmark(sizes=BENCHMARK_SIZES, db_path=':memory:'):
+    """Benchmark operasi list, simpan dan statistik ApotekRepository tanpa GUI"""
+    for size in sizes:
+        # Seeding is meant to be slow, keep it out of the slow-query log
+        repo = ApotekRepository(db_path, stats=QueryStats(slow_query_ms=None))
+        conn = repo.connect()
+        cursor = conn.cursor()
+        
+        print(f"\n== {size:,} penjualan ({db_path}) ==")
+        print(f"{'Operasi':<36}{'median ms':>12}{'max ms':>12}")
+        
+        def report(nama, timings):
+            print(f"{nama:<36}{statistics.median(timings):>12.2f}{max(timings):>12.2f}")
+            
+        report("setup_database", time_operation(repo.setup_database, cursor, repeat=1))
+        report("seed data", time_operation(seed_benchmark_data, cursor, size, repeat=1))
+        repo.optimize_database(cursor)
+        
+        hari_terakhir = datetime.now().toordinal()
+        last_month = {'dari': hari_terakhir - 30, 'sampai': hari_terakhir + 1}
+        today = datetime.now().strftime('%Y-%m-%d')
+        
+        operations = [
+            ("list obat", repo.fetch_obat_page, cursor, None, PAGE_SIZE, {}),
+            ("cari obat", repo.fetch_obat_page, cursor, None, PAGE_SIZE, {'cari': fts_query("obat 01")}),
+            ("list pegawai", repo.fetch_pegawai_data, cursor),
+            ("list pembelian", repo.fetch_pembelian_page, cursor, None, PAGE_SIZE, {}),
+            ("list penjualan", repo.fetch_penjualan_page, cursor, None, PAGE_SIZE, {}),
+            ("list penjualan (halaman tengah)", repo.fetch_penjualan_page, cursor, (size // 2,), PAGE_SIZE, {}),
+            ("list penjualan (30 hari)", repo.fetch_penjualan_page, cursor, None, PAGE_SIZE, last_month),
+            ("list penjualan (cari obat)", repo.fetch_penjualan_page, cursor, None, PAGE_SIZE,
+             {'cari': fts_query("obat 001", 'nama_obat')}),
+            ("list obat (urut stok)", repo.fetch_obat_page, cursor, None, PAGE_SIZE, {'urut': ('Stok', False)}),
+            ("list penjualan (urut total)", repo.fetch_penjualan_page, cursor, None, PAGE_SIZE,
+             {'urut': ('Total', True)}),
+            ("list penjualan (urut tanggal)", repo.fetch_penjualan_page, cursor, None, PAGE_SIZE,
+             {'urut': ('Tanggal', True)}),
+            ("list penjualan (30 hari, urut total)", repo.fetch_penjualan_page, cursor, None, PAGE_SIZE,
+             dict(last_month, urut=('Total', True))),
+            ("transaksi terakhir", repo.fetch_recent_transactions, cursor, RECENT_TRANSACTIONS_LIMIT),
+            ("typeahead obat", repo.fetch_obat_options, cursor, "Obat 01", True),
+            ("lookup obat (cache)", repo.get_obat, cursor, 1),
+            ("statistik dashboard", repo.get_statistics, cursor),
+            ("simpan obat", repo.save_obat_row, cursor,
+             ("Obat Benchmark", "Kategori 0", 1000, 1500, 100, today)),
+            ("simpan pegawai", repo.save_pegawai_row, cursor,
+             ("Pegawai Benchmark", "Kasir", "Jl. Contoh", "08123456789", 3000000, today)),
+            ("simpan pembelian", repo.save_pembelian_row, cursor,
+             (1, "Supplier", 10, 1000, 10000, today)),
+            ("simpan penjualan", repo.save_penjualan_row, cursor,
+             (1, 1, "Pembeli", 1, 1500, 1500, today)),
+            ("edit penjualan", repo.save_penjualan_row, cursor,
+             (1, 1, "Pembeli", 2, 1500, 3000, today), 1),
+            ("checkout keranjang (5 item)", repo.checkout_keranjang, cursor, 1, "Pembeli", today,
+             [(obat_id, 1, 1500) for obat_id in range(1, 6)]),
+        ]
+        for nama, func, *args in operations:
+            report(nama, time_operation(func, *args))
+            
+        repo.buat_snapshot_stok(cursor, hari_terakhir - 30)
+        report("stok per tanggal (snapshot)", time_operation(repo.stok_per_tanggal, cursor, hari_terakhir - 25))
+        report("lot kedaluwarsa (30 hari)", time_operation(repo.fetch_lot_kedaluwarsa, cursor, hari_terakhir + 30))
+        
+        # The first report fills the cache for closed months, later ones only redo the current month
+        report("laporan 12 bulan (pertama)", time_operation(repo.fetch_laporan, cursor, 'bulan',
+                                                              hari_terakhir - 364, hari_terakhir, repeat=1))
+        report("laporan 12 bulan (cache)", time_operation(repo.fetch_laporan, cursor, 'bulan',
+                                                            hari_terakhir - 364, hari_terakhir))
+        if load_numpy():
+            report("rencana pembelian", time_operation(repo.fetch_rencana_pembelian, cursor, repeat=3))
+        
+        # Full scans, only run a few times
+        report("cek statistik dashboard", time_operation(repo.check_dashboard_stats, cursor, repeat=3))
+        report("export penjualan", time_operation(repo.export_transaksi_csv, cursor, 'penjualan',
+                                                  os.devnull, {}, {'rows': 0}, repeat=1))
+        
+        conn.close()
+        if db_path != ':memory:':
+            os.remove(db_path)
+            
 def main():
+    startup = StartupProfile()
+    parser = argparse.ArgumentParser(description="Sistem Informasi Apotek")
+    parser.add_argument('--multi-terminal', action='store_true',
+                        help="mode beberapa kasir berbagi satu apotek.db (WAL, koneksi baca/tulis terpisah)")
+    parser.add_argument('--db', help=f"lokasi file database (default: {DB_PATH}, benchmark: :memory:)")
+    parser.add_argument('--slow-query-ms', type=float, default=SLOW_QUERY_MS, metavar='MS',
+                        help=f"catat query/layar yang selama ini atau lebih (default: {SLOW_QUERY_MS}, 0 = mati)")
+    parser.add_argument('--slow-query-log', default=SLOW_QUERY_LOG, metavar='FILE',
+                        help=f"file log query lambat (default: {SLOW_QUERY_LOG})")
+    parser.add_argument('--backup-interval', type=float, default=BACKUP_INTERVAL, metavar='MENIT',
+                        help=f"interval backup online (default: {BACKUP_INTERVAL}, 0 = hanya tombol backup)")
+    parser.add_argument('--backup-dir', default=BACKUP_DIR, metavar='FOLDER',
+                        help=f"folder backup, relatif terhadap folder database (default: {BACKUP_DIR})")
+    parser.add_argument('--startup-profile', action='store_true',
+                        help="cetak rincian waktu tiap tahap startup")
+    parser.add_argument('--benchmark', nargs='*', type=int, metavar='JUMLAH',
+                        help="jalankan benchmark tanpa GUI dengan jumlah penjualan sintetis "
+                             f"(default: {' '.join(map(str, BENCHMARK_SIZES))})")
+    args = parser.parse_args()
+    
+    if args.benchmark is not None:
+        db_path = args.db or ':memory:'
+        if db_path != ':memory:' and os.path.exists(db_path):
+            parser.error(f"file benchmark {db_path} sudah ada, pilih file baru")
+        run_benchmark(args.benchmark or BENCHMARK_SIZES, db_path)
+        return
+        
     root = tk.Tk()
-    app = ApotekSystem(root)
+    startup.mark('tk.Tk()')
+    app = ApotekSystem(root, multi_terminal=args.multi_terminal, db_path=args.db or DB_PATH,
+                       stats=QueryStats(args.slow_query_ms, args.slow_query_log),
+                       startup=startup if args.startup_profile else None,
+                       backup_interval=args.backup_interval, backup_dir=args.backup_dir)
     root.mainloop()
 
 if __name__ == "__main__":
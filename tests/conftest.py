@@ -0,0 +1,33 @@
+"""Fixture bersama: modul aplikasi dan database sementara yang sudah dimigrasi"""
+import importlib.util
+import os
+
+import pytest
+
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'kelompok 2.py')
+
+
+@pytest.fixture(scope='session')
+def apotek():
+    """'kelompok 2.py' (nama file berspasi) sebagai modul"""
+    spec = importlib.util.spec_from_file_location('apotek', APP_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture
+def db(apotek, tmp_path):
+    """(repo, cursor) pada file database baru dengan satu pegawai (id 1)"""
+    # slow_query_ms=0: no slow-query log in the working directory
+    repo = apotek.ApotekRepository(str(tmp_path / 'apotek.db'), stats=apotek.QueryStats(0))
+    conn = repo.connect()
+    cursor = conn.cursor()
+    repo.setup_database(cursor)
+    cursor.execute("""
+        INSERT INTO pegawai (nama_pegawai, jabatan, alamat, telepon, gaji, tanggal_masuk)
+        VALUES ('Kasir', 'Kasir', 'Jl. Contoh', '08123456789', 3000000, '2024-01-01')
+    """)
+    conn.commit()
+    yield repo, cursor
+    conn.close()
@@ -0,0 +1,72 @@
+"""Arsip per tahun: transaksi pindah utuh ke file arsip dan tetap terbaca lewat sumber_transaksi"""
+import os
+import sqlite3
+from datetime import datetime
+
+import pytest
+
+
+def ringkasan(cursor, sumber, dari, sampai):
+    """(penjualan: baris, jumlah, total), (pembelian: baris, jumlah, total) di [dari, sampai)"""
+    cursor.execute(f"""
+        SELECT COUNT(*), COALESCE(SUM(jumlah), 0), COALESCE(SUM(total_harga), 0) FROM {sumber['penjualan']}
+        WHERE hari_penjualan >= ? AND hari_penjualan < ?
+    """, (dari, sampai))
+    penjualan = cursor.fetchone()
+    cursor.execute(f"""
+        SELECT COUNT(*), COALESCE(SUM(jumlah), 0), COALESCE(SUM(total_harga), 0) FROM {sumber['pembelian']}
+        WHERE hari_pembelian >= ? AND hari_pembelian < ?
+    """, (dari, sampai))
+    return penjualan, cursor.fetchone()
+
+
+def test_arsipkan_tahun_round_trip(apotek, db):
+    repo, cursor = db
+    hari_ini = datetime.now().toordinal()
+    tahun = datetime.now().year - 1
+    dari = datetime(tahun, 1, 1).toordinal()
+    sampai = datetime(tahun + 1, 1, 1).toordinal()
+
+    obat_id = repo.save_obat_row(cursor, ("Obat", "Umum", 1000, 1500, 0, '2099-12-31'))
+    for hari in range(dari - 20, hari_ini + 1, 9):
+        tanggal = datetime.fromordinal(hari).strftime('%Y-%m-%d')
+        repo.save_pembelian_row(cursor, (obat_id, "Supplier", 10, 1000, 10000, tanggal), expired_date='2099-12-31')
+        repo.save_penjualan_row(cursor, (obat_id, 1, "Pembeli", 1 + hari % 4, 1500, 1500 * (1 + hari % 4), tanggal))
+
+    utama = {'penjualan': 'main.penjualan', 'pembelian': 'main.pembelian'}
+    tahun_itu = ringkasan(cursor, utama, dari, sampai)
+    keseluruhan = ringkasan(cursor, utama, 0, hari_ini + 1)
+    cursor.execute("SELECT COUNT(*) FROM alokasi_lot a JOIN penjualan p ON p.id = a.id_penjualan "
+                   "WHERE p.hari_penjualan >= ? AND p.hari_penjualan < ?", (dari, sampai))
+    alokasi = cursor.fetchone()[0]
+    laporan = repo.fetch_laporan(cursor, 'bulan', dari, hari_ini)['periode']
+    assert tahun_itu[0][0] > 0 and tahun_itu[1][0] > 0
+
+    hasil = repo.arsipkan_tahun(cursor, tahun, dari, sampai)
+    schema = f"arsip_{tahun}"
+    assert hasil[0] == tahun
+    assert hasil[2:] == (tahun_itu[0][0], tahun_itu[1][0], alokasi)
+    assert os.path.exists(repo.lokasi_arsip(hasil[1]))
+
+    # Moved, not copied: gone from main, complete in the archive, same totals through the union
+    assert ringkasan(cursor, utama, dari, sampai) == ((0, 0, 0), (0, 0, 0))
+    assert ringkasan(cursor, {'penjualan': f"{schema}.penjualan", 'pembelian': f"{schema}.pembelian"},
+                     dari, sampai) == tahun_itu
+    semua = {jenis: repo.sumber_transaksi(cursor, jenis) for jenis in ('penjualan', 'pembelian')}
+    assert ringkasan(cursor, semua, 0, hari_ini + 1) == keseluruhan
+    assert repo.fetch_laporan(cursor, 'bulan', dari, hari_ini)['periode'] == laporan
+
+    cursor.execute("SELECT tahun, jumlah_penjualan, jumlah_pembelian, jumlah_alokasi FROM arsip_periode")
+    assert cursor.fetchall() == [(tahun, tahun_itu[0][0], tahun_itu[1][0], alokasi)]
+    assert [row[-1] for row in repo.fetch_arsip(cursor, verifikasi=True)] == ["OK"]
+
+    # The archived year is closed for new transactions
+    with pytest.raises(sqlite3.DatabaseError, match="sudah diarsipkan"):
+        repo.save_penjualan_row(cursor, (obat_id, 1, "Pembeli", 1, 1500, 1500, f"{tahun}-06-15"))
+    cursor.connection.rollback()
+
+    # A changed archive row no longer matches the stored checksum
+    cursor.execute(f"UPDATE {schema}.penjualan SET total_harga = total_harga + 1 "
+                   f"WHERE id = (SELECT MIN(id) FROM {schema}.penjualan)")
+    cursor.connection.commit()
+    assert [row[-1] for row in repo.fetch_arsip(cursor, verifikasi=True)] == ["Checksum berbeda"]
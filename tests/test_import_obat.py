@@ -0,0 +1,74 @@
+"""Import CSV obat: lock di tengah import hanya mengulang chunk yang gagal"""
+import csv
+import sqlite3
+
+import pytest
+
+
+@pytest.fixture
+def import_terkunci(apotek, db, tmp_path, monkeypatch):
+    """Jalankan import lewat DatabaseWorker; chunk kedua kena lock sebanyak `kali` percobaan"""
+    repo, cursor = db
+    for i in range(5):
+        repo.save_obat_row(cursor, (f"Obat {i}", "Umum", 1000, 1500, 10, '2099-12-31'))
+
+    path = tmp_path / 'obat.csv'
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(apotek.OBAT_FIELDS)
+        for i in range(apotek.IMPORT_CHUNK_SIZE * 2 + 10):
+            writer.writerow((f"Obat {i}", "Umum", 1000, 1500, 20, '2099-12-31'))
+
+    tulis = repo.tulis_obat_chunk
+    panggilan = []
+    monkeypatch.setattr(apotek.time, 'sleep', lambda detik: None)
+
+    def jalankan(kali):
+        def tulis_terkunci(cursor, rows):
+            panggilan.append(len(rows))
+            if 2 <= len(panggilan) < 2 + kali:
+                # Half-written chunk that the rollback has to undo
+                cursor.execute("INSERT INTO obat (nama_obat, kategori, harga_beli, harga_jual, stok, expired_date) "
+                               "VALUES ('Setengah jalan', 'Umum', 1, 1, 1, '2099-12-31')")
+                raise sqlite3.OperationalError("database is locked")
+            return tulis(cursor, rows)
+
+        monkeypatch.setattr(repo, 'tulis_obat_chunk', tulis_terkunci)
+        worker = apotek.DatabaseWorker(repo)
+        progress = {'rows': 0, 'bytes': 0}
+        try:
+            return worker.submit(repo.import_obat_csv, str(path), progress).result(timeout=30), progress, path
+        finally:
+            worker.stop()
+
+    return jalankan, panggilan
+
+
+def test_lock_mid_import_retries_only_that_chunk(apotek, db, import_terkunci):
+    repo, cursor = db
+    jalankan, panggilan = import_terkunci
+    result, progress, path = jalankan(1)
+    jumlah = apotek.IMPORT_CHUNK_SIZE * 2 + 10
+
+    size = apotek.IMPORT_CHUNK_SIZE
+    assert panggilan == [size, size, size, 10]
+    assert progress['rows'] == jumlah
+    assert progress['bytes'] == path.stat().st_size
+    assert (result['inserted'], result['updated'], result['rejected']) == (jumlah - 5, 5, 0)
+
+    cursor.execute("SELECT COUNT(*), SUM(stok) FROM obat")
+    assert cursor.fetchone() == (jumlah, 20 * jumlah)
+    cursor.execute("SELECT SUM(perubahan) FROM mutasi_stok")
+    assert cursor.fetchone() == (20 * jumlah,)
+
+
+def test_lock_that_outlasts_retries_fails_the_import_without_rerunning_it(apotek, db, import_terkunci):
+    repo, cursor = db
+    jalankan, panggilan = import_terkunci
+    with pytest.raises(sqlite3.OperationalError, match="locked"):
+        jalankan(apotek.LOCK_RETRIES + 1)
+
+    # The committed first chunk stays, and is not written a second time
+    assert panggilan == [apotek.IMPORT_CHUNK_SIZE] * (apotek.LOCK_RETRIES + 2)
+    cursor.execute("SELECT COUNT(*) FROM obat")
+    assert cursor.fetchone() == (apotek.IMPORT_CHUNK_SIZE,)
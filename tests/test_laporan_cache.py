@@ -0,0 +1,58 @@
+"""Cache laporan penjualan: periode tertutup dibuka lagi oleh penjualan mundur tanggal"""
+from datetime import datetime
+
+import pytest
+
+
+def tanggal(hari):
+    return datetime.fromordinal(hari).strftime('%Y-%m-%d')
+
+
+def laporan_langsung(apotek, cursor, granularitas, mulai, akhir):
+    """{label: (transaksi, terjual, pendapatan)} dihitung langsung dari tabel penjualan"""
+    cursor.execute("SELECT hari_penjualan, jumlah, total_harga FROM penjualan WHERE hari_penjualan >= ? AND hari_penjualan < ?",
+                   (mulai, akhir))
+    hasil = {}
+    for hari, jumlah, total in cursor.fetchall():
+        label = apotek.label_periode(granularitas, apotek.periode_laporan(granularitas, hari)[0])
+        transaksi, terjual, pendapatan = hasil.get(label, (0, 0, 0))
+        hasil[label] = (transaksi + 1, terjual + jumlah, pendapatan + total)
+    return hasil
+
+
+@pytest.mark.parametrize('granularitas', ['hari', 'minggu', 'bulan'])
+def test_backdated_sales_reopen_closed_report_periods(apotek, db, granularitas):
+    repo, cursor = db
+    hari_ini = datetime.now().toordinal()
+    awal = hari_ini - 120
+    obat_id = repo.save_obat_row(cursor, ("Obat", "Umum", 1000, 1500, 1000, '2099-12-31'))
+    for i in range(0, 100, 7):
+        repo.save_penjualan_row(cursor, (obat_id, 1, "Pembeli", 1 + i % 3, 1500, 1500 * (1 + i % 3), tanggal(awal + i)))
+
+    mulai, _ = apotek.periode_laporan(granularitas, awal)
+    _, akhir = apotek.periode_laporan(granularitas, hari_ini)
+
+    def cek_laporan():
+        laporan = repo.fetch_laporan(cursor, granularitas, awal, hari_ini)
+        dihitung = {row[0]: row[1:4] for row in laporan['periode'] if row[1]}
+        assert dihitung == laporan_langsung(apotek, cursor, granularitas, mulai, akhir)
+
+    cek_laporan()
+    lama = apotek.periode_laporan(granularitas, awal + 30)[0]
+    cursor.execute("SELECT COUNT(*) FROM laporan_periode WHERE granularitas = ? AND hari_mulai = ?",
+                   (granularitas, lama))
+    assert cursor.fetchone() == (1,)
+
+    # Add, move and delete rows inside periods that are already closed
+    baru = repo.save_penjualan_row(cursor, (obat_id, 1, "Pembeli", 4, 1500, 6000, tanggal(awal + 30)))
+    cursor.execute("SELECT COUNT(*) FROM laporan_periode WHERE granularitas = ? AND hari_mulai = ?",
+                   (granularitas, lama))
+    assert cursor.fetchone() == (0,)
+    cek_laporan()
+
+    repo.save_penjualan_row(cursor, (obat_id, 1, "Pembeli", 2, 1500, 3000, tanggal(awal + 61)), baru)
+    cek_laporan()
+
+    cursor.execute("SELECT id FROM penjualan WHERE hari_penjualan = ?", (awal + 14,))
+    repo.delete_penjualan_row(cursor, cursor.fetchone()[0])
+    cek_laporan()
@@ -0,0 +1,79 @@
+"""Alokasi lot FEFO: expired terdekat dulu, lot yang sudah expired tidak boleh terjual"""
+from datetime import datetime
+
+import pytest
+
+
+def tanggal(hari):
+    return datetime.fromordinal(hari).strftime('%Y-%m-%d')
+
+
+@pytest.fixture
+def obat(db):
+    """Satu obat tanpa stok awal dengan lot expired (10), lot Juni (5), lot Maret (4) dan lot Desember (6)"""
+    repo, cursor = db
+    obat_id = repo.save_obat_row(cursor, ("Obat FEFO", "Umum", 1000, 1500, 0, '2099-12-31'))
+    hari_ini = tanggal(datetime.now().toordinal())
+    lots = {}
+    for expired, jumlah in (('2000-01-01', 10), ('2099-06-30', 5), ('2099-03-31', 4), ('2099-12-31', 6)):
+        pembelian_id = repo.save_pembelian_row(cursor, (obat_id, "Supplier", jumlah, 1000, 1000 * jumlah, hari_ini),
+                                               expired_date=expired)
+        cursor.execute("SELECT id FROM lot_obat WHERE id_pembelian = ?", (pembelian_id,))
+        lots[expired] = cursor.fetchone()[0]
+    return obat_id, lots
+
+
+def sisa_lot(cursor):
+    cursor.execute("SELECT expired_date, sisa FROM lot_obat WHERE expired_date IS NOT NULL ORDER BY id")
+    return dict(cursor.fetchall())
+
+
+def test_sale_takes_earliest_unexpired_lots_first(db, obat):
+    repo, cursor = db
+    obat_id, lots = obat
+    hari_ini = tanggal(datetime.now().toordinal())
+
+    penjualan_id = repo.save_penjualan_row(cursor, (obat_id, 1, "Pembeli", 7, 1500, 10500, hari_ini))
+    cursor.execute("SELECT id_lot, jumlah FROM alokasi_lot WHERE id_penjualan = ?", (penjualan_id,))
+    assert dict(cursor.fetchall()) == {lots['2099-03-31']: 4, lots['2099-06-30']: 3}
+    assert sisa_lot(cursor) == {'2000-01-01': 10, '2099-03-31': 0, '2099-06-30': 2, '2099-12-31': 6}
+
+    # Taking the sale back returns exactly what it took
+    repo.delete_penjualan_row(cursor, penjualan_id)
+    assert sisa_lot(cursor) == {'2000-01-01': 10, '2099-03-31': 4, '2099-06-30': 5, '2099-12-31': 6}
+
+
+def test_sale_only_expired_lots_could_cover_is_refused(apotek, db, obat):
+    repo, cursor = db
+    obat_id, _ = obat
+    hari_ini = tanggal(datetime.now().toordinal())
+
+    # obat.stok is 25, but only 15 of it is still sellable
+    with pytest.raises(apotek.StokTidakCukupError) as error:
+        repo.save_penjualan_row(cursor, (obat_id, 1, "Pembeli", 16, 1500, 24000, hari_ini))
+    assert error.value.stok == 15
+
+    with pytest.raises(apotek.KeranjangStokError) as error:
+        repo.checkout_keranjang(cursor, 1, "Pembeli", hari_ini, [(obat_id, 10, 1500), (obat_id, 6, 1500)])
+    assert error.value.kurang == [("Obat FEFO", 16, 15)]
+
+    # Nothing was written by the refused sales
+    cursor.execute("SELECT COUNT(*) FROM penjualan")
+    assert cursor.fetchone() == (0,)
+    cursor.execute("SELECT stok FROM obat WHERE id = ?", (obat_id,))
+    assert cursor.fetchone() == (25,)
+    assert sisa_lot(cursor) == {'2000-01-01': 10, '2099-03-31': 4, '2099-06-30': 5, '2099-12-31': 6}
+
+    # Exactly the sellable stock still goes through
+    repo.checkout_keranjang(cursor, 1, "Pembeli", hari_ini, [(obat_id, 15, 1500)])
+    assert sisa_lot(cursor) == {'2000-01-01': 10, '2099-03-31': 0, '2099-06-30': 0, '2099-12-31': 0}
+
+
+def test_lot_expiring_before_a_backdated_sale_date_is_still_sellable_then(db, obat):
+    repo, cursor = db
+    obat_id, lots = obat
+
+    # On a date in 1999 the 2000-01-01 lot had not expired yet
+    penjualan_id = repo.save_penjualan_row(cursor, (obat_id, 1, "Pembeli", 3, 1500, 4500, '1999-12-01'))
+    cursor.execute("SELECT id_lot, jumlah FROM alokasi_lot WHERE id_penjualan = ?", (penjualan_id,))
+    assert dict(cursor.fetchall()) == {lots['2000-01-01']: 3}
@@ -0,0 +1,102 @@
+"""Beberapa kasir (proses terpisah) berjualan serentak dari satu file database"""
+import importlib.util
+import multiprocessing
+import os
+import random
+import sqlite3
+from datetime import datetime
+
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'kelompok 2.py')
+
+PROSES = 4
+TRANSAKSI = 200
+STOK_AWAL = 300
+JUMLAH_OBAT = 4
+
+
+def load_app():
+    """Import 'kelompok 2.py' (nama file berspasi) sebagai modul"""
+    spec = importlib.util.spec_from_file_location('apotek', APP_PATH)
+    apotek = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(apotek)
+    return apotek
+
+
+def kasir(db_path, seed, obat_ids):
+    """Satu terminal: checkout keranjang, penjualan tunggal dan sesekali pembatalan"""
+    apotek = load_app()
+    repo = apotek.ApotekRepository(db_path, multi_terminal=True, stats=apotek.QueryStats(0))
+    conn = repo.connect()
+    cursor = conn.cursor()
+    rng = random.Random(seed)
+    tanggal = datetime.now().strftime('%Y-%m-%d')
+    terjual, ditolak, dibatalkan = [], 0, 0
+
+    for i in range(TRANSAKSI):
+        try:
+            if i % 10 == 9:
+                obat_id = rng.choice(obat_ids)
+                jumlah = rng.randint(1, 3)
+                terjual.append(repo.save_penjualan_row(
+                    cursor, (obat_id, 1, f"Pembeli {seed}", jumlah, 0, 0, tanggal)))
+            else:
+                items = [(obat_id, rng.randint(1, 3), 0) for obat_id in rng.sample(obat_ids, rng.randint(1, 3))]
+                terjual += repo.checkout_keranjang(cursor, 1, f"Pembeli {seed}", tanggal, items)[0]
+        except (apotek.StokTidakCukupError, apotek.KeranjangStokError):
+            ditolak += 1
+
+        if i % 25 == 24 and terjual:
+            repo.delete_penjualan_row(cursor, terjual.pop(rng.randrange(len(terjual))))
+            dibatalkan += 1
+
+    conn.close()
+    return len(terjual), ditolak, dibatalkan
+
+
+def test_concurrent_checkouts_keep_stock_ledger_and_lots_in_sync(tmp_path):
+    apotek = load_app()
+    db_path = str(tmp_path / 'apotek.db')
+    repo = apotek.ApotekRepository(db_path, multi_terminal=True, stats=apotek.QueryStats(0))
+    conn = repo.connect()
+    cursor = conn.cursor()
+    repo.setup_database(cursor)
+
+    cursor.execute("""
+        INSERT INTO pegawai (nama_pegawai, jabatan, alamat, telepon, gaji, tanggal_masuk)
+        VALUES ('Kasir', 'Kasir', 'Jl. Contoh', '08123456789', 3000000, '2024-01-01')
+    """)
+    conn.commit()
+
+    # Every obat starts with an expired lot that no sale may touch, plus a fresh purchase
+    obat_ids = [repo.save_obat_row(cursor, (f"Obat {i}", "Umum", 1000, 1500, 50, '2000-01-01'))
+                for i in range(JUMLAH_OBAT)]
+    for obat_id in obat_ids:
+        repo.save_pembelian_row(cursor, (obat_id, "Supplier", STOK_AWAL, 1000, 1000 * STOK_AWAL,
+                                         datetime.now().strftime('%Y-%m-%d')), expired_date='2099-12-31')
+    conn.close()
+
+    ctx = multiprocessing.get_context('spawn')
+    with ctx.Pool(PROSES) as pool:
+        hasil = pool.starmap(kasir, [(db_path, seed, obat_ids) for seed in range(PROSES)])
+
+    # Demand is well above stock, so the guards were exercised
+    assert sum(ditolak for _, ditolak, _ in hasil) > 0
+
+    check = sqlite3.connect(db_path)
+    stok = dict(check.execute("SELECT id, stok FROM obat"))
+    mutasi = dict(check.execute("SELECT id_obat, SUM(perubahan) FROM mutasi_stok GROUP BY id_obat"))
+    lot = dict(check.execute("SELECT id_obat, SUM(sisa) FROM lot_obat GROUP BY id_obat"))
+    terjual = dict(check.execute("SELECT id_obat, SUM(jumlah) FROM penjualan GROUP BY id_obat"))
+    alokasi = dict(check.execute("""
+        SELECT p.id_obat, SUM(a.jumlah) FROM alokasi_lot a JOIN penjualan p ON p.id = a.id_penjualan
+        GROUP BY p.id_obat
+    """))
+    expired = check.execute("SELECT SUM(sisa) FROM lot_obat WHERE expired_date = '2000-01-01'").fetchone()[0]
+    check.close()
+
+    for obat_id in obat_ids:
+        assert stok[obat_id] >= 0
+        assert stok[obat_id] == mutasi[obat_id] == lot[obat_id]
+        assert stok[obat_id] == 50 + STOK_AWAL - terjual.get(obat_id, 0)
+        assert alokasi.get(obat_id, 0) == terjual.get(obat_id, 0)
+    assert expired == 50 * JUMLAH_OBAT
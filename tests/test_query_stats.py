@@ -0,0 +1,25 @@
+"""Statistik query: baris dan waktu fetch ikut tercatat, juga untuk execute langsung di koneksi"""
+
+
+def test_connection_execute_records_rows_fetched_by_the_caller(apotek, tmp_path):
+    stats = apotek.QueryStats(0)
+    repo = apotek.ApotekRepository(str(tmp_path / 'apotek.db'), stats=stats)
+    worker = apotek.DatabaseWorker(repo)
+
+    def job(cursor):
+        conn = cursor.connection
+        conn.execute("CREATE TABLE angka (n INTEGER)")
+        conn.executemany("INSERT INTO angka VALUES (?)", [(i,) for i in range(40)])
+        # The first select is closed by the next execute, the second by the worker after the job
+        rows = conn.execute("SELECT n FROM angka WHERE n < ?", (25,)).fetchall()
+        return rows + conn.execute("SELECT n FROM angka WHERE n >= ?", (30,)).fetchmany(4)
+
+    try:
+        assert len(worker.submit(job).result(timeout=10)) == 29
+    finally:
+        worker.stop()
+
+    baris = {shape: rows for shape, (_, _, _, rows) in stats.totals.items()}
+    assert baris["SELECT n FROM angka WHERE n < ?"] == 25
+    assert baris["SELECT n FROM angka WHERE n >= ?"] == 4
+    assert baris["INSERT INTO angka VALUES (?)"] == 40
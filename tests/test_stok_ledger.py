@@ -0,0 +1,78 @@
+"""Buku mutasi stok: stok per tanggal dari snapshot + mutasi, dan penghapusan obat"""
+from datetime import datetime
+
+import pytest
+
+
+def tanggal(hari):
+    return datetime.fromordinal(hari).strftime('%Y-%m-%d')
+
+
+def stok_seharusnya(cursor, obat_id, hari):
+    """Stok akhir hari dihitung langsung dari pembelian dan penjualan"""
+    cursor.execute("SELECT COALESCE(SUM(jumlah), 0) FROM pembelian WHERE id_obat = ? AND hari_pembelian <= ?",
+                   (obat_id, hari))
+    masuk = cursor.fetchone()[0]
+    cursor.execute("SELECT COALESCE(SUM(jumlah), 0) FROM penjualan WHERE id_obat = ? AND hari_penjualan <= ?",
+                   (obat_id, hari))
+    return masuk - cursor.fetchone()[0]
+
+
+def test_stok_per_tanggal_matches_transactions_with_and_without_snapshots(db):
+    repo, cursor = db
+    awal = datetime.now().toordinal() - 60
+    obat_ids = [repo.save_obat_row(cursor, (f"Obat {i}", "Umum", 1000, 1500, 0, '2099-12-31')) for i in range(2)]
+
+    for obat_id in obat_ids:
+        for hari, jumlah in ((awal, 100), (awal + 20, 50)):
+            repo.save_pembelian_row(cursor, (obat_id, "Supplier", jumlah, 1000, 1000 * jumlah, tanggal(hari)),
+                                    expired_date='2099-12-31')
+        for hari, jumlah in ((awal + 5, 10), (awal + 25, 30)):
+            repo.save_penjualan_row(cursor, (obat_id, 1, "Pembeli", jumlah, 1500, 1500 * jumlah, tanggal(hari)))
+
+    repo.buat_snapshot_stok(cursor, awal + 10)
+    repo.buat_snapshot_stok(cursor, awal + 30)
+
+    # Backdated rows land before both snapshots, which have to be corrected
+    repo.save_penjualan_row(cursor, (obat_ids[0], 1, "Pembeli", 5, 1500, 7500, tanggal(awal + 7)))
+    repo.save_pembelian_row(cursor, (obat_ids[1], "Supplier", 8, 1000, 8000, tanggal(awal + 2)),
+                            expired_date='2099-12-31')
+
+    cursor.execute("SELECT id_obat, hari, stok FROM snapshot_stok")
+    for obat_id, hari, stok in cursor.fetchall():
+        assert stok == stok_seharusnya(cursor, obat_id, hari)
+
+    def semua_hari():
+        return {hari: {row[0]: row[2] for row in repo.stok_per_tanggal(cursor, hari)}
+                for hari in range(awal - 1, awal + 61)}
+
+    dengan_snapshot = semua_hari()
+    for hari, stok in dengan_snapshot.items():
+        for obat_id in obat_ids:
+            assert stok[obat_id] == stok_seharusnya(cursor, obat_id, hari)
+
+    cursor.execute("DELETE FROM snapshot_stok")
+    cursor.connection.commit()
+    assert semua_hari() == dengan_snapshot
+
+    # Today's figure is the live stock
+    cursor.execute("SELECT id, stok FROM obat")
+    assert dict(cursor.fetchall()) == dengan_snapshot[datetime.now().toordinal()]
+
+
+def test_delete_obat_blocked_by_history_and_clears_ledger_otherwise(apotek, db):
+    repo, cursor = db
+    hari_ini = datetime.now().toordinal()
+    terjual = repo.save_obat_row(cursor, ("Terjual", "Umum", 1000, 1500, 20, '2099-12-31'))
+    repo.save_penjualan_row(cursor, (terjual, 1, "Pembeli", 2, 1500, 3000, tanggal(hari_ini)))
+    with pytest.raises(apotek.ObatPunyaRiwayatError):
+        repo.delete_obat_row(cursor, terjual)
+    cursor.execute("SELECT stok FROM obat WHERE id = ?", (terjual,))
+    assert cursor.fetchone() == (18,)
+
+    baru = repo.save_obat_row(cursor, ("Baru", "Umum", 1000, 1500, 20, '2099-12-31'))
+    repo.buat_snapshot_stok(cursor, hari_ini)
+    repo.delete_obat_row(cursor, baru)
+    for tabel in ('lot_obat', 'mutasi_stok', 'snapshot_stok'):
+        cursor.execute(f"SELECT COUNT(*) FROM {tabel} WHERE id_obat = ?", (baru,))
+        assert cursor.fetchone() == (0,)